@@ -134,11 +134,119 @@ def config_validator():
                                "tile of the problem on a CPU/GPU "
                                "in bytes." },
 
+        'host_mem_budget': {
+            'type': 'integer',
+            'nullable': True,
+            'min': 1024,
+            'default': None,
+            '__description__': "Host memory budget in bytes for tiles "
+                               "in flight through the solver pipeline, "
+                               "or None to disable the budget. "
+                               "Further tiles are not admitted into "
+                               "the pipeline while the inputs retained "
+                               "for data sinks, feed dictionaries and "
+                               "staging areas of tiles in flight would "
+                               "exceed this budget." },
+
+        'channel_tiling': {
+            'type': 'boolean',
+            'default': False,
+            '__description__': "Tile the problem along the channel "
+                               "dimension, in addition to time and "
+                               "baseline. Channel tiles never straddle "
+                               "band boundaries. Allows wide-band "
+                               "problems to be reduced along frequency "
+                               "rather than time." },
+
+        'tile_planner': {
+            'type': 'boolean',
+            'default': False,
+            '__description__': "Select the tile shape and source batch "
+                               "size predicted to achieve the highest "
+                               "visibility throughput within the memory "
+                               "budgets. Predictions are made from cost "
+                               "models fitted to short benchmarks of the "
+                               "rime operators at solver start-up." },
+
+        'tile_profile': {
+            'type': 'string',
+            'default': '',
+            '__description__': "JSON file in which benchmarked rime "
+                               "operator cost models are cached, "
+                               "keyed on device type, precision and "
+                               "software versions. If empty, the "
+                               "operators are benchmarked each time "
+                               "the solver is created." },
+
         'source_batch_size': {
             'type': 'integer',
             'min': 0,
             'default': 500 },
 
+        'source_batch_balancing': {
+            'type': 'boolean',
+            'default': False,
+            '__description__': "Choose the batch size of each source "
+                               "type so that each batch takes a similar "
+                               "time to compute, given benchmarked costs "
+                               "of the rime operators. The cheapest "
+                               "source type present retains the batch "
+                               "size selected by budgeting, while more "
+                               "expensive types, such as sersics, "
+                               "receive smaller batches. "
+                               "Always applied by the tile planner." },
+
+        'shard_scheduler': {
+            'type': 'string',
+            'allowed': ['round_robin', 'least_queued', 'cost_weighted'],
+            'default': 'round_robin',
+            '__description__': "Policy for assigning tiles to shards. "
+                               "'round_robin' cycles through shards, "
+                               "'least_queued' selects the shard with the "
+                               "fewest waiting tiles and 'cost_weighted' "
+                               "selects the shard predicted to complete "
+                               "the tile first, given measured compute "
+                               "times and tile sizes. The latter "
+                               "policies must be opted into." },
+
+        'feed_workers': {
+            'type': 'integer',
+            'min': 1,
+            'default': 1,
+            '__description__': "Number of threads per shard that "
+                               "concurrently evaluate the data sources "
+                               "of a tile. Data sources of providers "
+                               "that are not thread safe are still "
+                               "evaluated one at a time." },
+
+        'consumer_workers': {
+            'type': 'integer',
+            'min': 1,
+            'default': 1,
+            '__description__': "Number of threads that concurrently "
+                               "supply tile outputs to the data sinks. "
+                               "Sinks that do not request ordered "
+                               "delivery may be called concurrently "
+                               "when this is greater than one." },
+
+        'per_shard_output': {
+            'type': 'boolean',
+            'default': False,
+            '__description__': "Create an output staging area for "
+                               "each shard, rather than a single "
+                               "output staging area shared by all "
+                               "shards." },
+
+        'ms_prefetch_depth': {
+            'type': 'integer',
+            'min': 0,
+            'default': 2,
+            '__description__': "Number of tiles whose rows are read "
+                               "from a Measurement Set on a background "
+                               "thread, ahead of the tiles being fed. "
+                               "If 0, rows are read when the tile "
+                               "is fed." },
+
         'version': {
             'type': 'string',
             'default': 'tf' },
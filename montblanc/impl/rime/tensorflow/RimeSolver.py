@@ -23,6 +23,7 @@ import copy
 import itertools
 import threading
 import sys
+import time
 import types
 import six
 
@@ -40,6 +41,13 @@ from montblanc.solvers import MontblancTensorflowSolver
 
 from . import load_tf_lib
 from .cube_dim_transcoder import CubeDimensionTranscoder
+from .shard_scheduler import create_shard_scheduler
+from .admission_control import AdmissionController
+from .memory_model import MemoryModel
+from .tile_input_cache import TileInputCache
+from .tile_planner import (TilePlanner, benchmark_ops,
+    balanced_batch_sizes, load_profile, save_profile)
+from .reorder_buffer import ReorderBuffer
 from .staging_area_wrapper import create_staging_area_wrapper
 from .sources import (SourceContext, DefaultsSourceProvider)
 from .sinks import (SinkContext, NullSinkProvider)
@@ -53,12 +61,38 @@ QUEUE_SIZE = 10
 
 rime = load_tf_lib()
 
-DataSource = attr.make_class("DataSource", ['source', 'dtype', 'name'],
+DataSource = attr.make_class("DataSource", {
+        'source': attr.ib(),
+        'dtype': attr.ib(),
+        'name': attr.ib(),
+        'depends': attr.ib(default=()),
+        'version': attr.ib(default=None),
+        'lock': attr.ib(default=None) },
     slots=True, frozen=True)
-DataSink = attr.make_class("DataSink", ['sink', 'name'],
+DataSink = attr.make_class("DataSink", {
+        'sink': attr.ib(),
+        'name': attr.ib(),
+        'ordered': attr.ib(),
+        'inputs': attr.ib(default=None) },
     slots=True, frozen=True)
 FeedOnce = attr.make_class("FeedOnce", ['ph', 'var', 'assign_op'],
     slots=True, frozen=True)
+# Outputs returned to the host from each tile, in staging area order
+OUTPUTS = ('model_vis', 'chi_squared', 'residual_vis')
+# Outputs that are only returned if a sink consumes them
+OPTIONAL_OUTPUTS = ('model_vis', 'residual_vis')
+
+# Specialisations of the compute graph
+GraphSpec = attr.make_class("GraphSpec", {
+        'defaults': attr.ib(default=frozenset()),
+        'elided': attr.ib(default=frozenset()),
+        'src_types': attr.ib(default=tuple(source_var_types().values())),
+        'outputs': attr.ib(default=OUTPUTS) },
+    slots=True, frozen=True)
+# Feed staging areas, expressions and memory model of a graph specialisation
+GraphVariant = attr.make_class("GraphVariant",
+    ['spec', 'feed_many', 'sources', 'expr', 'memory_model'],
+    slots=True, frozen=True)
 
 class RimeSolver(MontblancTensorflowSolver):
     """ RIME Solver Implementation """
@@ -95,53 +129,35 @@ class RimeSolver(MontblancTensorflowSolver):
         # providers supplied by the user in the solve()
         # method
         default_prov = _create_defaults_source_provider(cube, data_source)
+        self._defaults_provider = default_prov
         self._source_providers = [default_prov]
         self._sink_providers = [NullSinkProvider()]
 
-        #==================
-        # Data Source Cache
-        #==================
-
-        class SourceCache(object):
-            def __init__(self):
-                self._cache = {}
-                self._lock = threading.Lock()
-
-            def __getitem__(self, key):
-                key = hash(bytes(key))
-                with self._lock:
-                    return self._cache[key]
-
-            def __setitem__(self, key, value):
-                key = hash(bytes(key))
-                with self._lock:
-                    self._cache[key]=value
-
-            def __delitem__(self, key):
-                key = hash(bytes(key))
-                with self._lock:
-                    del self._cache[key]
-
-            def pop(self, key, default=None):
-                key = hash(bytes(key))
-                with self._lock:
-                    return self._cache.pop(key, default)
+        #================
+        # Tile Input Cache
+        #================
 
+        # Inputs of tiles in flight, read by data sinks
+        self._input_cache = TileInputCache()
 
-        self._source_cache = SourceCache()
+        # Versions of the data assigned to feed once variables
+        self._feed_once_versions = {}
 
         #==================
         # Memory Budgeting
         #==================
 
-        # For deciding whether to rebudget
-        self._previous_budget = 0
+        # Dimension reductions applied by the previous budget
         self._previous_budget_dims = {}
 
         #================
         # Cube Transcoder
         #================
         self._iter_dims = ['ntime', 'nbl']
+
+        # Optionally tile along channels
+        if slvr_cfg.get('channel_tiling', False):
+            self._iter_dims.append('nchan')
         self._transcoder = CubeDimensionTranscoder(self._iter_dims)
 
         #================================
@@ -191,23 +207,38 @@ class RimeSolver(MontblancTensorflowSolver):
         #=========================
 
         # Create all tensorflow constructs within the compute graph
+        # Each shard may place outputs in its own staging area
+        output_staging_areas = (shards if
+            slvr_cfg.get('per_shard_output', False) else 1)
+
         with tf.Graph().as_default() as compute_graph:
             # Create our data feeding structure containing
             # input/output staging_areas and feed once variables
             self._tf_feed_data = _construct_tensorflow_feed_data(
-                dfs, cube, self._iter_dims, shards)
-
-            # Construct tensorflow expressions for each shard
-            self._tf_expr = [_construct_tensorflow_expression(
-                    slvr_cfg,
-                    self._tf_feed_data, dev, self._shard(d,s))
-                for d, dev in enumerate(self._devices)
-                for s in range(self._shards_per_device)]
+                dfs, cube, self._iter_dims, output_staging_areas)
 
             # Initialisation operation
             init_op = tf.global_variables_initializer()
-            # Now forbid modification of the graph
-            compute_graph.finalize()
+
+        # The graph is not finalised, as graph variants
+        # specialised to the inputs of a solution are
+        # added when first required at the start of a solve
+        self._compute_graph = compute_graph
+        self._dfs = dfs
+        self._graph_variants = {}
+
+        #==================
+        # Memory Model
+        #==================
+
+        # Models the memory footprint of the pipeline on devices
+        # and the host, given the extents of a tile
+        self._temporaries = [a.name for a in cube.arrays().values()
+            if 'temporary' in a.tags]
+
+        # Construct the unspecialised graph variant
+        self._variant = self._graph_variant(GraphSpec())
+        self._memory_model = self._variant.memory_model
 
         #==========================================
         # Tensorflow Session
@@ -226,39 +257,82 @@ class RimeSolver(MontblancTensorflowSolver):
             graph=compute_graph, config=session_config)
         self._tf_session.run(init_op)
 
+        #======================
+        # Tile planning
+        #======================
+
+        # Optionally plan tile shapes for throughput and balance
+        # source batches, from cost models of the rime operators
+        self._tile_planner = None
+        self._cost_models = None
+
+        if (slvr_cfg.get('tile_planner', False) or
+                slvr_cfg.get('source_batch_balancing', False)):
+            self._cost_models = _create_cost_models(slvr_cfg,
+                device_type, self._devices[0], tf_server_target)
+
+        if slvr_cfg.get('tile_planner', False):
+            self._tile_planner = TilePlanner(self._cost_models,
+                self._memory_model)
+
+        # Global dimension sizes and graph specialisation
+        # for which tiles were last planned
+        self._planned_sizes = None
+
         #======================
         # Thread pool executors
         #======================
 
         tpe = cf.ThreadPoolExecutor
 
-        self._descriptor_executor = tpe(1)
         self._feed_executors = [tpe(1) for i in range(shards)]
+        # Evaluates the data sources of a tile concurrently
+        feed_workers = slvr_cfg.get('feed_workers', 1)
+        self._feed_worker_executors = [tpe(feed_workers) for i in range(shards)]
+        self._feed_lookahead = feed_workers
         self._compute_executors = [tpe(1) for i in range(shards)]
-        self._consumer_executor = tpe(1)
+        # Supplies outputs to the data sinks concurrently
+        self._consumer_executor = tpe(slvr_cfg.get('consumer_workers', 1))
 
-        class InputsWaiting(object):
-            """
-            Keep track of the number of inputs waiting
-            to be consumed on each shard
-            """
-            def __init__(self, shards):
-                self._lock = threading.Lock()
-                self._inputs_waiting = np.zeros(shape=(shards,), dtype=np.int32)
+        #======================
+        # Shard scheduling
+        #======================
 
-            def get(self):
-                with self._lock:
-                    return self._inputs_waiting
+        # Interleave devices so that consecutive
+        # shards are placed on different devices
+        shard_order = [self._shard(d,s)
+            for s in range(self._shards_per_device)
+            for d, dev in enumerate(self._devices)]
 
-            def increment(self, shard):
-                with self._lock:
-                    self._inputs_waiting[shard] += 1
+        scheduler = slvr_cfg.get('shard_scheduler', 'round_robin')
+        montblanc.log.info("Using '{}' shard scheduler".format(scheduler))
+        self._shard_scheduler = create_shard_scheduler(scheduler, shard_order)
 
-            def decrement(self, shard):
-                with self._lock:
-                    self._inputs_waiting[shard] -= 1
+        #====================================
+        # Admission of tiles into the pipeline
+        #====================================
+
+        # Limits the host memory held by tiles in flight
+        self._admission = AdmissionController(
+            slvr_cfg.get('host_mem_budget'))
+
+        # Delivers tiles to ordered data sinks in dispatch order
+        self._reorder = ReorderBuffer()
+
+        #=======================================
+        # Recovery from memory allocation failure
+        #=======================================
 
-        self._inputs_waiting = InputsWaiting(shards)
+        # Tiles split after exhausting memory, awaiting feeding
+        self._split_tiles = collections.deque()
+        self._split_cond = threading.Condition()
+        # Maximum tile extents, lowered on memory allocation failure
+        self._tile_limits = {}
+
+        # Number of puts on each staging area of a shard,
+        # used to discard the inputs of failed tiles
+        self._put_locks = [threading.Lock() for s in range(shards)]
+        self._puts = [collections.defaultdict(int) for s in range(shards)]
 
         #======================
         # Tracing
@@ -326,19 +400,80 @@ class RimeSolver(MontblancTensorflowSolver):
         self._tfrun = _tfrunner(self._tf_session, self._should_trace)
         self._iterations = 0
 
-    def _descriptor_feed(self):
+    def _graph_variant(self, spec):
+        """
+        Returns the :class:`GraphVariant` specialised to ``spec``,
+        a :class:`GraphSpec`, constructing it on first use.
+        """
         try:
-            self._descriptor_feed_impl()
-        except Exception as e:
-            montblanc.log.exception("Descriptor Exception")
-            raise
+            return self._graph_variants[spec]
+        except KeyError:
+            pass
+
+        FD = self._tf_feed_data
+        LSA = FD.local
+        shards = self._nr_of_shards
 
-    def _descriptor_feed_impl(self):
-        session = self._tf_session
+        # Arrays fed from the host on each tile
+        feed_many = [a for a in LSA.feed_many_arrays
+            if a not in spec.defaults]
 
+        # Staging areas of the unspecialised variant keep their names
+        suffix = ('' if len(self._graph_variants) == 0
+            else '_v%d' % len(self._graph_variants))
+
+        src_type_names = { v: k for k, v in source_var_types().items() }
+
+        with self._compute_graph.as_default():
+            feed_many_sa = [create_staging_area_wrapper(
+                    'feed_many%s_%d' % (suffix, i),
+                    ['descriptor'] + feed_many, self._dfs)
+                for i in range(shards)]
+
+            # Source staging areas, only for the source types present
+            sources_sa = { src_nr_var: [create_staging_area_wrapper(
+                        '%s%s_%d' % (src_type_names[src_nr_var], suffix, i),
+                        LSA.source_arrays[src_nr_var], self._dfs)
+                    for i in range(shards)]
+                for src_nr_var in spec.src_types }
+
+            # Construct tensorflow expressions for each shard
+            expr = [_construct_tensorflow_expression(self.config(),
+                    FD, spec, feed_many_sa, sources_sa,
+                    dev, self._shard(d,s))
+                for d, dev in enumerate(self._devices)
+                for s in range(self._shards_per_device)]
+
+        memory_model = MemoryModel(
+            feed_once=list(LSA.feed_once.keys()),
+            feed_many=feed_many_sa[0].fed_arrays,
+            sources={ t: sa[0].fed_arrays for t, sa in sources_sa.items() },
+            outputs=list(spec.outputs),
+            temporaries=self._temporaries,
+            nr_of_shards=shards,
+            shards_per_device=self._shards_per_device,
+            staging_depth=QUEUE_SIZE,
+            device_defaults=sorted(spec.defaults))
+
+        if len(self._graph_variants) > 0:
+            montblanc.log.info("Constructed graph variant for source "
+                "types {s}, generating {d} on the device and eliding "
+                "identity terms {e}".format(s=list(spec.src_types),
+                    d=sorted(spec.defaults), e=sorted(spec.elided)))
+
+        variant = GraphVariant(spec, feed_many_sa, sources_sa,
+            expr, memory_model)
+        self._graph_variants[spec] = variant
+
+        return variant
+
+    def _descriptors(self):
+        """
+        Generate read-only descriptors encoding
+        each tile of the hypercube's iteration space
+        """
         # Copy dimensions of the main cube
         cube = self.hypercube.copy()
-        LSA = self._tf_feed_data.local
 
         # Get space of iteration
         iter_args = _iter_args(self._iter_dims, cube)
@@ -347,69 +482,158 @@ class RimeSolver(MontblancTensorflowSolver):
         # Iterate through the hypercube space
         for i, iter_cube in enumerate(cube.cube_iter(*iter_args)):
             descriptor = self._transcoder.encode(iter_cube.dimensions(copy=False))
-            feed_dict = {LSA.descriptor.placeholders[0] : descriptor }
             montblanc.log.debug('Encoding {i} {d}'.format(i=i, d=descriptor))
-            session.run(LSA.descriptor.put_op, feed_dict=feed_dict)
-            descriptors_fed += 1
+
+            # Make it read-only so we can hash the contents
+            descriptor.flags.writeable = False
+
+            # Split tiles exceeding limits imposed
+            # by previous memory allocation failures
+            with self._split_cond:
+                limits = { d: l for d, l in self._tile_limits.items()
+                    if iter_cube.dim_extent_size(d) > l }
+
+            if len(limits) == 0:
+                yield descriptor
+                descriptors_fed += 1
+                continue
+
+            for sub_descriptor in self._sub_descriptors(descriptor, limits):
+                yield sub_descriptor
+                descriptors_fed += 1
 
         montblanc.log.info("Done feeding {n} descriptors.".format(
             n=descriptors_fed))
 
-        feed_dict = {LSA.descriptor.placeholders[0] : [-1] }
-        session.run(LSA.descriptor.put_op, feed_dict=feed_dict)
+    def _sub_descriptors(self, descriptor, strides):
+        """
+        Generate read-only descriptors for the sub-tiles of
+        the tile encoded by ``descriptor``, given a dictionary
+        of strides for the dimensions to split.
+        """
+        cube = self.hypercube.copy()
+        cube.update_dimensions(self._transcoder.decode(descriptor))
+
+        # Iterate over the extents of the tile, rather
+        # than the global extents of the dimensions
+        tile_cube = cube.copy()
+        lower = {}
+
+        for d, stride in strides.items():
+            lower[d], upper = cube.dim_extents(d)
+            tile_cube.update_dimension(d, global_size=upper - lower[d],
+                lower_extent=0, upper_extent=stride)
+
+        for dim_desc in tile_cube.dim_iter(*strides.items()):
+            cube.update_dimensions([{ 'name': d['name'],
+                'lower_extent': lower[d['name']] + d['lower_extent'],
+                'upper_extent': lower[d['name']] + d['upper_extent'] }
+                    for d in dim_desc])
+
+            sub_descriptor = self._transcoder.encode(
+                cube.dimensions(copy=False))
+            sub_descriptor.flags.writeable = False
+
+            yield sub_descriptor
+
+    def _tile_descriptors(self):
+        """
+        Generate (descriptor, split) tuples for each tile to feed.
+        Tiles split after exhausting memory are fed ahead of the
+        remaining tiles. Once all tiles are fed, waits until
+        tiles in flight either complete or are split.
+        """
+        def _pop_split_tiles():
+            with self._split_cond:
+                split = list(self._split_tiles)
+                self._split_tiles.clear()
+
+            return split
+
+        for descriptor in self._descriptors():
+            for split_descriptor in _pop_split_tiles():
+                yield split_descriptor, True
+
+            yield descriptor, False
+
+        while True:
+            with self._split_cond:
+                while (len(self._split_tiles) == 0 and
+                        len(self._admission) > 0 and
+                        not self._admission.aborted):
+                    self._split_cond.wait(0.1)
+
+            split = _pop_split_tiles()
+
+            if len(split) == 0:
+                return
+
+            for split_descriptor in split:
+                yield split_descriptor, True
 
-    def _feed(self, cube, data_sources, data_sinks, global_iter_args):
+    def _feed(self, cube, data_sources, data_sinks, output_names,
+            global_iter_args, tile_queue=None):
         """ Feed stub """
         try:
-            self._feed_impl(cube, data_sources, data_sinks, global_iter_args)
+            self._feed_impl(cube, data_sources, data_sinks, output_names,
+                global_iter_args, tile_queue)
         except Exception as e:
             montblanc.log.exception("Feed Exception")
             raise
 
-    def _feed_impl(self, cube, data_sources, data_sinks, global_iter_args):
+    def _feed_impl(self, cube, data_sources, data_sinks, output_names,
+            global_iter_args, tile_queue=None):
         """ Implementation of staging_area feeding """
-        session = self._tf_session
         FD = self._tf_feed_data
-        LSA = FD.local
 
         # Get source strides out before the local sizes are modified during
         # the source loops below
-        src_types = list(LSA.sources.keys())
+        src_types = list(self._variant.spec.src_types)
         src_strides = [int(i) for i in cube.dim_extent_size(*src_types)]
-        src_staging_areas = [[LSA.sources[t][s] for t in src_types]
+        src_staging_areas = [[self._variant.sources[t][s] for t in src_types]
             for s in range(self._nr_of_shards)]
 
         compute_feed_dict = { ph: cube.dim_global_size(n) for
             n, ph in list(FD.src_ph_vars.items()) }
+        compute_feed_dict.update({ ph: cube.dim_global_size(n) for
+            n, ph in list(FD.dim_ph_vars.items()) })
         compute_feed_dict.update({ ph: getattr(cube, n) for
             n, ph in list(FD.property_ph_vars.items()) })
 
-        chunks_fed = 0
 
-        which_shard = itertools.cycle([self._shard(d,s)
-            for s in range(self._shards_per_device)
-            for d, dev in enumerate(self._devices)])
+        # Ordered data sinks receive tiles in dispatch order
+        ordered = any(ds.ordered for ds in data_sinks.values())
 
-        while True:
-            try:
-                # Get the descriptor describing a portion of the RIME
-                result = session.run(LSA.descriptor.get_op)
-                descriptor = result['descriptor']
-            except tf.errors.OutOfRangeError as e:
-                montblanc.log.exception("Descriptor reading exception")
-
-            # Quit if EOF
-            if descriptor[0] == -1:
+        # Inputs retained for data sinks
+        retain = self._input_cache.retain
+
+        chunks_fed = 0
+
+        # Iterate over descriptors describing each portion of the RIME
+        for descriptor, split in self._tile_descriptors():
+            # Size of the tile, in terms of the iteration dimensions
+            tile_size = int(np.prod([d['upper_extent'] - d['lower_extent']
+                for d in self._transcoder.decode(descriptor)]))
+
+            # Block until the tile fits within the host memory
+            # budget, which bounds the inputs retained for sinks.
+            # Later tiles awaiting delivery may hold the budget
+            # while waiting upon the sub-tiles of a split tile,
+            # so these are admitted without waiting
+            nbytes = self._memory_model.tile_host_bytes(cube,
+                self._transcoder.decode(descriptor), output_names, retain)
+
+            if not self._admission.acquire(descriptor.tobytes(), nbytes,
+                                                force=split and ordered):
+                montblanc.log.warn("Tile admission aborted")
                 break
 
-            # Make it read-only so we can hash the contents
-            descriptor.flags.writeable = False
+            # Split tiles replaced their parent in the delivery order
+            if ordered and not split:
+                self._reorder.register(descriptor.tobytes())
 
-            # Find indices of the emptiest staging_areas and, by implication
-            # the shard with the least work assigned to it
-            emptiest_staging_areas = np.argsort(self._inputs_waiting.get())
-            shard = emptiest_staging_areas[0]
-            shard = next(which_shard)
+            # Ask the scheduler for the shard on which to place the tile
+            shard = self._shard_scheduler.dispatch(tile_size)
 
             feed_f = self._feed_executors[shard].submit(self._feed_actual,
                 data_sources.copy(), cube.copy(),
@@ -418,12 +642,12 @@ class RimeSolver(MontblancTensorflowSolver):
                 global_iter_args)
 
             compute_f = self._compute_executors[shard].submit(self._compute,
-                compute_feed_dict, shard)
+                compute_feed_dict, shard, output_names, tile_size,
+                descriptor, feed_f, ordered)
 
             consume_f = self._consumer_executor.submit(self._consume,
-                data_sinks.copy(), cube.copy(), global_iter_args)
-
-            self._inputs_waiting.increment(shard)
+                data_sinks.copy(), cube.copy(), shard, output_names,
+                global_iter_args, compute_f, tile_queue)
 
             yield (feed_f, compute_f, consume_f)
 
@@ -431,157 +655,500 @@ class RimeSolver(MontblancTensorflowSolver):
 
         montblanc.log.info("Done feeding {n} chunks.".format(n=chunks_fed))
 
-    def _feed_actual(self, *args):
+    def _feed_actual(self, data_sources, cube, descriptor, shard, *args):
+        """
+        Feed stub. Returns a (puts, exception) tuple, where puts
+        holds the number of puts made on each staging area of the
+        shard, up to and including this tile, and exception is
+        any :class:`MemoryError` raised while feeding the tile.
+        """
+        exception = None
+
         try:
-            return self._feed_actual_impl(*args)
+            self._feed_actual_impl(data_sources, cube,
+                descriptor, shard, *args)
+        except MemoryError as e:
+            # The tile is split by its compute
+            montblanc.log.exception("Feed Exception")
+            exception = e
         except Exception as e:
             montblanc.log.exception("Feed Exception")
+            self._abort()
             raise
 
+        # Tiles are fed to a shard serially
+        with self._put_locks[shard]:
+            return self._puts[shard].copy(), exception
+
     def _feed_actual_impl(self, data_sources, cube,
             descriptor, shard,
             src_types, src_strides, src_staging_areas,
             global_iter_args):
 
-        session = self._tf_session
-        iq = self._tf_feed_data.local.feed_many[shard]
+        iq = self._variant.feed_many[shard]
+        pool = self._feed_worker_executors[shard]
 
         # Decode the descriptor and update our cube dimensions
         dims = self._transcoder.decode(descriptor)
         cube.update_dimensions(dims)
 
-        # Determine array shapes and data types for this
-        # portion of the hypercube
-        array_schemas = cube.arrays(reify=True)
-
-        # Inject a data source and array schema for the
-        # descriptor staging_area items.
+        # Inject a data source for the descriptor staging_area items.
         # These aren't full on arrays per se
         # but they need to work within the feeding framework
-        array_schemas['descriptor'] = descriptor
         data_sources['descriptor'] = DataSource(
             lambda c: descriptor, np.int32, 'Internal')
 
-        # Generate (name, placeholder, datasource, array schema)
-        # for the arrays required by each staging_area
-        gen = ((a, ph, data_sources[a], array_schemas[a])
-            for ph, a in zip(iq.placeholders, iq.fed_arrays))
-
-        # Get input data by calling the data source functors
-        input_data = [(a, ph, _get_data(ds, SourceContext(a, cube,
-                self.config(), global_iter_args,
-                cube.array(a) if a in cube.arrays() else {},
-                ad.shape, ad.dtype)))
-            for (a, ph, ds, ad) in gen]
-
-        # Create a feed dictionary from the input data
-        feed_dict = { ph: data for (a, ph, data) in input_data }
-
-        # Cache the inputs for this chunk of data,
-        # so that sinks can access them
-        input_cache = { a: data for (a, ph, data) in input_data }
-        self._source_cache[descriptor.data] = input_cache
-
-        montblanc.log.info("Enqueueing chunk {d} on shard {sh}".format(
-            d=descriptor, sh=shard))
+        def _requests(staging_area, cube, iter_args):
+            """
+            Generate (name, placeholder, datasource, context)
+            for the arrays required by the staging_area
+            """
 
-        self._tfrun(iq.put_op, feed_dict=feed_dict)
+            # Determine array shapes and data types for this
+            # portion of the hypercube
+            array_schemas = cube.arrays(reify=True)
+            array_schemas['descriptor'] = descriptor
+
+            return [(a, ph, data_sources[a], SourceContext(a, cube,
+                    self.config(), iter_args,
+                    cube.array(a) if a in cube.arrays() else {},
+                    array_schemas[a].shape, array_schemas[a].dtype))
+                for ph, a in zip(staging_area.placeholders,
+                                staging_area.fed_arrays)]
+
+        def _puts():
+            """ Generate (staging_area, requests) for each put on this tile """
+            montblanc.log.info("Enqueueing chunk {d} on shard {sh}".format(
+                d=descriptor, sh=shard))
+
+            yield iq, _requests(iq, cube, global_iter_args)
+
+            # For each source type, feed that source staging_area
+            for src_type, staging_area, stride in zip(src_types,
+                                    src_staging_areas, src_strides):
+                iter_args = [(src_type, stride)]
+
+                # Iterate over chunks of the source
+                for chunk_i, dim_desc in enumerate(cube.dim_iter(*iter_args)):
+                    # Give each chunk its own cube, as data sources
+                    # for different chunks may be evaluated concurrently
+                    chunk_cube = cube.copy()
+                    chunk_cube.update_dimensions(dim_desc)
+                    s = dim_desc[0]['upper_extent'] - dim_desc[0]['lower_extent']
+
+                    montblanc.log.info("'{ci}: Enqueueing {d} '{s}' '{t}' sources "
+                        "on shard {sh}".format(d=descriptor,
+                            ci=chunk_i, s=s, t=src_type, sh=shard))
+
+                    yield staging_area, _requests(staging_area, chunk_cube,
+                        global_iter_args + iter_args)
+
+        def _put(i, staging_area, pending):
+            """ Wait for pending data and put it in the staging area """
+            input_data = _evaluate_data_sources(pool, pending)
+
+            # Cache the feed many inputs for this chunk of data,
+            # so that sinks can access them
+            if i == 0:
+                self._input_cache.put(descriptor.tobytes(), input_data)
+
+            feed_dict = { ph: input_data[a] for ph, a
+                in zip(staging_area.placeholders, staging_area.fed_arrays) }
+
+            with self._put_locks[shard]:
+                self._tfrun(staging_area.put_op, feed_dict=feed_dict)
+                self._puts[shard][staging_area.name] += 1
 
-        # For each source type, feed that source staging_area
-        for src_type, staging_area, stride in zip(src_types, src_staging_areas, src_strides):
-            iter_args = [(src_type, stride)]
+        # Submit data sources for evaluation ahead of the
+        # staging_area puts, which must occur in order.
+        # This overlaps data source evaluation with the puts
+        lookahead = collections.deque()
 
-            # Iterate over chunks of the source
-            for chunk_i, dim_desc in enumerate(cube.dim_iter(*iter_args)):
-                cube.update_dimensions(dim_desc)
-                s = dim_desc[0]['upper_extent'] - dim_desc[0]['lower_extent']
+        for i, (staging_area, requests) in enumerate(_puts()):
+            lookahead.append((i, staging_area,
+                _submit_data_sources(pool, requests)))
 
+            if len(lookahead) > self._feed_lookahead:
+                _put(*lookahead.popleft())
 
-                montblanc.log.info("'{ci}: Enqueueing {d} '{s}' '{t}' sources "
-                    "on shard {sh}".format(d=descriptor,
-                        ci=chunk_i, s=s, t=src_type, sh=shard))
+        while len(lookahead) > 0:
+            _put(*lookahead.popleft())
 
-                # Determine array shapes and data types for this
-                # portion of the hypercube
-                array_schemas = cube.arrays(reify=True)
+    def _compute(self, feed_dict, shard, output_names, tile_size,
+            descriptor, feed_future, ordered):
+        """
+        Call the tensorflow compute. Returns True if the tile
+        was computed and False if it was split after exhausting
+        device or host memory.
+        """
+        completed = False
 
-                # Generate (name, placeholder, datasource, array descriptor)
-                # for the arrays required by each staging_area
-                gen = [(a, ph, data_sources[a], array_schemas[a])
-                    for ph, a in zip(staging_area.placeholders, staging_area.fed_arrays)]
+        try:
+            # Wait for the tile to be fed, so that the inputs of
+            # the tile are known should it need to be discarded,
+            # and so that the compute time recorded for the shard
+            # scheduler excludes the wait on the feed
+            tile_puts, feed_exception = feed_future.result()
 
-                # Create a feed dictionary by calling the data source functors
-                feed_dict = { ph: _get_data(ds, SourceContext(a, cube,
-                        self.config(), global_iter_args + iter_args,
-                        cube.array(a) if a in cube.arrays() else {},
-                        ad.shape, ad.dtype))
-                    for (a, ph, ds, ad) in gen }
+            try:
+                if feed_exception is not None:
+                    raise feed_exception
 
-                self._tfrun(staging_area.put_op, feed_dict=feed_dict)
+                start = time.time()
+                self._tfrun(self._variant.expr[shard][output_names],
+                    feed_dict=feed_dict)
+                completed = True
+                self._shard_scheduler.completed(shard, tile_size,
+                    time.time() - start)
+            except (tf.errors.ResourceExhaustedError, MemoryError) as e:
+                if not self._split_tile(descriptor, shard, tile_puts,
+                                                            e, ordered):
+                    raise
 
-    def _compute(self, feed_dict, shard):
-        """ Call the tensorflow compute """
+                return False
 
-        try:
-            descriptor, enq = self._tfrun(self._tf_expr[shard], feed_dict=feed_dict)
-            self._inputs_waiting.decrement(shard)
+            return True
 
         except Exception as e:
             montblanc.log.exception("Compute Exception")
+            self._abort()
             raise
+        finally:
+            # Split or failed tiles no longer wait on the shard
+            if not completed:
+                self._shard_scheduler.cancelled(shard, tile_size)
 
+    def _abort(self):
+        """ Stop admitting tiles into the pipeline """
+        self._admission.abort()
 
-    def _consume(self, data_sinks, cube, global_iter_args):
+    def _split_tile(self, descriptor, shard, tile_puts, exception, ordered):
+        """
+        Discard the inputs of a tile which exhausted memory
+        and queue sub-tiles for feeding in its place.
+        Tiles exceeding the sub-tile extents are also split
+        for the rest of the run.
+
+        Returns
+        -------
+        bool
+            False if the tile could not be split further
+        """
+        dims = { d['name']: d['upper_extent'] - d['lower_extent']
+            for d in self._transcoder.decode(descriptor) }
+
+        # Split the tile along the first divisible dimension
+        split = _split_extent(dims,
+            *self.hypercube.dim_global_size('nchan', 'nbands'))
+
+        if split is None:
+            montblanc.log.error("Tile {d} exhausted memory "
+                "and cannot be split further".format(d=descriptor))
+            return False
+
+        dim, stride = split
+
+        # Remove the tile's remaining inputs from the
+        # shard's staging areas. Computes on this shard
+        # are serialised, so they lead the staging areas
+        staging_areas = [self._variant.feed_many[shard]] + [sa[shard]
+            for sa in self._variant.sources.values()]
+
+        # Entries put after this tile's feed
+        # completed belong to subsequent tiles
+        with self._put_locks[shard]:
+            sizes = self._tfrun([sa.size_op for sa in staging_areas])
+            later = [self._puts[shard][sa.name] - tile_puts[sa.name]
+                for sa in staging_areas]
+
+        for sa, size, n in zip(staging_areas, sizes, later):
+            for i in range(size - n):
+                self._tfrun(sa.pop_op)
+
+        self._input_cache.discard(descriptor.tobytes())
+
+        # Limit tiles for the rest of the run
+        with self._split_cond:
+            self._tile_limits[dim] = min(stride,
+                self._tile_limits.get(dim, stride))
+
+        # Halve the host memory held by tiles in flight,
+        # starting from the peak if there was no budget
+        if isinstance(exception, MemoryError):
+            ceiling = self._admission.ceiling
+            if ceiling is None:
+                ceiling = self._admission.peak_bytes
+            self._admission.ceiling = max(1, ceiling // 2)
+
+        sub_descriptors = list(self._sub_descriptors(descriptor,
+            { dim: stride }))
+
+        montblanc.log.warn("Tile {d} exhausted {m} memory on shard {s}. "
+            "Splitting it into {n} tiles and limiting '{dim}' "
+            "tiles to {l} for the rest of the run.".format(
+                d=descriptor, s=shard, n=len(sub_descriptors), dim=dim,
+                l=stride, m='host' if isinstance(exception, MemoryError)
+                    else 'device'))
+
+        if ordered:
+            self._reorder.split(descriptor.tobytes(),
+                [sd.tobytes() for sd in sub_descriptors])
+
+        # Queue sub-tiles before the tile leaves
+        # the pipeline, so that feeding awaits them
+        with self._split_cond:
+            self._split_tiles.extend(sub_descriptors)
+            self._split_cond.notify_all()
+
+        self._admission.release(descriptor.tobytes())
+
+        return True
+
+
+    def _consume(self, data_sinks, cube, shard, output_names,
+            global_iter_args, compute_future, tile_queue=None):
         """ Consume stub """
         try:
-            return self._consume_impl(data_sinks, cube, global_iter_args)
+            # Split tiles produce no output
+            if not compute_future.result():
+                return
+
+            return self._consume_impl(data_sinks, cube, shard, output_names,
+                global_iter_args, tile_queue)
         except Exception as e:
             montblanc.log.exception("Consumer Exception")
+            self._abort()
             six.reraise(Exception, Exception(e), sys.exc_info()[2])
 
-    def _consume_impl(self, data_sinks, cube, global_iter_args):
+    def _consume_impl(self, data_sinks, cube, shard, output_names,
+            global_iter_args, tile_queue=None):
         """ Consume """
 
         LSA = self._tf_feed_data.local
-        output = self._tfrun(LSA.output.get_op)
+        output_staging_areas = LSA.output[output_names]
+        output_staging_area = output_staging_areas[shard % len(output_staging_areas)]
+        output = self._tfrun(output_staging_area.get_op)
 
         # Expect the descriptor in the first tuple position
         assert len(output) > 0
-        assert LSA.output.fed_arrays[0] == 'descriptor'
+        assert output_staging_area.fed_arrays[0] == 'descriptor'
 
         descriptor = output['descriptor']
         # Make it read-only so we can hash the contents
         descriptor.flags.writeable = False
+        key = descriptor.tobytes()
 
         dims = self._transcoder.decode(descriptor)
         cube.update_dimensions(dims)
 
-        # Obtain and remove input data from the source cache
+        def _supply(outputs, input_data):
+            """ Call the associated data sink for each output """
+            for n, a in outputs:
+                sink_context = SinkContext(n, cube,
+                    self.config(), global_iter_args,
+                    cube.array(n) if n in cube.arrays() else {},
+                    a, input_data)
+
+                _supply_data(data_sinks[n], sink_context)
+
+        def _release():
+            """ The tile has left the pipeline """
+            self._input_cache.discard(key)
+            self._admission.release(key)
+
         try:
-            input_data = self._source_cache.pop(descriptor.data)
-        except KeyError:
-            raise ValueError("No input data cache available "
-                "in source cache for descriptor {}!"
-                    .format(descriptor))
+            # Obtain input data from the input cache
+            try:
+                input_data = self._input_cache[key]
+            except KeyError:
+                raise ValueError("No input data cache available "
+                    "in input cache for descriptor {}!"
+                        .format(descriptor))
+
+            outputs = [(n, a) for n, a in list(output.items())
+                if not n == 'descriptor']
+            ordered = [(n, a) for n, a in outputs if data_sinks[n].ordered]
+            unordered = [(n, a) for n, a in outputs
+                if not data_sinks[n].ordered]
+
+            # Supply unordered data sinks immediately
+            _supply(unordered, input_data)
+
+            # Hand the tile directly to a solve_iter() caller
+            if tile_queue is not None:
+                extents = collections.OrderedDict((d['name'],
+                    (d['lower_extent'], d['upper_extent'])) for d in dims)
+                tile_queue.put((extents, output.get('model_vis'),
+                    output.get('chi_squared')))
+        except:
+            _release()
+            raise
 
-        # For each array in our output, call the associated data sink
-        gen = ((n, a) for n, a in list(output.items()) if not n == 'descriptor')
+        if not any(ds.ordered for ds in data_sinks.values()):
+            _release()
+            return
 
-        for n, a in gen:
-            sink_context = SinkContext(n, cube,
-                self.config(), global_iter_args,
-                cube.array(n) if n in cube.arrays() else {},
-                a, input_data)
+        def _deliver():
+            try:
+                _supply(ordered, input_data)
+            finally:
+                _release()
 
-            _supply_data(data_sinks[n], sink_context)
+        # Supply ordered data sinks once preceding tiles
+        # have been supplied. This may be deferred to
+        # the thread consuming the preceding tile
+        self._reorder.submit(key, _deliver)
 
     def solve(self, *args, **kwargs):
-        #  Obtain source and sink providers, including internal providers
-        source_providers = (self._source_providers +
-            kwargs.get('source_providers', []))
-        sink_providers = (self._sink_providers +
+        """
+        Solve the RIME, supplying outputs to the sink providers.
+
+        Keyword Arguments:
+            source_providers : list of :class:`SourceProvider`
+                Additional source providers
+            sink_providers : list of :class:`SinkProvider`
+                Additional sink providers
+        """
+        self._solve(kwargs.get('source_providers', []),
             kwargs.get('sink_providers', []))
 
+    def solve_iter(self, *args, **kwargs):
+        """
+        Solve the RIME, yielding a :code:`(extents, model_vis, chi_squared)`
+        tuple for each tile as it completes. :code:`extents` is an
+        ordered dictionary of :code:`(lower, upper)` extents for
+        each iteration dimension of the tile.
+
+        Tiles are yielded in completion order, which need not
+        match the order of the tile extents.
+        At most :code:`buffer_size` completed tiles are buffered.
+        Once the buffer is full, the solver pipeline waits
+        for the caller to take tiles.
+        Sink providers are still supplied with outputs.
+
+        Closing the generator before it is exhausted stops
+        further tiles from entering the solver pipeline
+        and discards tiles already in flight.
+
+        .. code-block:: python
+
+            for extents, model_vis, chi_squared in slvr.solve_iter(
+                    source_providers=[ms_prov], buffer_size=4):
+                t_lo, t_hi = extents['ntime']
+                ...
+
+        Keyword Arguments:
+            source_providers : list of :class:`SourceProvider`
+                Additional source providers
+            sink_providers : list of :class:`SinkProvider`
+                Additional sink providers
+            buffer_size : int
+                Maximum number of completed tiles held
+                for the caller. Defaults to 10.
+        """
+        tile_queue = _TileQueue(kwargs.get('buffer_size', QUEUE_SIZE))
+
+        def _solve():
+            try:
+                self._solve(kwargs.get('source_providers', []),
+                    kwargs.get('sink_providers', []), tile_queue)
+            except BaseException:
+                tile_queue.finish(sys.exc_info())
+            else:
+                tile_queue.finish()
+
+        solve_thread = threading.Thread(target=_solve, name="solve_iter")
+        solve_thread.daemon = True
+        solve_thread.start()
+
+        try:
+            for tile in tile_queue:
+                yield tile
+        finally:
+            tile_queue.cancel()
+
+            # Stop admitting tiles if the caller stopped early
+            if solve_thread.is_alive():
+                self._abort()
+
+            solve_thread.join()
+
+    def _plan_tiles(self, slvr_cfg):
+        """
+        Apply the tile shape predicted to have the highest
+        throughput, if the global problem size, the graph
+        specialisation or the inputs retained for data sinks
+        have changed since tiles were last planned.
+        """
+        plan_dims = ['ntime', 'nbl', 'na', 'nchan', 'nsrc'] + mbu.source_nr_vars()
+        sizes = (tuple(self.hypercube.dim_global_size(*plan_dims)),
+            self._variant.spec, self._memory_model.retain)
+
+        if sizes == self._planned_sizes:
+            return
+
+        reductions, _ = self._tile_planner.plan(self.hypercube,
+            slvr_cfg, self._iter_dims)
+
+        self._planned_sizes = sizes
+
+        # No tile shape fits, fall back to budgeting
+        if reductions is not None:
+            self._previous_budget_dims = reductions
+
+    def _graph_spec(self, source_providers, retain, output_names):
+        """
+        Returns the :class:`GraphSpec` specialising the compute
+        graph to the supplied source providers, to the
+        source types present in the hypercube and to the
+        outputs returned to the host, ``output_names``.
+
+        Terms in :data:`IDENTITY_TERMS` are elided if their input
+        is only supplied by the defaults source provider, which
+        supplies the identity. Inputs in :data:`DEVICE_DEFAULTS`
+        that are only supplied by the defaults source provider,
+        or only read by elided terms, are generated on the
+        device, unless data sinks may read them.
+        """
+        src_types = tuple(t for t in mbu.source_nr_vars()
+            if self.hypercube.dim_global_size(t) > 0)
+
+        if self.config()['data_source'] != 'default':
+            return GraphSpec(src_types=src_types, outputs=output_names)
+
+        supplied = set(n for prov in source_providers
+            if prov is not self._defaults_provider
+            for n in prov.sources())
+
+        elided = frozenset(t for t in IDENTITY_TERMS if t not in supplied)
+
+        if retain is None:
+            return GraphSpec(elided=elided, src_types=src_types,
+                outputs=output_names)
+
+        unread = set(a for t in elided for a in IDENTITY_TERMS[t])
+
+        return GraphSpec(defaults=frozenset(n for n
+                in self._tf_feed_data.device_defaults
+                if (n not in supplied or n in unread) and n not in retain),
+            elided=elided, src_types=src_types, outputs=output_names)
+
+    def _solve(self, source_providers, sink_providers, tile_queue=None):
+        # Optional outputs are only returned to the host if
+        # consumed by a supplied sink provider or solve_iter()
+        consumed = set(n for prov in sink_providers for n in prov.sinks())
+
+        if tile_queue is not None:
+            consumed.add('model_vis')
+
+        output_names = _output_names(consumed)
+
+        montblanc.log.info("Outputs {}".format(list(output_names)))
+
+        #  Obtain source and sink providers, including internal providers
+        source_providers = self._source_providers + source_providers
+        sink_providers = self._sink_providers + sink_providers
+
         src_provs_str = 'Source Providers ' + str([sp.name() for sp
                                                 in source_providers])
         snk_provs_str = 'Sink Providers ' + str([sp.name() for sp
@@ -597,18 +1164,57 @@ class RimeSolver(MontblancTensorflowSolver):
         for p in itertools.chain(source_providers, sink_providers):
             p.init(ctx)
 
+        # Get data sinks from supplied providers
+        data_sinks = { n: DataSink(f, prov.name(), prov.ordered(),
+                _tuple_or_none(prov.sink_inputs().get(n, None)))
+            for prov in sink_providers
+            for n, f in list(prov.sinks().items())
+            if not n == 'descriptor' }
+
+        # Only retain the inputs read by sinks of the outputs,
+        # unless a sink does not declare the inputs it reads
+        sink_inputs = [ds.inputs for n, ds in data_sinks.items()
+            if n in output_names]
+        retain = (None if any(i is None for i in sink_inputs)
+            else set(a for i in sink_inputs for a in i))
+
         # Apply any dimension updates from the source provider
         # to the hypercube, taking previous reductions into account
-        bytes_required = _apply_source_provider_dim_updates(
+        _apply_source_provider_dim_updates(
             self.hypercube, source_providers,
             self._previous_budget_dims)
 
-        # If we use more memory than previously,
+        # Specialise the compute graph to the supplied providers,
+        # the source types present and the outputs returned
+        self._variant = self._graph_variant(
+            self._graph_spec(source_providers, retain, output_names))
+        self._memory_model = self._variant.memory_model.retaining(retain)
+
+        if self._tile_planner is not None:
+            self._tile_planner.memory_model = self._memory_model
+
+        # If tiles no longer fit within the memory budgets,
         # perform another budgeting operation
         # to make sure everything fits
-        if bytes_required > self._previous_budget:
-            self._previous_budget_dims, self._previous_budget = (
-                _budget(self.hypercube, self.config()))
+        slvr_cfg = self.config()
+
+        if self._tile_planner is not None:
+            self._plan_tiles(slvr_cfg)
+
+        if not self._memory_model.fits(self.hypercube,
+                slvr_cfg.get('mem_budget', 2*ONE_GB),
+                slvr_cfg.get('host_mem_budget')):
+            self._previous_budget_dims = _budget(self.hypercube,
+                slvr_cfg, self._memory_model)
+
+        # The tile planner balances source batches itself
+        if self._tile_planner is None and self._cost_models is not None:
+            src_dims = mbu.source_nr_vars()
+            max_batch = self._previous_budget_dims.get('nsrc',
+                max(self.hypercube.dim_global_size(*src_dims)))
+            _balance_source_batches(self.hypercube,
+                self._cost_models, max_batch, self._memory_model,
+                slvr_cfg.get('mem_budget', 2*ONE_GB))
 
         # Determine the global iteration arguments
         # e.g. [('ntime', 100), ('nbl', 20)]
@@ -630,84 +1236,109 @@ class RimeSolver(MontblancTensorflowSolver):
 
         # Construct data sources from those supplied by the
         # source providers, if they're associated with
-        # input sources
+        # input sources. Version tokens default to the
+        # fingerprint of the provider. Data sources of providers
+        # that are not thread safe share a lock
         LSA = self._tf_feed_data.local
         input_sources = LSA.input_sources
-        data_sources = {n: DataSource(f, cube.array(n).dtype, prov.name())
+        provider_locks = { prov: threading.RLock()
+            for prov in source_providers if not prov.thread_safe() }
+        data_sources = {n: DataSource(f, cube.array(n).dtype, prov.name(),
+                tuple(prov.dependencies().get(n, ())),
+                prov.versions().get(n, prov.fingerprint()),
+                provider_locks.get(prov, None))
             for prov in source_providers
             for n, f in list(prov.sources().items())
             if n in input_sources}
 
-        # Get data sinks from supplied providers
-        data_sinks = { n: DataSink(f, prov.name())
-            for prov in sink_providers
-            for n, f in list(prov.sinks().items())
-            if not n == 'descriptor' }
+        # Construct a feed dictionary from data sources,
+        # skipping data that was assigned in a previous solution
+        feed_dict, versions = {}, {}
 
-        # Construct a feed dictionary from data sources
-        feed_dict = {  fo.ph: _get_data(data_sources[k],
-                SourceContext(k, cube,
+        for k, fo in list(LSA.feed_once.items()):
+            ds = data_sources[k]
+            context = SourceContext(k, cube,
                     self.config(), global_iter_args,
                     cube.array(k) if k in cube.arrays() else {},
                     array_schemas[k].shape,
-                    array_schemas[k].dtype))
-            for k, fo
-            in list(LSA.feed_once.items()) }
+                    array_schemas[k].dtype)
+
+            # Data must come from the same data source, in the same shape
+            key = (ds.name, tuple(context.shape), np.dtype(context.dtype).str)
+
+            # Compare version tokens without calling the data source.
+            # Data of unknown version is assigned on every solution
+            if ds.version is None:
+                version = None
+            elif self._feed_once_versions.get(k) == key + (ds.version,):
+                continue
+            else:
+                version = key + (ds.version,)
+
+            feed_dict[fo.ph] = _get_data(ds, context)
+            versions[k] = version
+
+        montblanc.log.debug("Assigning feed once arrays {a}, "
+            "unchanged arrays {u}".format(a=sorted(versions.keys()),
+                u=sorted(set(LSA.feed_once.keys()).difference(versions))))
 
         self._run_metadata.clear()
+        self._admission.reset()
+        self._input_cache.reset(retain)
+        self._reorder.reset()
+        self._split_tiles.clear()
 
-        # Run the assign operations for each feed_once variable
-        assign_ops = [fo.assign_op.op for fo in list(LSA.feed_once.values())]
-        self._tfrun(assign_ops, feed_dict=feed_dict)
+        # Run the assign operations for each changed feed_once variable
+        assign_ops = [LSA.feed_once[k].assign_op.op for k in versions]
 
-        try:
-            # Run the descriptor executor immediately
-            params = self._descriptor_executor.submit(self._descriptor_feed)
+        # Forget versions until their assignment succeeds
+        for k in versions:
+            self._feed_once_versions.pop(k, None)
 
+        if len(assign_ops) > 0:
+            self._tfrun(assign_ops, feed_dict=feed_dict)
+
+        self._feed_once_versions.update(versions)
+
+        try:
             # Sets to track futures not yet completed
             feed_not_done = set()
-            compute_not_done = set([params])
+            compute_not_done = set()
             consume_not_done = set()
-            throttle_factor = self._nr_of_shards*QUEUE_SIZE
 
             # _feed_impl generates 3 futures
             # one for feeding data, one for computing with this data
             # and another for consuming it.
-            # Iterate over these futures
-            for feed, compute, consume in self._feed_impl(cube,
-                data_sources, data_sinks, global_iter_args):
+            # Iterate over these futures. _feed_impl
+            # blocks while the host memory budget is exhausted
+            for i, (feed, compute, consume) in enumerate(self._feed_impl(cube,
+                data_sources, data_sinks, output_names,
+                global_iter_args, tile_queue)):
 
                 feed_not_done.add(feed)
                 compute_not_done.add(compute)
                 consume_not_done.add(consume)
 
-                # If there are many feed futures in flight,
-                # perform throttling
-                if len(feed_not_done) > throttle_factor*2:
-                    # Wait for throttle_factor futures to complete
-                    fit = cf.as_completed(feed_not_done)
-                    feed_done = set(itertools.islice(fit, throttle_factor))
-                    feed_not_done.difference_update(feed_done)
-
-                    # Take an completed compute and consume
-                    # futures immediately
-                    compute_done, compute_not_done = cf.wait(
-                        compute_not_done, timeout=0,
-                        return_when=cf.FIRST_COMPLETED)
-                    consume_done, consume_not_done = cf.wait(
-                        consume_not_done, timeout=0,
-                        return_when=cf.FIRST_COMPLETED)
-
-                    # Get future results, mainly to fire exceptions
-                    for i, f in enumerate(itertools.chain(feed_done,
-                                        compute_done, consume_done)):
-                        f.result()
+                # Take any completed futures immediately
+                feed_done, feed_not_done = cf.wait(feed_not_done,
+                    timeout=0, return_when=cf.FIRST_COMPLETED)
+                compute_done, compute_not_done = cf.wait(compute_not_done,
+                    timeout=0, return_when=cf.FIRST_COMPLETED)
+                consume_done, consume_not_done = cf.wait(consume_not_done,
+                    timeout=0, return_when=cf.FIRST_COMPLETED)
 
+                # Get future results, mainly to fire exceptions
+                for f in itertools.chain(feed_done, compute_done, consume_done):
+                    f.result()
+
+                if i % QUEUE_SIZE == 0:
                     not_done = sum(len(s) for s in (feed_not_done,
                         compute_not_done, consume_not_done))
 
-                    montblanc.log.debug("Consumed {} futures. "
-                        "{} remaining".format(i, not_done))
+                    montblanc.log.debug("{} futures remaining. "
+                        "{} in flight in {} tiles.".format(not_done,
+                            mbu.fmt_bytes(self.inflight_bytes),
+                            len(self._admission)))
 
             # Request future results, mainly for exceptions
             for f in cf.as_completed(itertools.chain(feed_not_done,
@@ -735,10 +1366,18 @@ class RimeSolver(MontblancTensorflowSolver):
             montblanc.log.info('Solution Completed')
 
 
+    @property
+    def inflight_bytes(self):
+        """
+        Estimated number of host bytes held by
+        tiles currently in the solver pipeline
+        """
+        return self._admission.inflight_bytes
+
     def close(self):
         # Shutdown thread executors
-        self._descriptor_executor.shutdown()
         [fe.shutdown() for fe in self._feed_executors]
+        [fwe.shutdown() for fwe in self._feed_worker_executors]
         [ce.shutdown() for ce in self._compute_executors]
         self._consumer_executor.shutdown()
 
@@ -760,6 +1399,48 @@ class RimeSolver(MontblancTensorflowSolver):
         self.close()
 
 
+class _TileQueue(object):
+    """
+    Bounded queue of completed tiles, passed from
+    the consumer thread to a :meth:`RimeSolver.solve_iter` caller.
+    """
+    _DONE = object()
+
+    def __init__(self, maxsize):
+        self._queue = six.moves.queue.Queue(maxsize=max(1, maxsize))
+        self._cancelled = threading.Event()
+
+    def put(self, tile):
+        """ Block until there is space for tile, or the queue is cancelled """
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(tile, timeout=0.1)
+                return
+            except six.moves.queue.Full:
+                pass
+
+    def finish(self, exc_info=None):
+        """ Indicate that no more tiles will arrive """
+        self.put((self._DONE, exc_info))
+
+    def cancel(self):
+        """ Discard any further tiles """
+        self._cancelled.set()
+
+    def __iter__(self):
+        while True:
+            tile = self._queue.get()
+
+            if tile[0] is self._DONE:
+                exc_info = tile[1]
+
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+
+                return
+
+            yield tile
+
 def _create_defaults_source_provider(cube, data_source):
     """
     Create a DefaultsSourceProvider object. This provides default
@@ -817,7 +1498,7 @@ def _create_defaults_source_provider(cube, data_source):
     return default_prov
 
 def _construct_tensorflow_feed_data(dfs, cube, iter_dims,
-    nr_of_input_staging_areas):
+    nr_of_output_staging_areas=1):
 
     FD = AttrDict()
     # https://github.com/bcj/AttrDict/issues/34
@@ -832,6 +1513,13 @@ def _construct_tensorflow_feed_data(dfs, cube, iter_dims,
         n: tf.placeholder(dtype=tf.int32, shape=(), name=n)
         for n in ['nsrc'] + mbu.source_nr_vars()})
 
+    # Create placeholder variables for dimensions of arrays
+    # generated on the device, which are not implied by
+    # the shapes of other inputs
+    FD.dim_ph_vars = AttrDict({
+        n: tf.placeholder(dtype=tf.int32, shape=(), name=n)
+        for n in ['npol']})
+
     # Create placeholder variables for properties
     FD.property_ph_vars = AttrDict({
         n: tf.placeholder(dtype=p.dtype, shape=(), name=n)
@@ -848,41 +1536,40 @@ def _construct_tensorflow_feed_data(dfs, cube, iter_dims,
     src_data_sources, feed_many, feed_once = _partition(iter_dims,
                                                         input_arrays)
 
-    #=====================================
-    # Descriptor staging area
-    #=====================================
-
-    local.descriptor = create_staging_area_wrapper('descriptors',
-        ['descriptor'], dfs)
-
     #===========================================
-    # Staging area for multiply fed data sources
+    # Multiply fed data sources
     #===========================================
 
-    # Create the staging_area for holding the feed many input
-    local.feed_many = [create_staging_area_wrapper('feed_many_%d' % i,
-                ['descriptor'] + [a.name for a in feed_many], dfs)
-            for i in range(nr_of_input_staging_areas)]
+    # Staging areas holding the feed many inputs are created
+    # for each graph variant, as arrays generated on the
+    # device are not fed
+    local.feed_many_arrays = [a.name for a in feed_many]
+
+    # Schemas of feed many arrays that may be generated on the device
+    FD.device_defaults = { n: dfs[n] for n in local.feed_many_arrays
+        if n in DEVICE_DEFAULTS }
 
     #=================================================
-    # Staging areas for each radio source data sources
+    # Radio source data sources
     #=================================================
 
-    # Create the source array staging areas
-    local.sources = { src_nr_var: [
-            create_staging_area_wrapper('%s_%d' % (src_type, i),
-            [a.name for a in src_data_sources[src_nr_var]], dfs)
-            for i in range(nr_of_input_staging_areas)]
-
-        for src_type, src_nr_var in list(source_var_types().items())
-    }
+    # Staging areas holding each source type are created
+    # for each graph variant, as only the source types
+    # present are fed
+    local.source_arrays = { src_nr_var:
+            [a.name for a in src_data_sources[src_nr_var]]
+        for src_nr_var in source_var_types().values() }
 
-    #======================================
-    # The single output staging_area
-    #======================================
+    #=========================================
+    # Output staging areas, shared by shards.
+    # Created for each combination of outputs
+    #=========================================
 
-    local.output = create_staging_area_wrapper('output',
-        ['descriptor', 'model_vis', 'chi_squared'], dfs)
+    local.output = { output_names: [create_staging_area_wrapper(
+                'output_%s_%d' % ('_'.join(output_names), i),
+                ['descriptor'] + list(output_names), dfs)
+            for i in range(nr_of_output_staging_areas)]
+        for output_names in _output_variants() }
 
     #=================================================
     # Create tensorflow variables which are
@@ -915,10 +1602,9 @@ def _construct_tensorflow_feed_data(dfs, cube, iter_dims,
     #=======================================================
 
     # Data sources from input staging_areas
-    src_sa = [q for sq in list(local.sources.values()) for q in sq]
-    all_staging_areas = local.feed_many + src_sa
-    input_sources = { a for q in all_staging_areas
-                        for a in q.fed_arrays}
+    input_sources = { a for arrays in local.source_arrays.values()
+                        for a in arrays }
+    input_sources.update(['descriptor'] + local.feed_many_arrays)
     # Data sources from feed once variables
     input_sources.update(list(local.feed_once.keys()))
 
@@ -926,8 +1612,12 @@ def _construct_tensorflow_feed_data(dfs, cube, iter_dims,
 
     return FD
 
-def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
-    """ Constructs a tensorflow expression for computing the RIME """
+def _construct_tensorflow_expression(slvr_cfg, feed_data, spec,
+        feed_many, sources, device, shard):
+    """
+    Constructs a tensorflow expression for computing the RIME,
+    specialised to the :class:`GraphSpec` ``spec``
+    """
     zero = tf.constant(0)
     src_count = zero
     src_ph_vars = feed_data.src_ph_vars
@@ -936,19 +1626,36 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
 
     polarisation_type = slvr_cfg['polarisation_type']
 
+    # Multiplication by identity terms is elided
+    have_ejones = 'ebeam' not in spec.elided
+    have_die = 'direction_independent_effects' not in spec.elided
+
     # Pull RIME inputs out of the feed staging_area
     # of the relevant shard, adding the feed once
     # inputs to the dictionary
-    D = LSA.feed_many[shard].get_to_attrdict()
+    D = feed_many[shard].get_to_attrdict()
     D.update({k: fo.var for k, fo in list(LSA.feed_once.items())})
 
     with tf.device(device):
         # Infer chunk dimensions
-        model_vis_shape = tf.shape(D.model_vis)
-        ntime, nbl, nchan, npol = [model_vis_shape[i] for i in range(4)]
+        antenna_shape = tf.shape(D.antenna1)
+        ntime, nbl = antenna_shape[0], antenna_shape[1]
+        na = tf.shape(D.uvw)[1]
+        nchan = tf.shape(D.frequency)[0]
+        npol = feed_data.dim_ph_vars.npol
 
         # Infer float and complex type
-        FT, CT = D.uvw.dtype, D.model_vis.dtype
+        FT = D.uvw.dtype
+        CT = tf.complex64 if FT == tf.float32 else tf.complex128
+
+        # Generate inputs that are not fed from the host
+        dims = { 'ntime': ntime, 'nbl': nbl, 'na': na,
+            'nchan': nchan, 'npol': npol }
+
+        for n in spec.defaults:
+            schema = feed_data.device_defaults[n]
+            D[n] = DEVICE_DEFAULTS[n]([dims.get(d, d) for d in schema.shape],
+                tf.as_dtype(schema.dtype))
 
         # Compute sine and cosine of parallactic angles
         pa_sin, pa_cos = rime.parallactic_angle_sin_cos(
@@ -1002,10 +1709,14 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
         #    return ( val + np.pi) % ( 2 * np.pi ) - np.pi
         #cube_pos = normang(normang(radec_prime) - normang(phase_centre_prime))
 
-        ejones = rime.e_beam(lm, D.frequency,
-                             D.pointing_errors, D.antenna_scaling,
-                             pa_sin, pa_cos,
-                             D.beam_extents, D.beam_freq_map, D.ebeam)
+        # Elided identity beams are not read
+        if have_ejones:
+            ejones = rime.e_beam(lm, D.frequency,
+                                 D.pointing_errors, D.antenna_scaling,
+                                 pa_sin, pa_cos,
+                                 D.beam_extents, D.beam_freq_map, D.ebeam)
+        else:
+            ejones = tf.zeros(shape=[0, 0, 0, 0, 4], dtype=CT)
 
         deps = [phase_real, phase_imag, bsqrt_real, bsqrt_imag]
         deps = [] # Do nothing for now
@@ -1015,7 +1726,8 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
         with tf.control_dependencies(deps):
             antenna_jones = rime.create_antenna_jones(bsqrt, cplx_phase,
                                                       feed_rotation, ejones,
-                                                      FT=FT)
+                                                      FT=FT,
+                                                      have_ejones=have_ejones)
             return antenna_jones, sgn_brightness
 
     # While loop condition for each point source type
@@ -1031,7 +1743,7 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
     # While loop bodies
     def point_body(coherencies, npsrc, src_count):
         """ Accumulate visiblities for point source batch """
-        S = LSA.sources['npsrc'][shard].get_to_attrdict()
+        S = sources['npsrc'][shard].get_to_attrdict()
 
         # Maintain source counts
         nsrc = tf.shape(S.point_lm)[0]
@@ -1048,7 +1760,7 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
 
     def gaussian_body(coherencies, ngsrc, src_count):
         """ Accumulate coherencies for gaussian source batch """
-        S = LSA.sources['ngsrc'][shard].get_to_attrdict()
+        S = sources['ngsrc'][shard].get_to_attrdict()
 
         # Maintain source counts
         nsrc = tf.shape(S.gaussian_lm)[0]
@@ -1066,7 +1778,7 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
 
     def sersic_body(coherencies, nssrc, src_count):
         """ Accumulate coherencies for sersic source batch """
-        S = LSA.sources['nssrc'][shard].get_to_attrdict()
+        S = sources['nssrc'][shard].get_to_attrdict()
 
         # Maintain source counts
         nsrc = tf.shape(S.sersic_lm)[0]
@@ -1082,40 +1794,102 @@ def _construct_tensorflow_expression(slvr_cfg, feed_data, device, shard):
 
         return coherencies, nssrc, src_count
 
-    with tf.device(device):
-        base_coherencies = tf.zeros(shape=[ntime,nbl,nchan,npol], dtype=CT)
-
-        # Evaluate point sources
-        summed_coherencies, npsrc, src_count = tf.while_loop(
-            point_cond, point_body,
-            [base_coherencies, zero, src_count])
-
-        # Evaluate gaussians
-        summed_coherencies, ngsrc, src_count = tf.while_loop(
-            gaussian_cond, gaussian_body,
-            [summed_coherencies, zero, src_count])
-
-        # Evaluate sersics
-        summed_coherencies, nssrc, src_count = tf.while_loop(
-            sersic_cond, sersic_body,
-            [summed_coherencies, zero, src_count])
+    # While loop conditions and bodies of each source type
+    source_loops = {
+        'npsrc': (point_cond, point_body),
+        'ngsrc': (gaussian_cond, gaussian_body),
+        'nssrc': (sersic_cond, sersic_body),
+    }
 
-        # Post process visibilities to produce model visibilites and chi squared
-        model_vis, chi_squared = rime.post_process_visibilities(
-            D.antenna1, D.antenna2, D.direction_independent_effects, D.flag,
-            D.weight, D.model_vis, summed_coherencies, D.observed_vis)
+    with tf.device(device):
+        summed_coherencies = tf.zeros(shape=[ntime,nbl,nchan,npol], dtype=CT)
 
-    # Create enstaging_area operation
-    put_op = LSA.output.put_from_list([D.descriptor, model_vis, chi_squared])
+        # Evaluate the source types present
+        for src_nr_var in spec.src_types:
+            cond, body = source_loops[src_nr_var]
+            summed_coherencies, _, src_count = tf.while_loop(
+                cond, body, [summed_coherencies, zero, src_count])
 
-    # Return descriptor and enstaging_area operation
-    return D.descriptor, put_op
+        # Elided identity direction independent effects are not read
+        if have_die:
+            die = D.direction_independent_effects
+        else:
+            die = tf.zeros(shape=[0, 0, 0, 4], dtype=CT)
+
+        # Post process visibilities to produce model visibilites,
+        # chi squared and residual visibilities. Residual
+        # visibilities are only computed if returned
+        model_vis, chi_squared, residual_vis = rime.post_process_visibilities(
+            D.antenna1, D.antenna2, die, D.flag,
+            D.weight, D.model_vis, summed_coherencies, D.observed_vis,
+            have_die=have_die,
+            have_residual='residual_vis' in spec.outputs)
+
+    outputs = { 'model_vis': model_vis, 'chi_squared': chi_squared,
+        'residual_vis': residual_vis }
+
+    # Create the enstaging_area operation for the returned outputs
+    staging_areas = LSA.output[spec.outputs]
+    put_op = staging_areas[shard % len(staging_areas)].put_from_list(
+        [D.descriptor] + [outputs[n] for n in spec.outputs])
+
+    # Return descriptor and enstaging_area operation,
+    # keyed on output combination
+    return { spec.outputs: (D.descriptor, put_op) }
+
+def _identity_on_pols(shape, dtype):
+    """ Tiles [1, 0, 0, 1] over all but the last dimension of shape """
+    identity = tf.constant([1, 0, 0, 1], dtype=dtype)
+    identity = tf.reshape(identity, [1]*(len(shape) - 1) + [4])
+    return tf.tile(identity, list(shape[:-1]) + [1])
+
+# Jones terms of the RIME, keyed on their input array, which
+# are elided from the compute graph when the input is the
+# identity. Each maps to other inputs only read by the term.
+IDENTITY_TERMS = {
+    'ebeam': ('pointing_errors',),
+    'direction_independent_effects': (),
+}
+
+# Inputs generated on the device, rather than fed from the
+# host, when only supplied by the defaults source provider.
+# Each takes the array shape and dtype, matching the
+# 'default' data sources of the array configuration.
+DEVICE_DEFAULTS = {
+    'model_vis': tf.zeros,
+    'observed_vis': tf.zeros,
+    'flag': tf.zeros,
+    'weight': tf.ones,
+    'pointing_errors': tf.zeros,
+    'direction_independent_effects': _identity_on_pols,
+}
+
+def _output_variants():
+    """ Returns a tuple of output names for each combination of optional outputs """
+    required = [n for n in OUTPUTS if n not in OPTIONAL_OUTPUTS]
+
+    return [tuple(n for n in OUTPUTS if n in required or n in optional)
+        for r in range(len(OPTIONAL_OUTPUTS) + 1)
+        for optional in itertools.combinations(OPTIONAL_OUTPUTS, r)]
+
+def _output_names(consumed):
+    """ Returns the tuple of output names required by the consumed outputs """
+    return tuple(n for n in OUTPUTS
+        if n not in OPTIONAL_OUTPUTS or n in consumed)
+
+def _tuple_or_none(iterable):
+    return None if iterable is None else tuple(iterable)
 
 def _get_data(data_source, context):
     """ Get data from the data source, checking the return values """
     try:
-        # Get data from the data source
-        data = data_source.source(context)
+        # Get data from the data source, one call at a
+        # time if its provider is not thread safe
+        if data_source.lock is None:
+            data = data_source.source(context)
+        else:
+            with data_source.lock:
+                data = data_source.source(context)
 
         # Complain about None values
         if data is None:
@@ -1145,6 +1919,75 @@ def _get_data(data_source, context):
 
         six.reraise(ValueError, ex, sys.exc_info()[2])
 
+def _dependency_levels(data_sources, names):
+    """
+    Partition data source names into levels. Data sources
+    in a level only depend on data sources in previous levels.
+    Dependencies on data sources not present in names are ignored.
+    """
+    remaining = collections.OrderedDict((n, set(data_sources[n].depends)
+            .intersection(names).difference([n]))
+        for n in names)
+
+    levels = []
+
+    while len(remaining) > 0:
+        level = [n for n, deps in remaining.items() if len(deps) == 0]
+
+        if len(level) == 0:
+            raise ValueError("Cyclic dependencies found amongst "
+                "data sources '{}'".format(list(remaining.keys())))
+
+        for n in level:
+            del remaining[n]
+
+        for deps in remaining.values():
+            deps.difference_update(level)
+
+        levels.append(level)
+
+    return levels
+
+def _submit_data_sources(executor, requests):
+    """
+    Submit the first level of (name, placeholder, datasource, context)
+    requests for evaluation on executor. Subsequent levels depend
+    on the first and are deferred to :func:`_evaluate_data_sources`.
+    """
+    requests = collections.OrderedDict((a, (ds, ctx))
+        for a, ph, ds, ctx in requests)
+    data_sources = { a: ds for a, (ds, ctx) in requests.items() }
+    levels = _dependency_levels(data_sources, list(requests.keys()))
+
+    if len(levels) == 0:
+        return {}, [], requests
+
+    futures = { a: executor.submit(_get_data, *requests[a])
+        for a in levels[0] }
+
+    return futures, levels[1:], requests
+
+def _evaluate_data_sources(executor, pending):
+    """
+    Wait for data submitted by :func:`_submit_data_sources`,
+    evaluating deferred levels of data sources once
+    their dependencies are available.
+
+    Returns
+    -------
+    dict
+        Data keyed on array name
+    """
+    futures, levels, requests = pending
+    data = { a: f.result() for a, f in futures.items() }
+
+    for level in levels:
+        futures = { a: executor.submit(_get_data, *requests[a])
+            for a in level }
+        data.update((a, f.result()) for a, f in futures.items())
+
+    return data
+
 def _supply_data(data_sink, context):
     """ Supply data to the data sink """
     try:
@@ -1169,16 +2012,126 @@ def _uniq_log2_range(start, size, div):
 
     return np.flipud(np.unique(int_values))
 
-def _budget(cube, slvr_cfg):
+def _channel_tile_sizes(nchan, nbands):
+    """
+    Returns decreasing channel tile sizes that evenly
+    divide the channels of each band, so that
+    channel tiles never straddle band boundaries.
+    """
+    chan_per_band = nchan // nbands
+    sizes = [chan_per_band] if nbands > 1 else []
+    size = chan_per_band
+
+    # Repeatedly divide by the smallest factor
+    while size > 1:
+        size //= next(f for f in range(2, size + 1) if size % f == 0)
+        sizes.append(size)
+
+    return sizes
+
+def _split_extent(dims, nchan, nbands):
+    """
+    Returns the (dimension, stride) with which to split a tile
+    with extent sizes ``dims``, along the first divisible dimension
+    in the same order of preference as budgeting, or None if the
+    tile cannot be split. Time and baselines are halved, while
+    channels are split into the largest of the band aligned sizes
+    of :func:`_channel_tile_sizes` dividing the tile's channels.
+    """
+    for dim in ('ntime', 'nchan', 'nbl'):
+        size = dims.get(dim, 0)
+
+        if size <= 1:
+            continue
+
+        if dim != 'nchan':
+            return dim, (size + 1) // 2
+
+        strides = [c for c in _channel_tile_sizes(nchan, nbands)
+            if c < size and size % c == 0]
+
+        if len(strides) > 0:
+            return dim, strides[0]
+
+    return None
+
+def _create_cost_models(slvr_cfg, device_type, device, session_target):
+    """
+    Create cost models of the rime operators, loaded from the
+    ``tile_profile`` file if it contains a profile for this
+    configuration. Otherwise the operators are benchmarked
+    on ``device`` and the profile saved.
+    """
+    profile = slvr_cfg.get('tile_profile', '')
+    dtype = slvr_cfg['dtype']
+    key = '-'.join((device_type, dtype, tf.__version__, montblanc.__version__))
+
+    cost_models = load_profile(profile, key)
+
+    if cost_models is None:
+        montblanc.log.info("Benchmarking rime operators "
+            "on '{}'".format(device))
+
+        cost_models = benchmark_ops(rime, device, dtype,
+            session_target=session_target)
+        save_profile(profile, key, cost_models)
+    else:
+        montblanc.log.info("Loaded rime operator profile "
+            "'{k}' from '{p}'".format(k=key, p=profile))
+
+    for op, model in sorted(cost_models.items()):
+        montblanc.log.debug("{p}{o}: {m}".format(p=' '*4, o=op, m=model))
+
+    return cost_models
+
+def _balance_source_batches(cube, cost_models, max_batch,
+        memory_model, mem_budget):
+    """
+    Update the source dimension extents of ``cube`` so that each
+    iteration of the source loops performs a similar amount of work,
+    given cost models of the rime operators. The cheapest source
+    type is batched in ``max_batch`` sources. Batches of each type
+    are limited to those fitting within ``mem_budget`` on the
+    device, given the ``memory_model``.
+    """
+    src_dims = mbu.source_nr_vars()
+    sizes = dict(zip(('ntime', 'nbl', 'na', 'nchan'),
+        cube.dim_extent_size('ntime', 'nbl', 'na', 'nchan')))
+    nsrcs = dict(zip(src_dims, cube.dim_global_size(*src_dims)))
+
+    batch_limits = memory_model.source_batch_limits(cube, mem_budget)
+    batch_sizes = { d: s for d, s in balanced_batch_sizes(cost_models,
+        sizes, nsrcs, max_batch, batch_limits).items() if nsrcs[d] > 0 }
+
+    if len(batch_sizes) == 0:
+        return
+
+    cube.update_dimensions([{ 'name': d, 'lower_extent': 0,
+        'upper_extent': s } for d, s in batch_sizes.items()])
+
+    cube.update_dimension('nsrc', lower_extent=0,
+        upper_extent=max(cube.dim_extent_size(*src_dims)))
+
+    montblanc.log.info("Balanced source batch sizes {}".format(
+        ', '.join('{d}: {s}'.format(d=d, s=s)
+            for d, s in sorted(batch_sizes.items()))))
+
+def _budget(cube, slvr_cfg, memory_model):
+    """
+    Reduce the tile extents of the cube until the memory model
+    predicts that the solver pipeline fits within the device
+    and host memory budgets. Returns a dictionary of the
+    dimension reductions that were applied.
+    """
     # Figure out a viable dimension configuration
     # given the total problem size
     mem_budget = slvr_cfg.get('mem_budget', 2*ONE_GB)
-    bytes_required = cube.bytes_required()
+    host_mem_budget = slvr_cfg.get('host_mem_budget')
 
     src_dims = mbu.source_nr_vars() + ['nsrc']
-    dim_names = ['na', 'nbl', 'ntime'] + src_dims
+    dim_names = ['na', 'nbl', 'ntime', 'nchan', 'nbands'] + src_dims
     global_sizes = cube.dim_global_size(*dim_names)
-    na, nbl, ntime = global_sizes[:3]
+    na, nbl, ntime, nchan, nbands = global_sizes[:5]
 
     # Keep track of original dimension sizes and any reductions that are applied
     original_sizes = { r: s for r, s in zip(dim_names, global_sizes) }
@@ -1193,12 +2146,17 @@ def _budget(cube, slvr_cfg):
         # Attempt reduction over source
         sbs = slvr_cfg['source_batch_size']
         srange = _uniq_log2_range(10, sbs, 5) if sbs > 10 else 10
-        src_dim_gs = global_sizes[3:]
+        src_dim_gs = global_sizes[5:]
 
         for bs in srange:
             yield [(d, bs if bs < gs else gs) for d, gs
                 in zip(src_dims, src_dim_gs)]
 
+        # Reduce by channel, within bands
+        if slvr_cfg.get('channel_tiling', False):
+            for c in _channel_tile_sizes(nchan, nbands):
+                yield [('nchan', c)]
+
         # Try the rest of the timesteps
         for t in trange[1:]:
             yield [('ntime', t)]
@@ -1207,23 +2165,49 @@ def _budget(cube, slvr_cfg):
         for bl in _uniq_log2_range(na, nbl, 5):
             yield [('nbl', bl)]
 
+    # Whether reductions were only required by the host budget
+    host_bound = False
+
     for reduction in _reduction():
-        if bytes_required > mem_budget:
-            for dim, size in reduction:
-                applied_reductions[dim] = size
-                cube.update_dimension(dim, lower_extent=0, upper_extent=size)
-        else:
+        if memory_model.fits(cube, mem_budget, host_mem_budget):
             break
 
-        bytes_required = cube.bytes_required()
+        host_bound = host_bound or memory_model.fits(cube, mem_budget, None)
+
+        for dim, size in reduction:
+            applied_reductions[dim] = size
+            cube.update_dimension(dim, lower_extent=0, upper_extent=size)
+
+    device_breakdown = memory_model.device_breakdown(cube)
+    host_breakdown = memory_model.host_breakdown(cube)
 
     # Log some information about the memory_budget
     # and dimension reduction
     montblanc.log.info(("Selected a solver memory budget of {rb} "
-        "given a hard limit of {mb}.").format(
-        rb=mbu.fmt_bytes(bytes_required),
+        "per device given a hard limit of {mb}.").format(
+        rb=mbu.fmt_bytes(sum(device_breakdown.values())),
         mb=mbu.fmt_bytes(mem_budget)))
 
+    for k, v in device_breakdown.items():
+        montblanc.log.info('{p}{c}: {b}'.format(
+            p=' '*4, c=k, b=mbu.fmt_bytes(v)))
+
+    montblanc.log.info(("Selected a host memory budget of {rb} "
+        "for {d} tiles per shard given a hard limit of {mb}.").format(
+        rb=mbu.fmt_bytes(sum(host_breakdown.values())),
+        d=memory_model.staging_depth,
+        mb='None' if host_mem_budget is None
+            else mbu.fmt_bytes(host_mem_budget)))
+
+    for k, v in host_breakdown.items():
+        montblanc.log.info('{p}{c}: {b}'.format(
+            p=' '*4, c=k, b=mbu.fmt_bytes(v)))
+
+    if host_bound:
+        montblanc.log.info("The host memory budget of {mb}, rather than "
+            "the device memory budget, reduced the tile size.".format(
+                mb=mbu.fmt_bytes(host_mem_budget)))
+
     if len(applied_reductions) > 0:
         montblanc.log.info("The following dimension reductions "
             "were applied:")
@@ -1234,7 +2218,7 @@ def _budget(cube, slvr_cfg):
     else:
         montblanc.log.info("No dimension reductions were applied.")
 
-    return applied_reductions, bytes_required
+    return applied_reductions
 
 DimensionUpdate = attr.make_class("DimensionUpdate",
     ['size', 'prov'], slots=True, frozen=True)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+class AdmissionController(object):
+    """
+    Admits tiles into the solver pipeline while the
+    bytes held by tiles in flight remain below a ceiling.
+
+    Tiles are admitted with :meth:`acquire`, which blocks
+    until enough bytes have been returned by :meth:`release`.
+    A tile is always admitted if nothing else is in flight,
+    so that tiles larger than the ceiling cannot deadlock
+    the pipeline. Tiles that tiles in flight wait upon, such
+    as the sub-tiles of a split tile preceding them in the
+    delivery order, may be admitted without waiting.
+    """
+    def __init__(self, ceiling):
+        """
+        Parameters
+        ----------
+        ceiling : int or None
+            Maximum number of bytes that tiles in flight may hold.
+            If None, tiles are always admitted.
+        """
+        self._ceiling = ceiling
+        self._cond = threading.Condition()
+        self._inflight = {}
+        self._inflight_bytes = 0
+        self._peak_bytes = 0
+        self._aborted = False
+
+    @property
+    def ceiling(self):
+        """ Maximum number of bytes that tiles in flight may hold, or None """
+        return self._ceiling
+
+    @ceiling.setter
+    def ceiling(self, value):
+        with self._cond:
+            self._ceiling = value
+            self._cond.notify_all()
+
+    @property
+    def aborted(self):
+        """ True if :meth:`abort` was called since :meth:`reset` """
+        with self._cond:
+            return self._aborted
+
+    @property
+    def inflight_bytes(self):
+        """ Number of bytes currently held by tiles in flight """
+        with self._cond:
+            return self._inflight_bytes
+
+    @property
+    def peak_bytes(self):
+        """ Peak number of bytes held by tiles in flight since :meth:`reset` """
+        with self._cond:
+            return self._peak_bytes
+
+    def __len__(self):
+        with self._cond:
+            return len(self._inflight)
+
+    def acquire(self, key, nbytes, force=False):
+        """
+        Block until a tile, identified by ``key`` and
+        holding ``nbytes``, can be admitted.
+        If ``force`` is True, the tile is admitted
+        without waiting, unless aborted.
+
+        Returns
+        -------
+        bool
+            True if the tile was admitted, False if
+            :meth:`abort` was called while waiting.
+        """
+        with self._cond:
+            while (not force and not self._aborted and
+                    self._ceiling is not None and
+                    self._inflight_bytes > 0 and
+                    self._inflight_bytes + nbytes > self._ceiling):
+                self._cond.wait()
+
+            if self._aborted:
+                return False
+
+            self._inflight[key] = self._inflight.get(key, 0) + nbytes
+            self._inflight_bytes += nbytes
+            self._peak_bytes = max(self._peak_bytes, self._inflight_bytes)
+
+            return True
+
+    def release(self, key):
+        """ Release the bytes held by the tile identified by ``key`` """
+        with self._cond:
+            nbytes = self._inflight.pop(key, 0)
+            self._inflight_bytes -= nbytes
+            self._cond.notify_all()
+
+    def abort(self):
+        """ Wake and refuse admission to any waiting tiles """
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def reset(self):
+        """ Forget any tiles in flight and clear the abort state """
+        with self._cond:
+            self._inflight.clear()
+            self._inflight_bytes = 0
+            self._peak_bytes = 0
+            self._aborted = False
+            self._cond.notify_all()
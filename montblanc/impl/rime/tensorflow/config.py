@@ -281,9 +281,11 @@ A = [
     # Frequency
     array_dict('frequency', ('nchan',), 'ft',
         default = lambda s, c: np.linspace(_freq_low, _freq_high,
-                                c.shape[0], dtype=c.dtype),
+                                c.dim_global_size('nchan'),
+                                dtype=c.dtype)[slice(*c.dim_extents('nchan'))],
         test    = lambda s, c: np.linspace(_freq_low, _freq_high,
-                                c.shape[0], dtype=c.dtype),
+                                c.dim_global_size('nchan'),
+                                dtype=c.dtype)[slice(*c.dim_extents('nchan'))],
         tags    = "input",
         description = "Frequency. Frequencies from multiple bands "
             "are stacked on top of each other. ",
@@ -474,6 +476,15 @@ A = [
             "of model and observed visibilities. These can be summed "
             "to produce a chi-squared for the entire problem."),
 
+    # Residual Visibilities
+    array_dict('residual_vis', ('ntime','nbl','nchan', 'npol'), 'ct',
+        default = lambda s, c: np.zeros(c.shape, c.dtype),
+        test    = lambda s, c: np.zeros(c.shape, c.dtype),
+        tags    = "output",
+        description = "Residual visibilities. The difference of the observed "
+            "visibilities and the RIME model visibilities, "
+            "zeroed where flagged."),
+
     # Result arrays
     array_dict('bsqrt', ('nsrc', 'ntime', 'nchan', 'npol'), 'ct',
         tags="temporary"),
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import copy
+
+import montblanc.util as mbu
+
+class MemoryModel(object):
+    """
+    Models the memory footprint of the solver pipeline,
+    given the extents of a tile on a hypercube.
+
+    On each device, a tile is computed concurrently on each
+    shard of the device. Each tile holds its inputs, a batch of
+    each source type, temporary arrays and outputs, while the
+    feed once arrays are shared by all shards.
+
+    On the host, tiles in flight are held in the staging areas
+    of each shard, up to the staging depth.
+    Each holds its inputs and the sources of the entire tile
+    in the staging areas, the inputs retained for data sinks,
+    and its outputs.
+    """
+    def __init__(self, feed_once, feed_many, sources, outputs,
+            temporaries, nr_of_shards, shards_per_device, staging_depth,
+            device_defaults=(), retain=None):
+        """
+        Parameters
+        ----------
+        feed_once : list of str
+            Arrays fed once per solution
+        feed_many : list of str
+            Arrays fed for each tile
+        sources : dict
+            Arrays fed for each batch of sources,
+            keyed on source dimension, e.g. 'npsrc'
+        outputs : list of str
+            Output arrays of each tile
+        temporaries : list of str
+            Temporary arrays created on the device while
+            computing a tile
+        nr_of_shards : int
+            Total number of shards
+        shards_per_device : int
+            Number of shards on each device
+        staging_depth : int
+            Number of tiles in flight on each shard
+        device_defaults : list of str, optional
+            Arrays of each tile generated on the device,
+            rather than fed from the host
+        retain : iterable of str, optional
+            Inputs retained for data sinks while a tile
+            is in flight. Defaults to None, in which case
+            all inputs are retained.
+        """
+        self._feed_once = list(feed_once)
+        self._feed_many = list(feed_many)
+        self._sources = { k: list(v) for k, v in sources.items() }
+        self._outputs = list(outputs)
+        self._temporaries = list(temporaries)
+        self._nr_of_shards = nr_of_shards
+        self._shards_per_device = shards_per_device
+        self._staging_depth = staging_depth
+        self._device_defaults = list(device_defaults)
+        self._retain = None if retain is None else frozenset(retain)
+
+    @property
+    def staging_depth(self):
+        """ Number of tiles in flight on each shard """
+        return self._staging_depth
+
+    @property
+    def retain(self):
+        """ Inputs retained for data sinks, or None if all are """
+        return self._retain
+
+    def retaining(self, retain):
+        """
+        Returns a copy of this model in which only
+        the inputs in ``retain`` are retained for data sinks.
+        If None, all inputs are retained.
+        """
+        model = copy.copy(self)
+        model._retain = None if retain is None else frozenset(retain)
+        return model
+
+    def _retained(self, retain=None):
+        """ Feed many inputs retained for data sinks """
+        retain = self._retain if retain is None else retain
+
+        return (self._feed_many if retain is None else
+            [a for a in self._feed_many if a in retain])
+
+    def _source_arrays(self):
+        return [a for arrays in self._sources.values() for a in arrays]
+
+    @staticmethod
+    def _bytes(schemas, arrays):
+        """ Bytes required by arrays present in schemas """
+        return int(sum(mbu.array_bytes(schemas[a].shape, schemas[a].dtype)
+            for a in arrays if a in schemas))
+
+    def _tile_schemas(self, cube):
+        """ Array schemas, with all sources of the tile present """
+        cube = cube.copy()
+        cube.update_dimensions([{'name': d, 'lower_extent': 0,
+            'upper_extent': cube.dim_global_size(d)} for d in self._sources])
+
+        return cube.arrays(reify=True)
+
+    def tile_host_bytes(self, cube, dims=None, outputs=None, retain=None):
+        """
+        Estimate the host bytes held by a single tile while in flight.
+
+        Parameters
+        ----------
+        cube : :class:`hypercube.HyperCube`
+            Hypercube
+        dims : list of dict, optional
+            Dimension updates describing the tile.
+            If None, the extents of ``cube`` describe the tile.
+        outputs : list of str, optional
+            Outputs returned to the host.
+            Defaults to all outputs.
+        retain : iterable of str, optional
+            Inputs retained for data sinks while the tile
+            is in flight. Defaults to the inputs retained
+            by this model.
+
+        Returns
+        -------
+        int
+        """
+        if dims is not None:
+            cube = cube.copy()
+            cube.update_dimensions(dims)
+
+        outputs = self._outputs if outputs is None else outputs
+        retained = self._retained(retain)
+        schemas = self._tile_schemas(cube)
+
+        return (self._bytes(schemas, self._feed_many) +
+            self._bytes(schemas, retained) +
+            self._bytes(schemas, self._source_arrays()) +
+            self._bytes(schemas, outputs))
+
+    def device_breakdown(self, cube):
+        """
+        Returns an ordered dictionary of bytes required on
+        each device by each pipeline component, given the
+        tile extents of ``cube``.
+        """
+        schemas = cube.arrays(reify=True)
+        spd = self._shards_per_device
+
+        return collections.OrderedDict([
+            ('feed_once', self._bytes(schemas, self._feed_once)),
+            ('inputs', spd*self._bytes(schemas, self._feed_many +
+                self._device_defaults + self._source_arrays())),
+            ('temporaries', spd*self._bytes(schemas, self._temporaries)),
+            ('outputs', spd*self._bytes(schemas, self._outputs))])
+
+    def source_batch_limits(self, cube, device_budget):
+        """
+        Returns the largest batch of each source type present
+        for which tiles of ``cube`` fit within ``device_budget``,
+        keyed on source dimension. Each source of a type requires
+        device memory for the source arrays of the type and
+        for the temporary arrays sized on sources.
+        """
+        src_dims = [d for d in list(self._sources) + ['nsrc']
+            if d in cube.dimensions(copy=False)]
+
+        empty = cube.copy()
+        empty.update_dimensions([{'name': d, 'lower_extent': 0,
+            'upper_extent': 0} for d in src_dims])
+        base = sum(self.device_breakdown(empty).values())
+
+        limits = {}
+
+        for src_dim in self._sources:
+            if (src_dim not in src_dims or
+                    cube.dim_global_size(src_dim) == 0):
+                continue
+
+            one = empty.copy()
+            one.update_dimensions([{'name': d, 'lower_extent': 0,
+                'upper_extent': 1, 'global_size': max(1,
+                    one.dim_global_size(d))}
+                for d in (src_dim, 'nsrc') if d in src_dims])
+            per_source = sum(self.device_breakdown(one).values()) - base
+
+            if per_source > 0:
+                limits[src_dim] = max(1,
+                    int((device_budget - base) // per_source))
+
+        return limits
+
+    def host_breakdown(self, cube):
+        """
+        Returns an ordered dictionary of bytes required on
+        the host by each pipeline component, given the
+        tile extents of ``cube``.
+        """
+        tiles = self._nr_of_shards*self._staging_depth
+        schemas = self._tile_schemas(cube)
+
+        return collections.OrderedDict([
+            ('feed_once', self._bytes(schemas, self._feed_once)),
+            ('staging', tiles*self._bytes(schemas,
+                self._feed_many + self._source_arrays())),
+            ('retained_inputs', tiles*self._bytes(schemas,
+                self._retained())),
+            ('outputs', tiles*self._bytes(schemas, self._outputs))])
+
+    def footprint(self, cube):
+        """
+        Returns a (device bytes, host bytes) tuple,
+        given the tile extents of ``cube``
+        """
+        return (sum(self.device_breakdown(cube).values()),
+            sum(self.host_breakdown(cube).values()))
+
+    def fits(self, cube, device_budget, host_budget):
+        """
+        True if tiles of ``cube`` fit within the budgets.
+        A ``host_budget`` of None does not limit host memory.
+        """
+        device_bytes, host_bytes = self.footprint(cube)
+        return device_bytes <= device_budget and (host_budget is None
+            or host_bytes <= host_budget)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import sys
+import threading
+
+import numpy as np
+import six
+from six.moves import queue
+
+import montblanc
+
+# A write of data to the rows startrow, startrow + rowincr, ...
+# of a column. If not None, blc and trc are the bottom left and
+# top right corners of the slice of each cell written
+TableWrite = collections.namedtuple("TableWrite",
+    "column startrow nrow rowincr blc trc data")
+
+def _adjacent(prev, write):
+    """ True if ``write`` continues the rows written by ``prev`` """
+    return (prev.column == write.column and
+        prev.rowincr == write.rowincr and
+        prev.blc == write.blc and prev.trc == write.trc and
+        prev.startrow + prev.nrow*prev.rowincr == write.startrow)
+
+def coalesce(writes):
+    """
+    Merge writes of adjacent rows of the same column
+    into single writes.
+
+    Parameters
+    ----------
+    writes : list of :class:`TableWrite`
+        Writes, in any order
+
+    Returns
+    -------
+    list of :class:`TableWrite`
+        Merged writes, ordered by column and starting row
+    """
+    writes = sorted(writes, key=lambda w: (w.column, w.rowincr,
+        str(w.blc), str(w.trc), w.startrow))
+    merged = []
+    runs = []
+
+    for write in writes:
+        if len(runs) > 0 and _adjacent(runs[-1][-1], write):
+            runs[-1].append(write)
+        else:
+            runs.append([write])
+
+    for run in runs:
+        if len(run) == 1:
+            merged.append(run[0])
+            continue
+
+        first = run[0]
+        merged.append(first._replace(nrow=sum(w.nrow for w in run),
+            data=np.concatenate([w.data for w in run], axis=0)))
+
+    return merged
+
+# Signals the writer thread to exit
+_STOP = object()
+
+class CoalescingWriter(object):
+    """
+    Writes columns of a table on a background thread.
+
+    Writes are placed on a bounded queue, so that producers
+    block, rather than accumulate data, when writing falls
+    behind. The writer thread removes all queued writes at
+    once and merges writes of adjacent rows into single,
+    larger writes.
+
+    If ``row_numbers`` are supplied, the rows of each write
+    index ``row_numbers``, which map them to rows of the table.
+    Rows mapped to -1 are missing from the table and are
+    not written. Mapped rows may optionally be written in
+    ascending order, avoiding scattered writes to the
+    underlying storage.
+
+    pyrap tables are not thread safe, so the table is only
+    accessed while holding ``table_lock``, which should be
+    shared with all other users of the table.
+    """
+    def __init__(self, table, queue_size=8, row_numbers=None,
+            physical_order=False, table_lock=None):
+        """
+        Parameters
+        ----------
+        table : :class:`pyrap.tables.table`
+            Table to write to
+        queue_size : int
+            Maximum number of writes queued
+        row_numbers : :class:`numpy.ndarray`
+            Row numbers of ``table`` referenced by the rows of
+            each write, or -1 if the row is missing.
+        physical_order : bool
+            Issue the rows mapped by ``row_numbers``
+            in ascending order
+        table_lock : :class:`threading.RLock`
+            Lock serialising access to ``table``
+        """
+        self._table = table
+        self._table_lock = (threading.RLock() if table_lock is None
+            else table_lock)
+        self._row_numbers = row_numbers
+        self._physical_order = physical_order
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._exc_info = None
+        self._thread = None
+        self._writes = 0
+        self._merged_writes = 0
+
+    @property
+    def physical_order(self):
+        """ True if mapped rows are issued in ascending order """
+        return self._physical_order
+
+    def start(self):
+        """ Start the writer thread """
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            self._exc_info = None
+
+        self._thread = threading.Thread(target=self._run,
+            name="CoalescingWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, write):
+        """
+        Queue a :class:`TableWrite`, blocking while the queue is full.
+        Writes are issued immediately if the writer thread
+        has not been started.
+        """
+        self._raise()
+
+        if self._thread is None:
+            self._write(write)
+        else:
+            self._queue.put(write)
+
+    def flush(self):
+        """ Wait until all queued writes have been issued """
+        if self._thread is not None:
+            self._queue.join()
+
+        self._raise()
+
+    def stop(self):
+        """ Issue all queued writes and stop the writer thread """
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+        self._raise()
+
+    def stats(self):
+        """
+        Returns a dictionary of writer statistics:
+
+        - writes: Writes queued
+        - merged_writes: Writes issued against the table
+        """
+        with self._lock:
+            return { 'writes': self._writes,
+                'merged_writes': self._merged_writes }
+
+    def _raise(self):
+        """ Raise any exception raised on the writer thread """
+        with self._lock:
+            exc_info, self._exc_info = self._exc_info, None
+
+        if exc_info is not None:
+            six.reraise(*exc_info)
+
+    def _run(self):
+        stop = False
+
+        while not stop:
+            writes = [self._queue.get()]
+
+            # Take everything else that is queued
+            while True:
+                try:
+                    writes.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(w is _STOP for w in writes)
+
+            try:
+                merged = coalesce([w for w in writes if w is not _STOP])
+
+                for write in merged:
+                    self._write_table(write)
+
+                with self._lock:
+                    self._writes += sum(1 for w in writes if w is not _STOP)
+                    self._merged_writes += len(merged)
+            except Exception:
+                with self._table_lock:
+                    name = self._table.name()
+
+                montblanc.log.exception("Writing to '{t}' failed".format(
+                    t=name))
+
+                with self._lock:
+                    self._exc_info = sys.exc_info()
+            finally:
+                for w in writes:
+                    self._queue.task_done()
+
+    def _write(self, write):
+        """ Issue a single write without queueing it """
+        self._write_table(write)
+
+        with self._lock:
+            self._writes += 1
+            self._merged_writes += 1
+
+    def _write_table(self, write):
+        """ Issue ``write`` against the table """
+        if self._row_numbers is None:
+            rownrs, data = None, write.data
+            rows = { 'startrow': write.startrow,
+                'nrow': write.nrow,
+                'rowincr': write.rowincr }
+        else:
+            # Select the mapped rows of the table,
+            # skipping missing rows
+            view_rows = write.startrow + write.rowincr*np.arange(write.nrow)
+            rownrs = self._row_numbers[view_rows]
+            order = np.flatnonzero(rownrs >= 0)
+
+            if self._physical_order:
+                order = order[np.argsort(rownrs[order], kind='mergesort')]
+
+            if order.size == 0:
+                return
+
+            rownrs = rownrs[order]
+            data = write.data[order]
+            rows = {}
+
+        with self._table_lock:
+            table = (self._table if rownrs is None
+                else self._table.selectrows(rownrs))
+
+            try:
+                if write.blc is None:
+                    table.putcol(write.column, data, **rows)
+                else:
+                    table.putcolslice(write.column, data,
+                        list(write.blc), list(write.trc), **rows)
+            finally:
+                if table is not self._table:
+                    table.close()
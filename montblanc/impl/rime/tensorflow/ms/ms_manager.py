@@ -19,6 +19,9 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
 import collections
+import os
+import re
+import threading
 
 import numpy as np
 
@@ -27,6 +30,10 @@ import montblanc
 from hypercube import HyperCube
 import pyrap.tables as pt
 
+from montblanc.impl.rime.tensorflow.ms.row_block_reader import (RowBlockReader,
+    RowBlockPrefetcher)
+from montblanc.impl.rime.tensorflow.ms.row_index import ms_row_index
+
 # Map MS column string types to numpy types
 MS_TO_NP_TYPE_MAP = {
     'INT' : np.int32,
@@ -37,12 +44,10 @@ MS_TO_NP_TYPE_MAP = {
     'DCOMPLEX' : np.complex128
 }
 
-# Key names for main and taql selected tables
+# Key names for main and ordered reference tables
 MAIN_TABLE = 'MAIN'
 ORDERED_MAIN_TABLE = 'ORDERED_MAIN'
 ORDERED_UVW_TABLE = 'ORDERED_UVW'
-ORDERED_TIME_TABLE = 'ORDERED_TIME'
-ORDERED_BASELINE_TABLE = 'ORDERED_BASELINE'
 
 # Measurement Set sub-table name string constants
 ANTENNA_TABLE = 'ANTENNA'
@@ -65,6 +70,8 @@ UVW = 'UVW'
 DATA = 'DATA'
 FLAG = 'FLAG'
 WEIGHT = 'WEIGHT'
+FIELD_ID = 'FIELD_ID'
+DATA_DESC_ID = 'DATA_DESC_ID'
 MODEL_DATA = 'MODEL_DATA'
 CORRECTED_DATA = 'CORRECTED_DATA'
 
@@ -83,21 +90,20 @@ REF_FREQUENCY = 'REF_FREQUENCY'
 SELECTED = [TIME, ANTENNA1, ANTENNA2, UVW,
     DATA, MODEL_DATA, CORRECTED_DATA, FLAG, WEIGHT]
 
-# Named tuple defining a mapping from MS row to dimension
-OrderbyMap = collections.namedtuple("OrderbyMap", "dimension orderby")
+# Columns read to index the rows of the main table
+INDEX_COLUMNS = (TIME, ANTENNA1, ANTENNA2, FIELD_ID, DATA_DESC_ID)
+
+# Columns of the ordered uvw table read together for a tile
+UVW_BLOCK_COLUMNS = (ANTENNA1, ANTENNA2, UVW)
 
-# Mappings for time, baseline and band
-TIME_MAP = OrderbyMap("ntime", "TIME")
-BASELINE_MAP = OrderbyMap("nbl", "ANTENNA1, ANTENNA2")
-BAND_MAP = OrderbyMap("nbands", "[SELECT SPECTRAL_WINDOW_ID "
-        "FROM ::DATA_DESCRIPTION][DATA_DESC_ID]")
+# Number of data sources reading each column of a uvw block.
+# ANTENNA1 and ANTENNA2 are read by their own data sources,
+# and by the uvw data source
+UVW_BLOCK_READERS = { ANTENNA1: 2, ANTENNA2: 2, UVW: 1 }
 
-# Place mapping in a list
-MS_ROW_MAPPINGS = [
-    TIME_MAP,
-    BASELINE_MAP,
-    BAND_MAP
-]
+# Main table columns holding a single value per
+# polarisation for all channels of a row
+ROW_COLUMNS = (WEIGHT,)
 
 UPDATE_DIMENSIONS = ['ntime', 'nbl', 'na', 'nchan', 'nbands', 'npol',
     'npolchan', 'nvis']
@@ -108,12 +114,6 @@ MS_DIM_ORDER = ('ntime', 'nbl', 'nbands')
 UVW_DIM_ORDER = ('ntime', 'nbl')
 
 
-def orderby_clause(dimensions, unique=False):
-    columns = ", ".join(m.orderby for m
-        in MS_ROW_MAPPINGS if m.dimension in dimensions)
-
-    return " ".join(("ORDERBY", "UNIQUE" if unique else "", columns))
-
 def subtable_name(msname, subtable=None):
     return '::'.join((msname, subtable)) if subtable else msname
 
@@ -121,6 +121,102 @@ def open_table(msname, subtable=None):
     return pt.table(subtable_name(msname, subtable),
         ack=False, readonly=False)
 
+# Matches storage manager files, capturing their sequence number
+STORAGE_FILE_RE = re.compile(r'^table\.f(\d+)(\D.*)?$')
+
+def table_storage_state(msname, subtable=None, seqnrs=None):
+    """
+    Returns a sorted list of (file, mtime, size) tuples describing
+    the files of a table, which change when the table is written.
+    If ``seqnrs`` is None, these are the table description and
+    all storage manager files. Otherwise, only the files of the
+    storage managers with sequence numbers in ``seqnrs`` are listed.
+    Subtables are assumed to be stored within the
+    Measurement Set directory.
+    """
+    path = os.path.join(msname, subtable) if subtable else msname
+
+    if not os.path.isdir(path):
+        return []
+
+    state = []
+
+    # table.lock, which changes whenever the
+    # table is opened, is never listed
+    for f in sorted(os.listdir(path)):
+        match = STORAGE_FILE_RE.match(f)
+
+        if seqnrs is None:
+            if not (f == 'table.dat' or match):
+                continue
+        elif not (match and int(match.group(1)) in seqnrs):
+            continue
+
+        st = os.stat(os.path.join(path, f))
+        state.append((f, st.st_mtime, st.st_size))
+
+    return state
+
+# Describes the cells of a column read into a tile buffer.
+# If not None, blc and trc are the bottom left and top
+# right corners of the slice of each cell read.
+ColumnRead = collections.namedtuple("ColumnRead",
+    "shape dtype fill blc trc")
+
+def gather_rows(table, rownrs, reads, lock=None):
+    """
+    Reads ``rownrs`` of ``table`` into zero-filled tile buffers.
+    Rows are selected in ascending order, so that the underlying
+    storage is read sequentially. Row numbers of -1 denote
+    missing rows, for which buffers retain their fill value.
+
+    Parameters
+    ----------
+    table : :class:`pyrap.tables.table`
+        Table to read from
+    rownrs : :class:`numpy.ndarray`
+        Row numbers to read
+    reads : dict
+        :class:`ColumnRead` for each column to read
+    lock : :class:`threading.RLock`
+        Lock serialising access to ``table``, held
+        for the duration of the read
+
+    Returns
+    -------
+    dict
+        A buffer for each column, with rows in
+        the order given by ``rownrs``
+    """
+    present = np.flatnonzero(rownrs >= 0)
+    order = present[np.argsort(rownrs[present], kind='mergesort')]
+    columns = { column: np.full((rownrs.shape[0],) + read.shape,
+            read.fill, dtype=read.dtype)
+        for column, read in reads.items() }
+
+    if order.size == 0:
+        return columns
+
+    with threading.RLock() if lock is None else lock:
+        selection = table.selectrows(rownrs[order])
+
+        try:
+            for column, read in reads.items():
+                rows = np.empty((order.shape[0],) + read.shape,
+                    dtype=read.dtype)
+
+                if read.blc is None:
+                    selection.getcolnp(column, rows)
+                else:
+                    selection.getcolslicenp(column, rows,
+                        list(read.blc), list(read.trc))
+
+                columns[column][order] = rows
+        finally:
+            selection.close()
+
+    return columns
+
 def row_extents(cube, dim_order=None):
     if dim_order is None:
         dim_order = MS_DIM_ORDER
@@ -135,13 +231,76 @@ def row_extents(cube, dim_order=None):
 def uvw_row_extents(cube):
     return row_extents(cube, UVW_DIM_ORDER)
 
+def band_channel_extents(cube):
+    """
+    Returns a (band, lower, upper) tuple describing the channel
+    extents of the cube within a single band, or None if the
+    cube spans all channels.
+    """
+    nchan, nbands = cube.dim_global_size('nchan', 'nbands')
+    lc, uc = cube.dim_extents('nchan')
+
+    if lc == 0 and uc == nchan:
+        return None
+
+    chan_per_band = nchan // nbands
+    band = lc // chan_per_band
+
+    if not (uc - 1) // chan_per_band == band:
+        raise ValueError("Channel extents [{l}, {u}) straddle the "
+            "boundary of band {b}. Channel tiles must lie "
+            "within a single band.".format(l=lc, u=uc, b=band))
+
+    return band, lc - band*chan_per_band, uc - band*chan_per_band
+
+def main_row_selection(cube):
+    """
+    Selects the rows and channels of the ordered main table
+    described by the cube.
+
+    Returns
+    -------
+    tuple
+        (rows, channels) where rows is a dictionary of
+        startrow, nrow and rowincr arguments and channels
+        is a (lower, upper) tuple of channel extents within
+        each row, or None if rows should be read in their entirety.
+    """
+    band_chans = band_channel_extents(cube)
+
+    # All channels, so all bands of each row are required
+    if band_chans is None:
+        lrow, urow = row_extents(cube)
+        return { 'startrow': lrow, 'nrow': urow - lrow, 'rowincr': 1 }, None
+
+    # Channels of a single band. Rows for each band are
+    # interleaved, so stride over the rows of other bands
+    band, lc, uc = band_chans
+    nbands = cube.dim_global_size('nbands')
+    lrow, urow = uvw_row_extents(cube)
+
+    return ({ 'startrow': lrow*nbands + band,
+        'nrow': urow - lrow,
+        'rowincr': nbands }, (lc, uc))
+
 class MeasurementSetManager(object):
     def __init__(self, msname, slvr_cfg):
         super(MeasurementSetManager, self).__init__()
 
         self._msname = msname
+        # Read ahead enough tiles, each of two blocks, in
+        # addition to the blocks of tiles being fed
+        depth = slvr_cfg['ms_prefetch_depth']
+        self._row_blocks = RowBlockReader(capacity=8 + 2*depth)
+        self._prefetcher = RowBlockPrefetcher(self._row_blocks, depth)
         # Create dictionary of tables
         self._tables = { k: open_table(msname, k) for k in SUBTABLE_KEYS }
+        # pyrap tables are not thread safe. Data sources, the
+        # prefetcher and the sink's writer thread serialise access
+        # to each table, and to reference tables of the main
+        # table, by holding its lock
+        self._table_locks = { k: threading.RLock()
+            for k in SUBTABLE_KEYS + (MAIN_TABLE,) }
 
         if not pt.tableexists(msname):
             raise ValueError("'{ms}' does not exist "
@@ -181,45 +340,21 @@ class MeasurementSetManager(object):
         self._auto_correlations = auto_correlations = slvr_cfg['auto_correlations']
         self._field_id = field_id = 0
 
-        # Create a view over the MS, ordered by
+        # Index the rows of the MS, ordered by
         # (1) time (TIME)
         # (2) baseline (ANTENNA1, ANTENNA2)
         # (3) band (SPECTRAL_WINDOW_ID via DATA_DESC_ID)
-        ordering_query = " ".join((
-            "SELECT FROM $ms",
-            "WHERE FIELD_ID={fid}".format(fid=field_id),
-            "" if auto_correlations else "AND ANTENNA1 != ANTENNA2",
-            orderby_clause(MS_DIM_ORDER)
-        ))
-
-        # Ordered Measurement Set
-        oms = pt.taql(ordering_query)
-
-        montblanc.log.debug("MS ordering query is '{o}'."
-            .format(o=ordering_query))
-
-        # Measurement Set ordered by unique time and baseline
-        otblms = pt.taql("SELECT FROM $oms {c}".format(
-            c=orderby_clause(UVW_DIM_ORDER, unique=True)))
+        self._index = index = ms_row_index(msname, ms, ddesc,
+            field_id, auto_correlations, len(chan_per_band))
 
         # Store the main table
         self._tables[MAIN_TABLE] = ms
-        self._tables[ORDERED_MAIN_TABLE] = oms
-        self._tables[ORDERED_UVW_TABLE] = otblms
 
         self._column_descriptors = {col: ms.getcoldesc(col) for col in SELECTED}
 
-        # Count distinct timesteps in the MS
-        t_orderby = orderby_clause(['ntime'], unique=True)
-        t_query = "SELECT FROM $otblms {c}".format(c=t_orderby)
-        self._tables[ORDERED_TIME_TABLE] = ot = pt.taql(t_query)
-        self._ntime = ntime = ot.nrows()
-
-        # Count number of baselines in the MS
-        bl_orderby = orderby_clause(['nbl'], unique=True)
-        bl_query = "SELECT FROM $otblms {c}".format(c=bl_orderby)
-        self._tables[ORDERED_BASELINE_TABLE] = obl = pt.taql(bl_query)
-        self._nbl = nbl = obl.nrows()
+        # Count distinct timesteps and baselines in the MS
+        self._ntime = ntime = index.ntime
+        self._nbl = nbl = index.nbl
 
         # Number of channels per band
         self._nchanperband = chan_per_band[0]
@@ -241,22 +376,195 @@ class MeasurementSetManager(object):
         shape = tuple(dim_sizes[d] for d in MS_DIM_ORDER)
         expected_rows = np.product(shape)
 
-        if not expected_rows == oms.nrows():
+        nrows = index.nrows
+
+        if not expected_rows == nrows:
             dim_desc = ", ".join('(%s,%s)' % (d, s) for
                 d, s in zip(MS_DIM_ORDER, shape))
             row_desc = " x ".join('%s' % s for s in shape)
 
-            montblanc.log.warn("Encountered '{msr}' rows in '{ms}' "
+            montblanc.log.info("Encountered '{msr}' rows in '{ms}' "
                 "but expected '{rd} = {er}' after finding the following "
-                "dimensions by inspection: [{d}]. Irregular Measurement Sets "
-                "are not fully supported due to the generality of the format.".format(
-                    msr=oms.nrows(), ms=msname,
+                "dimensions by inspection: [{d}]. Missing rows are "
+                "flagged and excluded from the solution.".format(
+                    msr=nrows, ms=msname,
                     er=expected_rows, rd=row_desc, d=dim_desc))
 
+    def _column_dtype(self, column):
+        """ numpy type of the cells of main table ``column`` """
+        try:
+            desc = self._column_descriptors[column]
+        except KeyError:
+            with self.main_table_lock:
+                desc = self._column_descriptors[column] = (
+                    self.main_table.getcoldesc(column))
+
+        return MS_TO_NP_TYPE_MAP[desc['valueType'].upper()]
+
+    def _uvw_block(self, cube):
+        """
+        Returns a (key, read_fn, readers) tuple describing
+        the block of the ordered uvw table holding the
+        rows of the tile described by ``cube``.
+        """
+        lrow, urow = uvw_row_extents(cube)
+        rownrs = self._index.uvw_rows[lrow:urow]
+        reads = { c: ColumnRead(shape, self._column_dtype(c), 0, None, None)
+            for c, shape in zip(UVW_BLOCK_COLUMNS, [(), (), (3,)]) }
+
+        def _read():
+            columns = gather_rows(self.main_table, rownrs, reads,
+                self.main_table_lock)
+
+            # Describe missing rows with the antenna
+            # pairs of their baselines
+            missing = rownrs < 0
+            baselines = self._index.baselines[
+                np.arange(lrow, urow)[missing] % self._nbl]
+            columns[ANTENNA1][missing] = baselines[:, 0]
+            columns[ANTENNA2][missing] = baselines[:, 1]
+
+            return columns
+
+        return (ORDERED_UVW_TABLE, lrow, urow), _read, UVW_BLOCK_READERS
+
+    def _main_block(self, cube, columns):
+        """
+        Returns a (key, read_fn, readers) tuple describing
+        the block of ``columns`` of the ordered main table
+        holding the rows and channels of the tile described
+        by ``cube``. Missing rows are flagged.
+        """
+        rows, channels = main_row_selection(cube)
+        npol = cube.dim_global_size('npol')
+
+        start, step = rows['startrow'], rows['rowincr']
+        rownrs = self._index.main_rows[start:start + rows['nrow']*step:step]
+
+        if channels is None:
+            nchan, blc, trc = self._nchanperband, None, None
+        else:
+            lc, uc = channels
+            nchan, blc, trc = uc - lc, (lc, 0), (uc-1, npol-1)
+
+        reads = {}
+
+        for c in columns:
+            dtype = self._column_dtype(c)
+            fill = c == FLAG
+
+            if c in ROW_COLUMNS:
+                reads[c] = ColumnRead((npol,), dtype, fill, None, None)
+            else:
+                reads[c] = ColumnRead((nchan, npol), dtype, fill, blc, trc)
+
+        def _read():
+            return gather_rows(self.main_table, rownrs, reads,
+                self.main_table_lock)
+
+        key = (ORDERED_MAIN_TABLE, rows['startrow'], rows['nrow'],
+            rows['rowincr'], channels, tuple(columns))
+
+        return key, _read, {}
+
+    def present_baselines(self, context):
+        """
+        Returns a boolean array of shape (ntime*nbl,) indicating
+        the timesteps and baselines of the tile described by
+        ``context`` that are present in the Measurement Set.
+        """
+        lrow, urow = uvw_row_extents(context)
+        return self._index.uvw_rows[lrow:urow] >= 0
+
+    def uvw_column(self, context, column):
+        """
+        Returns ``column`` of the ordered uvw table for the rows
+        of the tile described by ``context``. The columns in
+        ``UVW_BLOCK_COLUMNS`` are read together, once per tile.
+        """
+        key, read_fn, readers = self._uvw_block(context)
+        return self._row_blocks.column(key, column, read_fn, readers)
+
+    def main_column(self, context, column, columns):
+        """
+        Returns ``column`` of the ordered main table for the rows
+        and channels of the tile described by ``context``.
+        ``columns`` are read together, once per tile, and
+        should contain ``column``.
+        """
+        key, read_fn, readers = self._main_block(context, columns)
+        return self._row_blocks.column(key, column, read_fn, readers)
+
+    def start_prefetch(self, context, columns):
+        """
+        Start reading the row blocks of upcoming tiles on a
+        background thread, ``ms_prefetch_depth`` tiles ahead
+        of the data sources requesting them.
+
+        Parameters
+        ----------
+        context : :class:`.StartContext`
+            Describes the problem cube and the iteration
+            space over which tiles are solved
+        columns : sequence of str
+            Main table columns read for each tile
+        """
+        if self._prefetcher.depth <= 0:
+            return
+
+        cube = context.cube.copy()
+        iter_args = context.iter_args
+
+        def _tiles():
+            for tile in cube.cube_iter(*iter_args):
+                yield [self._uvw_block(tile),
+                    self._main_block(tile, columns)]
+
+        self._row_blocks.clear()
+        self._prefetcher.start(_tiles())
+
+    def stop_prefetch(self):
+        """ Stop prefetching row blocks and report buffer usage """
+        if self._prefetcher.depth <= 0:
+            return
+
+        self._prefetcher.stop()
+        self._row_blocks.clear()
+
+        stats = self._row_blocks.stats()
+        montblanc.log.info("Measurement Set '{ms}' prefetch buffer "
+            "hits '{h}', misses '{m}', blocks prefetched '{p}'.".format(
+                ms=self._msname, h=stats['prefetch_hits'],
+                m=stats['reads'], p=stats['prefetched']))
+
+    def column_storage_state(self, columns):
+        """
+        Returns the number of rows of the main table and the
+        :func:`table_storage_state` of the storage managers
+        holding ``columns``, which excludes columns written
+        to other storage managers, such as those of a sink.
+        """
+        ms = self._tables[MAIN_TABLE]
+
+        with self.table_lock(MAIN_TABLE):
+            nrows = ms.nrows()
+            seqnrs = set(dm['SEQNR'] for dm in ms.getdminfo().values()
+                if len(set(dm['COLUMNS']).intersection(columns)) > 0)
+
+        return nrows, table_storage_state(self._msname, seqnrs=seqnrs)
+
+    def row_block_stats(self):
+        """ Returns statistics describing tile row block reads """
+        return self._row_blocks.stats()
+
     def close(self):
+        self._prefetcher.stop()
+        self._row_blocks.clear()
+
         # Close all the tables
-        for table in list(self._tables.values()):
-            table.close()
+        for key, table in list(self._tables.items()):
+            with self.table_lock(key):
+                table.close()
 
     @property
     def msname(self):
@@ -285,17 +593,51 @@ class MeasurementSetManager(object):
     def main_table(self):
         return self._tables[MAIN_TABLE]
 
+    @property
+    def main_table_lock(self):
+        """ Lock serialising access to the main table """
+        return self._table_locks[MAIN_TABLE]
+
+    def table_lock(self, key):
+        """
+        Lock serialising access to the table ``key``.
+        Reference tables share the lock of the main table.
+        """
+        return self._table_locks.get(key, self.main_table_lock)
+
+    def _ordered_table(self, key, rownrs):
+        """ Reference table over ``rownrs`` of the main table """
+        with self.main_table_lock:
+            try:
+                return self._tables[key]
+            except KeyError:
+                table = self._tables[key] = self.main_table.selectrows(rownrs)
+                return table
+
     @property
     def ordered_main_table(self):
-        return self._tables[ORDERED_MAIN_TABLE]
+        """ Main table rows present, ordered by time, baseline and band """
+        rows = self._index.main_rows
+        return self._ordered_table(ORDERED_MAIN_TABLE, rows[rows >= 0])
+
+    @property
+    def main_row_numbers(self):
+        """
+        Main table row numbers of each (time, baseline, band),
+        or -1 if the row is missing
+        """
+        return self._index.main_rows
 
     @property
     def ordered_uvw_table(self):
-        return self._tables[ORDERED_UVW_TABLE]
+        """ Main table rows of each unique time and baseline, ordered """
+        rows = self._index.uvw_rows
+        return self._ordered_table(ORDERED_UVW_TABLE, rows[rows >= 0])
 
     @property
-    def ordered_time_table(self):
-        return self._tables[ORDERED_TIME_TABLE]
+    def times(self):
+        """ Unique timesteps of the Measurement Set """
+        return self._index.times
 
     @property
     def antenna_table(self):
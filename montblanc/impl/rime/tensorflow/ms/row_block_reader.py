@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import sys
+import threading
+
+import six
+
+import montblanc
+
+class _Block(object):
+    """ Columns read over the same rows of a table """
+    def __init__(self, readers, prefetched=False):
+        self.event = threading.Event()
+        self.columns = None
+        self.exc_info = None
+        self.prefetched = prefetched
+        # Number of remaining reads of each column
+        self.remaining = dict(readers)
+
+class RowBlockReader(object):
+    """
+    Reads several columns over the same rows of a table
+    once, and hands them out to the data sources of a tile.
+
+    Data sources of a tile are evaluated concurrently.
+    The first data source requesting a block reads all of
+    its columns, while others requesting the same block wait
+    for that read to complete. Blocks may also be read ahead
+    of their data sources by :meth:`prefetch`. Each column of
+    a block is discarded once it has been handed out the number
+    of times it is expected to be read. The number of blocks held
+    is also bounded, the oldest being evicted first, so that
+    columns that are never read, because another provider
+    supplies their inputs, do not accumulate.
+    """
+    def __init__(self, capacity=8):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of blocks held
+        """
+        self._cond = threading.Condition()
+        self._blocks = collections.OrderedDict()
+        # Keys of blocks recently read on demand
+        self._demanded = collections.OrderedDict()
+        self._capacity = capacity
+        self._reads = 0
+        self._hits = 0
+        self._waits = 0
+        self._evictions = 0
+        self._prefetched = 0
+        self._prefetch_hits = 0
+
+    @property
+    def capacity(self):
+        """ Maximum number of blocks held """
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, value):
+        with self._cond:
+            self._capacity = value
+
+    def _insert(self, key, block):
+        """ Insert a block, evicting the oldest. Called with the lock held """
+        self._blocks[key] = block
+
+        while len(self._blocks) > self._capacity:
+            self._blocks.popitem(last=False)
+            self._evictions += 1
+
+        self._cond.notify_all()
+
+    def _discard(self, key, block):
+        """ Discard a block if it is held. Called with the lock held """
+        if self._blocks.get(key, None) is block:
+            del self._blocks[key]
+            self._cond.notify_all()
+
+    def _read(self, key, block, read_fn):
+        """ Read ``block`` with ``read_fn``, discarding it on failure """
+        try:
+            block.columns = read_fn()
+        except:
+            block.exc_info = sys.exc_info()
+
+            # Don't retain failed reads
+            with self._cond:
+                self._discard(key, block)
+        finally:
+            block.event.set()
+
+    def column(self, key, column, read_fn, readers):
+        """
+        Return ``column`` of the block identified by ``key``,
+        reading the block if it is not held.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies the table and rows of the block
+        column : str
+            Column to return
+        read_fn : callable
+            Called without arguments to read the block.
+            Should return a dictionary of column arrays.
+        readers : dict
+            Number of times each column of the block is
+            read before it is discarded. Columns not
+            present are read once.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The column
+        """
+        with self._cond:
+            block = self._blocks.get(key, None)
+
+            # The column was already handed out to all of
+            # its readers, so read the block again
+            if (block is not None and block.event.is_set() and
+                    column not in block.columns):
+                block = None
+
+            if block is None:
+                block = _Block(readers)
+                self._insert(key, block)
+                self._reads += 1
+                reading = True
+
+                # Don't prefetch blocks that have already been read
+                self._demanded[key] = True
+
+                while len(self._demanded) > 4*self._capacity:
+                    self._demanded.popitem(last=False)
+            else:
+                reading = False
+
+                if block.prefetched:
+                    self._prefetch_hits += 1
+                elif block.event.is_set():
+                    self._hits += 1
+                else:
+                    self._waits += 1
+
+        if reading:
+            self._read(key, block, read_fn)
+        else:
+            block.event.wait()
+
+        if block.exc_info is not None:
+            six.reraise(*block.exc_info)
+
+        with self._cond:
+            value = block.columns[column]
+            remaining = block.remaining.get(column, 1) - 1
+            block.remaining[column] = remaining
+
+            # Discard the column once all readers have it
+            if remaining <= 0:
+                block.columns.pop(column, None)
+
+                # Discard the block once all columns are read
+                if len(block.columns) == 0:
+                    self._discard(key, block)
+
+        return value
+
+    def prefetch(self, key, read_fn, readers):
+        """
+        Read the block identified by ``key`` ahead of the
+        data sources requesting it. Blocks that are held, or
+        have recently been read on demand, are not read again.
+        Failed reads are logged and discarded, to be raised
+        when the block is read on demand.
+
+        Returns
+        -------
+        bool
+            True if the block was read
+        """
+        with self._cond:
+            if key in self._blocks or self._demanded.pop(key, False):
+                return False
+
+            block = _Block(readers, prefetched=True)
+            self._insert(key, block)
+            self._prefetched += 1
+
+        self._read(key, block, read_fn)
+
+        if block.exc_info is not None:
+            montblanc.log.warn("Prefetching row block '{k}' "
+                "failed with '{e}'".format(k=key, e=block.exc_info[1]))
+            return False
+
+        return True
+
+    def wait_prefetched(self, limit, event):
+        """
+        Block until fewer than ``limit`` prefetched blocks
+        are held, or ``event`` is set.
+        """
+        with self._cond:
+            while not event.is_set():
+                prefetched = sum(1 for b in self._blocks.values()
+                    if b.prefetched)
+
+                if prefetched < limit:
+                    return
+
+                self._cond.wait(0.1)
+
+    def clear(self):
+        """ Discard all blocks """
+        with self._cond:
+            self._blocks.clear()
+            self._demanded.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Returns a dictionary of block statistics:
+
+        - reads: Blocks read on demand by data sources
+        - hits: Columns handed out from blocks already read
+        - waits: Columns that waited on a block being read
+        - prefetched: Blocks read ahead of their data sources
+        - prefetch_hits: Columns handed out from prefetched blocks
+        - evictions: Blocks evicted to satisfy the capacity
+        - blocks: Number of blocks held
+        """
+        with self._cond:
+            return { 'reads': self._reads,
+                'hits': self._hits,
+                'waits': self._waits,
+                'prefetched': self._prefetched,
+                'prefetch_hits': self._prefetch_hits,
+                'evictions': self._evictions,
+                'blocks': len(self._blocks) }
+
+class RowBlockPrefetcher(object):
+    """
+    Reads the row blocks of upcoming tiles into a
+    :class:`RowBlockReader` on a background thread,
+    remaining at most ``depth`` tiles ahead of the
+    data sources consuming them.
+    """
+    def __init__(self, reader, depth):
+        """
+        Parameters
+        ----------
+        reader : :class:`RowBlockReader`
+            Reader holding prefetched blocks
+        depth : int
+            Number of tiles read ahead
+        """
+        self._reader = reader
+        self._depth = depth
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def depth(self):
+        """ Number of tiles read ahead """
+        return self._depth
+
+    def start(self, tiles):
+        """
+        Start prefetching
+
+        Parameters
+        ----------
+        tiles : iterable
+            Yields a list of ``(key, read_fn, readers)`` tuples,
+            as accepted by :meth:`RowBlockReader.prefetch`,
+            for each tile, in the order that tiles are solved.
+        """
+        self.stop()
+
+        if self._depth <= 0:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(tiles,),
+            name="RowBlockPrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop prefetching and wait for the background thread """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, tiles):
+        try:
+            for blocks in tiles:
+                self._reader.wait_prefetched(self._depth*len(blocks),
+                    self._stop)
+
+                if self._stop.is_set():
+                    return
+
+                for key, read_fn, readers in blocks:
+                    self._reader.prefetch(key, read_fn, readers)
+        except Exception:
+            montblanc.log.exception("Row block prefetching failed")
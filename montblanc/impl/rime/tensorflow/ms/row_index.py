@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import numpy as np
+
+import montblanc
+
+# Incremented when the layout of the index changes
+ROW_INDEX_VERSION = 2
+
+# Suffix of the row index file, placed next to the Measurement Set
+ROW_INDEX_SUFFIX = '.montblanc-row-index.npz'
+
+def row_index_path(msname):
+    """ Path of the row index file of the Measurement Set ``msname`` """
+    return os.path.abspath(msname).rstrip(os.sep) + ROW_INDEX_SUFFIX
+
+def table_mtime(msname):
+    """
+    Modification time of the table description of ``msname``,
+    which changes when rows or columns are added
+    """
+    table_dat = os.path.join(msname, 'table.dat')
+
+    return (os.path.getmtime(table_dat)
+        if os.path.exists(table_dat) else None)
+
+class MSRowIndex(object):
+    """
+    Places the rows of a Measurement Set into a dense grid of
+    timesteps, baselines and bands, recording the main table row
+    number of each cell, and the unique timesteps and baselines.
+    Cells without a row, in Measurement Sets with missing
+    baselines or bands, hold -1.
+
+    Replaces TaQL ORDERBY and ORDERBY UNIQUE queries over the
+    entire main table, which can take minutes on large
+    Measurement Sets, with a sort of the TIME, ANTENNA1,
+    ANTENNA2 and DATA_DESC_ID columns. The index is persisted
+    next to the Measurement Set and reused until the
+    Measurement Set changes.
+    """
+    def __init__(self, main_rows, uvw_rows, times, baselines):
+        """
+        Parameters
+        ----------
+        main_rows : :class:`numpy.ndarray`
+            Main table row numbers of each (time, baseline, band)
+            cell, of shape (ntime*nbl*nbands,)
+        uvw_rows : :class:`numpy.ndarray`
+            Main table row numbers of the first row of each
+            (time, baseline) cell, of shape (ntime*nbl,)
+        times : :class:`numpy.ndarray`
+            Unique timesteps, in ascending order
+        baselines : :class:`numpy.ndarray`
+            Unique (ANTENNA1, ANTENNA2) pairs of shape (nbl, 2),
+            in ascending order
+        """
+        self.main_rows = main_rows
+        self.uvw_rows = uvw_rows
+        self.times = times
+        self.baselines = baselines
+
+    @property
+    def ntime(self):
+        return self.times.shape[0]
+
+    @property
+    def nbl(self):
+        return self.baselines.shape[0]
+
+    @property
+    def nrows(self):
+        """ Number of rows present in the grid """
+        return int(np.count_nonzero(self.main_rows >= 0))
+
+    @classmethod
+    def from_columns(cls, time, antenna1, antenna2, band, rows, nbands):
+        """
+        Create an index from the columns of the selected main
+        table rows ``rows``. ``band`` holds the spectral
+        window of each row, of which there are ``nbands``.
+        """
+        times, time_idx = np.unique(time, return_inverse=True)
+        baselines, bl_idx = np.unique(np.stack([antenna1, antenna2],
+            axis=1), axis=0, return_inverse=True)
+        bl_idx = bl_idx.ravel()
+        ntime, nbl = times.shape[0], baselines.shape[0]
+
+        # Order by time, baseline and band. The sort is
+        # stable, so duplicates remain in row order
+        order = np.lexsort((band, bl_idx, time_idx))
+        time_idx, bl_idx, band, rows = (time_idx[order],
+            bl_idx[order], band[order], rows[order])
+
+        # First row of each (time, baseline) and
+        # (time, baseline, band) cell
+        tbl = time_idx*nbl + bl_idx
+        cell = tbl*nbands + band
+
+        first_tbl = np.ones(rows.shape[0], dtype=np.bool_)
+        first_tbl[1:] = tbl[1:] != tbl[:-1]
+        first_cell = np.ones(rows.shape[0], dtype=np.bool_)
+        first_cell[1:] = cell[1:] != cell[:-1]
+
+        main_rows = np.full(ntime*nbl*nbands, -1, dtype=np.int64)
+        main_rows[cell[first_cell]] = rows[first_cell]
+        uvw_rows = np.full(ntime*nbl, -1, dtype=np.int64)
+        uvw_rows[tbl[first_tbl]] = rows[first_tbl]
+
+        return cls(main_rows, uvw_rows, times, baselines)
+
+    @classmethod
+    def from_table(cls, ms, ddesc, field_id, auto_correlations, nbands):
+        """
+        Create an index from the main table ``ms`` and
+        data description table ``ddesc``, selecting rows of
+        ``field_id``, and auto-correlations if requested.
+        """
+        field = ms.getcol('FIELD_ID')
+        antenna1 = ms.getcol('ANTENNA1')
+        antenna2 = ms.getcol('ANTENNA2')
+
+        selected = field == field_id
+
+        if not auto_correlations:
+            selected &= antenna1 != antenna2
+
+        rows = np.flatnonzero(selected)
+        spw = ddesc.getcol('SPECTRAL_WINDOW_ID')
+        band = spw[ms.getcol('DATA_DESC_ID')[rows]]
+
+        return cls.from_columns(ms.getcol('TIME')[rows],
+            antenna1[rows], antenna2[rows], band, rows, nbands)
+
+    def save(self, path, key):
+        """ Save the index to ``path``, identified by ``key`` """
+        with open(path, 'wb') as f:
+            np.savez(f, key=np.array(key),
+                main_rows=self.main_rows, uvw_rows=self.uvw_rows,
+                times=self.times, baselines=self.baselines)
+
+    @classmethod
+    def load(cls, path, key):
+        """
+        Load the index saved in ``path``.
+        Returns None if it is missing, or not identified by ``key``.
+        """
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as index:
+            if index['key'].tolist() != list(key):
+                return None
+
+            return cls(index['main_rows'], index['uvw_rows'],
+                index['times'], index['baselines'])
+
+def ms_row_index(msname, ms, ddesc, field_id, auto_correlations, nbands):
+    """
+    Returns the :class:`MSRowIndex` of the Measurement Set ``msname``,
+    loading it from the file next to the Measurement Set if it is
+    up to date, otherwise creating and saving it.
+    """
+    path = row_index_path(msname)
+    key = [str(v) for v in (ROW_INDEX_VERSION, table_mtime(msname),
+        ms.nrows(), field_id, auto_correlations, nbands)]
+
+    try:
+        index = MSRowIndex.load(path, key)
+    except Exception as e:
+        montblanc.log.warn("Ignoring unreadable row index "
+            "'{p}': {e}".format(p=path, e=e))
+        index = None
+
+    if index is not None:
+        montblanc.log.info("Loaded row index '{p}'.".format(p=path))
+        return index
+
+    index = MSRowIndex.from_table(ms, ddesc, field_id,
+        auto_correlations, nbands)
+
+    try:
+        index.save(path, key)
+    except (IOError, OSError) as e:
+        montblanc.log.warn("Unable to save row index "
+            "'{p}': {e}".format(p=path, e=e))
+    else:
+        montblanc.log.info("Saved row index '{p}'.".format(p=path))
+
+    return index
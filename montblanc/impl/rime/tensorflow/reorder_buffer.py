@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import threading
+
+class ReorderBuffer(object):
+    """
+    Delivers tiles completing in arbitrary order
+    in the order in which they were dispatched.
+
+    Tiles are placed in the delivery sequence with :meth:`register`
+    when dispatched. Once complete, a delivery function
+    for the tile is passed to :meth:`submit`. Delivery functions
+    are called serially, in sequence order, by whichever thread
+    submits the next tile in the sequence. Delivery functions
+    of later tiles are buffered until then.
+    A registered tile may be replaced by sub-tiles with :meth:`split`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._order = collections.deque()
+        self._pending = {}
+        self._registered = 0
+        self._delivering = False
+
+    def __len__(self):
+        """ Number of tiles buffered awaiting delivery """
+        with self._lock:
+            return len(self._pending)
+
+    def register(self, key):
+        """
+        Place the tile identified by ``key`` at the
+        end of the delivery sequence.
+
+        Returns
+        -------
+        int
+            The number of tiles previously registered
+        """
+        with self._lock:
+            self._order.append(key)
+            self._registered += 1
+            return self._registered - 1
+
+    def split(self, key, subkeys):
+        """
+        Replace the tile identified by ``key`` in the delivery
+        sequence with the tiles identified by ``subkeys``, which
+        are delivered in the given order.
+        """
+        with self._lock:
+            i = self._order.index(key)
+            self._order.rotate(-i)
+            self._order.popleft()
+            self._order.extendleft(reversed(list(subkeys)))
+            self._order.rotate(i)
+
+    def submit(self, key, fn):
+        """
+        Submit a delivery function for the tile identified by ``key``.
+        ``fn`` is called with no arguments once all previously
+        registered tiles have been delivered. This may happen
+        on the calling thread, or on the thread which submits
+        the tile preceding this one.
+        """
+        with self._lock:
+            self._pending[key] = fn
+
+            # Another thread is delivering and will
+            # pick up this tile if it is next in line
+            if self._delivering:
+                return
+
+            self._delivering = True
+
+        while True:
+            with self._lock:
+                if (len(self._order) == 0 or
+                        self._order[0] not in self._pending):
+                    self._delivering = False
+                    return
+
+                fn = self._pending.pop(self._order.popleft())
+
+            try:
+                fn()
+            except:
+                with self._lock:
+                    self._delivering = False
+                raise
+
+    def reset(self):
+        """ Discard all registered and pending tiles """
+        with self._lock:
+            self._order.clear()
+            self._pending.clear()
+            self._registered = 0
+            self._delivering = False
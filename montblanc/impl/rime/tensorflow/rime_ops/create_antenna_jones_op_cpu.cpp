@@ -76,6 +76,11 @@ REGISTER_OP("CreateAntennaJones")
     .Output("ant_jones: CT")
     .Attr("FT: {float, double} = DT_FLOAT")
     .Attr("CT: {complex64, complex128} = DT_COMPLEX64")
+    .Attr("have_ejones: bool = true")
+    .Doc(R"doc(Combines the brightness square root, complex phase,
+feed rotation and E term of each antenna. If have_ejones is false,
+the E term is the identity and ejones is not read, so an empty
+[0, 0, 0, 0, 4] tensor may be supplied.)doc")
     .SetShapeFn(ekb_shape_function);
 
 
@@ -19,9 +19,15 @@ typedef Eigen::ThreadPoolDevice CPUDevice;
 template <typename FT, typename CT>
 class CreateAntennaJones<CPUDevice, FT, CT> : public tensorflow::OpKernel
 {
+private:
+    bool have_ejones;
+
 public:
     explicit CreateAntennaJones(tensorflow::OpKernelConstruction * context) :
-        tensorflow::OpKernel(context) {}
+        tensorflow::OpKernel(context)
+    {
+        OP_REQUIRES_OK(context, context->GetAttr("have_ejones", &have_ejones));
+    }
 
     void Compute(tensorflow::OpKernelContext * context) override
     {
@@ -89,6 +95,16 @@ public:
                         const CT lkb2 = l2*kb0 + l3*kb2;
                         const CT lkb3 = l2*kb1 + l3*kb3;
 
+                        // An elided E term is the identity
+                        if(!have_ejones)
+                        {
+                            ant_jones(src, time, ant, chan, 0) = lkb0;
+                            ant_jones(src, time, ant, chan, 1) = lkb1;
+                            ant_jones(src, time, ant, chan, 2) = lkb2;
+                            ant_jones(src, time, ant, chan, 3) = lkb3;
+                            continue;
+                        }
+
                         // Reference ejones matrix
                         const CT & e0 = ejones(src, time, ant, chan, 0);
                         const CT & e1 = ejones(src, time, ant, chan, 1);
@@ -45,7 +45,8 @@ __global__ void rime_create_antenna_jones(
     const typename Traits::CT * feed_rotation,
     const typename Traits::CT * ejones,
     typename Traits::CT * ant_jones,
-    int nsrc, int ntime, int na, int nchan, int npol)
+    int nsrc, int ntime, int na, int nchan, int npol,
+    bool have_ejones)
 {
     using FT = typename Traits::FT;
     using CT = typename Traits::CT;
@@ -98,8 +99,16 @@ __global__ void rime_create_antenna_jones(
 
         montblanc::jones_multiply_4x4_in_place<FT>(L, cplx_phase);
 
-        // Load in the E Beam and multiply by LKB
         i = src_time_ant*npolchan + polchan;
+
+        // An elided E term is the identity
+        if(!have_ejones)
+        {
+            ant_jones[i] = L;
+            continue;
+        }
+
+        // Load in the E Beam and multiply by LKB
         CT E = ejones[i];
 
         montblanc::jones_multiply_4x4_in_place<FT>(E, L);
@@ -113,9 +122,15 @@ __global__ void rime_create_antenna_jones(
 template <typename FT, typename CT>
 class CreateAntennaJones<GPUDevice, FT, CT> : public tensorflow::OpKernel
 {
+private:
+    bool have_ejones;
+
 public:
     explicit CreateAntennaJones(tensorflow::OpKernelConstruction * context) :
-        tensorflow::OpKernel(context) {}
+        tensorflow::OpKernel(context)
+    {
+        OP_REQUIRES_OK(context, context->GetAttr("have_ejones", &have_ejones));
+    }
 
     void Compute(tensorflow::OpKernelContext * context) override
     {
@@ -175,7 +190,7 @@ public:
         // Call the rime_create_antenna_jones CUDA kernel
         rime_create_antenna_jones<Tr><<<grid, block, 0, device.stream()>>>(
             bsqrt, complex_phase, feed_rotation, ejones, ant_jones,
-            nsrc, ntime, na, nchan, npol);
+            nsrc, ntime, na, nchan, npol, have_ejones);
     }
 };
 
@@ -105,8 +105,22 @@ auto shape_function = [](InferenceContext* c) {
 
     ShapeHandle out_chi_squared = c->MakeShape({  });
 
+    bool have_residual;
+    TF_RETURN_IF_ERROR(c->GetAttr("have_residual", &have_residual));
+
+    // Residual visibilities have same shape as input visibilities,
+    // but are empty if not requested
+    ShapeHandle out_residual_vis = have_residual ?
+        c->MakeShape({
+            c->Dim(in_model_vis, 0),
+            c->Dim(in_model_vis, 1),
+            c->Dim(in_model_vis, 2),
+            c->Dim(in_model_vis, 3) }) :
+        c->MakeShape({ 0, 0, 0, 0 });
+
     c->set_output(0, out_final_vis);
     c->set_output(1, out_chi_squared);
+    c->set_output(2, out_residual_vis);
 
 
     // printf("output shape %s\\n", c->DebugString(out).c_str());;
@@ -126,9 +140,16 @@ REGISTER_OP("PostProcessVisibilities")
     .Input("observed_vis: CT")
     .Output("final_vis: CT")
     .Output("chi_squared: FT")
+    .Output("residual_vis: CT")
     .Attr("FT: {float, double} = DT_FLOAT")
     .Attr("CT: {complex64, complex128} = DT_COMPLEX64")
-    .Doc(R"doc(Post Processes Visibilities)doc")
+    .Attr("have_die: bool = true")
+    .Attr("have_residual: bool = true")
+    .Doc(R"doc(Post Processes Visibilities. If have_die is false,
+the direction independent effects are the identity and are not
+read, so an empty [0, 0, 0, 4] tensor may be supplied.
+If have_residual is false, residual visibilities are not
+computed and an empty [0, 0, 0, 0] tensor is output.)doc")
     .SetShapeFn(shape_function);
 
 
@@ -29,9 +29,17 @@ FT chi_squared_term(const CT & model_corr,
 template <typename FT, typename CT>
 class PostProcessVisibilities<CPUDevice, FT, CT> : public tensorflow::OpKernel
 {
+private:
+    bool have_die;
+    bool have_residual;
+
 public:
     explicit PostProcessVisibilities(tensorflow::OpKernelConstruction * context) :
-        tensorflow::OpKernel(context) {}
+        tensorflow::OpKernel(context)
+    {
+        OP_REQUIRES_OK(context, context->GetAttr("have_die", &have_die));
+        OP_REQUIRES_OK(context, context->GetAttr("have_residual", &have_residual));
+    }
 
     void Compute(tensorflow::OpKernelContext * context) override
     {
@@ -63,6 +71,13 @@ public:
         tf::TensorShape chi_squared_shape = tf::TensorShape({  });
         OP_REQUIRES_OK(context, context->allocate_output(
             1, chi_squared_shape, &chi_squared_ptr));
+        // Allocate space for output tensor 'residual_vis',
+        // which is empty unless requested
+        tf::Tensor * residual_vis_ptr = nullptr;
+        tf::TensorShape residual_vis_shape = have_residual ?
+            final_vis_shape : tf::TensorShape({ 0, 0, 0, 0 });
+        OP_REQUIRES_OK(context, context->allocate_output(
+            2, residual_vis_shape, &residual_vis_ptr));
 
         // Extract Eigen tensors
         auto antenna1 = in_antenna1.tensor<tensorflow::int32, 2>();
@@ -76,6 +91,7 @@ public:
 
         auto final_vis = final_vis_ptr->tensor<CT, 4>();
         auto chi_squared = chi_squared_ptr->tensor<FT, 0>();
+        auto residual_vis = residual_vis_ptr->tensor<CT, 4>();
 
         // Initialise a float to store the chi squared result,
         // needed for the OpenMP reduction below
@@ -97,29 +113,34 @@ public:
                     CT mv2 = model_vis(time, bl, chan, 2);
                     CT mv3 = model_vis(time, bl, chan, 3);
 
-                    // Reference direction_independent_effects for antenna 1
-                    const CT & a0 = direction_independent_effects(time, ant1, chan, 0);
-                    const CT & a1 = direction_independent_effects(time, ant1, chan, 1);
-                    const CT & a2 = direction_independent_effects(time, ant1, chan, 2);
-                    const CT & a3 = direction_independent_effects(time, ant1, chan, 3);
-
-                    // Multiply model visibilities by antenna 1 g
-                    CT r0 = a0*mv0 + a1*mv2;
-                    CT r1 = a0*mv1 + a1*mv3;
-                    CT r2 = a2*mv0 + a3*mv2;
-                    CT r3 = a2*mv1 + a3*mv3;
-
-                    // Conjugate transpose of antenna 2 g term
-                    CT b0 = std::conj(direction_independent_effects(time, ant2, chan, 0));
-                    CT b1 = std::conj(direction_independent_effects(time, ant2, chan, 2));
-                    CT b2 = std::conj(direction_independent_effects(time, ant2, chan, 1));
-                    CT b3 = std::conj(direction_independent_effects(time, ant2, chan, 3));
-
-                    // Multiply to produce model visibilities
-                    mv0 = r0*b0 + r1*b2;
-                    mv1 = r0*b1 + r1*b3;
-                    mv2 = r2*b0 + r3*b2;
-                    mv3 = r2*b1 + r3*b3;
+                    // Apply the direction independent effects,
+                    // unless elided as the identity
+                    if(have_die)
+                    {
+                        // Reference direction_independent_effects for antenna 1
+                        const CT & a0 = direction_independent_effects(time, ant1, chan, 0);
+                        const CT & a1 = direction_independent_effects(time, ant1, chan, 1);
+                        const CT & a2 = direction_independent_effects(time, ant1, chan, 2);
+                        const CT & a3 = direction_independent_effects(time, ant1, chan, 3);
+
+                        // Multiply model visibilities by antenna 1 g
+                        CT r0 = a0*mv0 + a1*mv2;
+                        CT r1 = a0*mv1 + a1*mv3;
+                        CT r2 = a2*mv0 + a3*mv2;
+                        CT r3 = a2*mv1 + a3*mv3;
+
+                        // Conjugate transpose of antenna 2 g term
+                        CT b0 = std::conj(direction_independent_effects(time, ant2, chan, 0));
+                        CT b1 = std::conj(direction_independent_effects(time, ant2, chan, 2));
+                        CT b2 = std::conj(direction_independent_effects(time, ant2, chan, 1));
+                        CT b3 = std::conj(direction_independent_effects(time, ant2, chan, 3));
+
+                        // Multiply to produce model visibilities
+                        mv0 = r0*b0 + r1*b2;
+                        mv1 = r0*b1 + r1*b3;
+                        mv2 = r2*b0 + r3*b2;
+                        mv3 = r2*b1 + r3*b3;
+                    }
 
                     // Add base visibilities
                     mv0 += base_vis(time, bl, chan, 0);
@@ -144,6 +165,15 @@ public:
                     const CT & ov2 = observed_vis(time, bl, chan, 2);
                     const CT & ov3 = observed_vis(time, bl, chan, 3);
 
+                    // Write out residual visibilities, zeroed if flagged
+                    if(have_residual)
+                    {
+                        residual_vis(time, bl, chan, 0) = f0 ? CT(0) : ov0 - mv0;
+                        residual_vis(time, bl, chan, 1) = f1 ? CT(0) : ov1 - mv1;
+                        residual_vis(time, bl, chan, 2) = f2 ? CT(0) : ov2 - mv2;
+                        residual_vis(time, bl, chan, 3) = f3 ? CT(0) : ov3 - mv3;
+                    }
+
                     // Weights
                     const FT & w0 = weight(time, bl, chan, 0);
                     const FT & w1 = weight(time, bl, chan, 1);
@@ -52,8 +52,10 @@ __global__ void rime_post_process_visibilities(
     const typename Traits::vis_type * in_model_vis,
     const typename Traits::vis_type * in_observed_vis,
     typename Traits::vis_type * out_final_vis,
+    typename Traits::vis_type * out_residual_vis,
     typename Traits::FT * out_chi_squared_terms,
-    int ntime, int nbl, int na, int npolchan)
+    int ntime, int nbl, int na, int npolchan,
+    bool have_die, bool have_residual)
 
 {
     // Simpler float and complex types
@@ -86,21 +88,26 @@ __global__ void rime_post_process_visibilities(
     // Flag multiplier used to zero flagged visibility points
     FT flag_mul = FT(in_flag[i] == 0);
 
-    // Multiply the visibility by antenna 1's g term
-    i = (time*na + ant1)*npolchan + polchan;
-    CT ant1_die = in_die[i];
-    montblanc::jones_multiply_4x4_in_place<FT>(
-        ant1_die, model_vis);
-
-    // Shift result
-    model_vis.x = ant1_die.x;
-    model_vis.y = ant1_die.y;
-
-    // Multiply the visibility by antenna 2's g term
-    i = (time*na + ant2)*npolchan + polchan;
-    CT ant2_die = in_die[i];
-    montblanc::jones_multiply_4x4_hermitian_transpose_in_place<FT>(
-        model_vis, ant2_die);
+    // Apply the direction independent effects,
+    // unless elided as the identity
+    if(have_die)
+    {
+        // Multiply the visibility by antenna 1's g term
+        i = (time*na + ant1)*npolchan + polchan;
+        CT ant1_die = in_die[i];
+        montblanc::jones_multiply_4x4_in_place<FT>(
+            ant1_die, model_vis);
+
+        // Shift result
+        model_vis.x = ant1_die.x;
+        model_vis.y = ant1_die.y;
+
+        // Multiply the visibility by antenna 2's g term
+        i = (time*na + ant2)*npolchan + polchan;
+        CT ant2_die = in_die[i];
+        montblanc::jones_multiply_4x4_hermitian_transpose_in_place<FT>(
+            model_vis, ant2_die);
+    }
 
     // Add any base visibilities
     model_vis.x += base_vis.x;
@@ -116,9 +123,15 @@ __global__ void rime_post_process_visibilities(
     // Zero flagged visibilities
     model_vis.x *= flag_mul;
     model_vis.y *= flag_mul;
+    diff_vis.x *= flag_mul;
+    diff_vis.y *= flag_mul;
 
     i = (time*nbl + bl)*npolchan + polchan;
     out_final_vis[i] = model_vis;
+
+    if(have_residual)
+        { out_residual_vis[i] = diff_vis; }
+
     out_chi_squared_terms[i] = chi_squared_term;
 }
 
@@ -126,9 +139,17 @@ __global__ void rime_post_process_visibilities(
 template <typename FT, typename CT>
 class PostProcessVisibilities<GPUDevice, FT, CT> : public tensorflow::OpKernel
 {
+private:
+    bool have_die;
+    bool have_residual;
+
 public:
     explicit PostProcessVisibilities(tensorflow::OpKernelConstruction * context) :
-        tensorflow::OpKernel(context) {}
+        tensorflow::OpKernel(context)
+    {
+        OP_REQUIRES_OK(context, context->GetAttr("have_die", &have_die));
+        OP_REQUIRES_OK(context, context->GetAttr("have_residual", &have_residual));
+    }
 
     void Compute(tensorflow::OpKernelContext * context) override
     {
@@ -167,6 +188,14 @@ public:
         OP_REQUIRES_OK(context, context->allocate_output(
             1, chi_squared_shape, &chi_squared_ptr));
 
+        // Allocate space for output tensor 'residual_vis',
+        // which is empty unless requested
+        tf::Tensor * residual_vis_ptr = nullptr;
+        tf::TensorShape residual_vis_shape = have_residual ?
+            final_vis_shape : tf::TensorShape({ 0, 0, 0, 0 });
+        OP_REQUIRES_OK(context, context->allocate_output(
+            2, residual_vis_shape, &residual_vis_ptr));
+
         // Get pointers to flattened tensor data buffers
         typedef montblanc::kernel_traits<FT> Tr;
 
@@ -189,6 +218,8 @@ public:
         auto fout_final_vis = reinterpret_cast<typename Tr::vis_type *>(
             final_vis_ptr->flat<CT>().data());
         auto fout_chi_squared = chi_squared_ptr->flat<FT>().data();
+        auto fout_residual_vis = reinterpret_cast<typename Tr::vis_type *>(
+            residual_vis_ptr->flat<CT>().data());
 
         // Get the GPU device
         const auto & device = context->eigen_device<GPUDevice>();
@@ -245,8 +276,10 @@ public:
                 fin_model_vis,
                 fin_observed_vis,
                 fout_final_vis,
+                fout_residual_vis,
                 fout_chi_squared_terms,
-                ntime, nbl, na, npolchan);
+                ntime, nbl, na, npolchan,
+                have_die, have_residual);
 
         // Perform a reduction on the chi squared terms
         tf::uint8 * temp_storage_ptr = temp_storage.flat<tf::uint8>().data();
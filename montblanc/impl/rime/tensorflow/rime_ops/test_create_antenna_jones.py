@@ -98,5 +98,34 @@ class TestCreateAntennaJones(unittest.TestCase):
             for gpu_aj in S.run(gpu_ops):
                 self.assertTrue(np.allclose(cpu_aj, gpu_aj))
 
+    def test_elided_ejones(self):
+        """ Tests that an elided E term is the identity """
+        FT, CT = np.float64, np.complex128
+        rf = lambda *s: np.random.random(size=s).astype(FT)
+        rc = lambda *s: (rf(*s) + rf(*s) * 1j).astype(CT)
+
+        nsrc, ntime, na, nchan, npol = 10, 20, 7, 16, 4
+
+        bsqrt = tf.constant(rc(nsrc, ntime, nchan, npol))
+        complex_phase = tf.constant(rc(nsrc, ntime, na, nchan))
+        feed_rotation = tf.constant(rc(ntime, na, npol))
+        identity = np.empty((nsrc, ntime, na, nchan, npol), dtype=CT)
+        identity[:] = [1, 0, 0, 1]
+        empty = tf.zeros((0, 0, 0, 0, npol), dtype=CT)
+
+        def _pin_ops(device):
+            """ Pin full and elided operations to device """
+            with tf.device(device):
+                return (self.rime.create_antenna_jones(bsqrt, complex_phase,
+                            feed_rotation, tf.constant(identity), FT=FT),
+                        self.rime.create_antenna_jones(bsqrt, complex_phase,
+                            feed_rotation, empty, FT=FT, have_ejones=False))
+
+        ops = [_pin_ops(d) for d in ['/cpu:0'] + self.gpu_devs]
+
+        with tf.Session() as S:
+            for full_aj, elided_aj in S.run(ops):
+                self.assertTrue(np.allclose(full_aj, elided_aj))
+
 if __name__ == "__main__":
     unittest.main()
@@ -78,13 +78,103 @@ class TestPostProcessVisibilities(unittest.TestCase):
         with tf.Session() as S:
             S.run(init_op)
 
-            # Get the CPU visiblities and chi squared
-            cpu_vis, cpu_X2 = S.run(cpu_op)
-
-            # Compare against the gpu visibilities and chi squared values
-            for gpu_vis, gpu_X2 in S.run(gpu_ops):
+            # Get the CPU visiblities, chi squared and residuals
+            cpu_vis, cpu_X2, cpu_res = S.run(cpu_op)
+
+            # Residuals are the difference between observed and
+            # model visibilities, zeroed where flagged
+            unflagged = flag == 0
+            self.assertTrue(np.allclose(cpu_res[~unflagged], 0))
+            self.assertTrue(np.allclose(cpu_res[unflagged],
+                (observed_vis - cpu_vis)[unflagged]))
+
+            # Chi squared is the weighted sum of squared residuals
+            self.assertTrue(np.allclose(cpu_X2,
+                (weight*np.abs(cpu_res)**2).sum(), rtol=1e-3))
+
+            # Compare against the gpu visibilities, chi squared
+            # and residual values
+            for gpu_vis, gpu_X2, gpu_res in S.run(gpu_ops):
                 self.assertTrue(np.allclose(cpu_vis, gpu_vis))
                 self.assertTrue(np.allclose(cpu_X2, gpu_X2))
+                self.assertTrue(np.allclose(cpu_res, gpu_res))
+
+    def test_elided_die(self):
+        """ Test that elided direction independent effects are the identity """
+        FT, CT = np.float64, np.complex128
+        ntime, nbl, na, nchan = 10, 21, 7, 16
+
+        rf = lambda *a, **kw: np.random.random(*a, **kw).astype(FT)
+        rc = lambda *a, **kw: rf(*a, **kw) + 1j*rf(*a, **kw).astype(CT)
+
+        antenna1 = np.random.randint(low=0, high=na,
+            size=[ntime, nbl]).astype(np.int32)
+        antenna2 = np.random.randint(low=0, high=na,
+            size=[ntime, nbl]).astype(np.int32)
+        identity = np.empty([ntime, na, nchan, 4], dtype=CT)
+        identity[:] = [1, 0, 0, 1]
+        flag = np.random.randint(low=0, high=2,
+            size=[ntime, nbl, nchan, 4]).astype(np.uint8)
+        weight = rf(size=[ntime, nbl, nchan, 4])
+        base_vis = rc(size=[ntime, nbl, nchan, 4])
+        model_vis = rc(size=[ntime, nbl, nchan, 4])
+        observed_vis = rc(size=[ntime, nbl, nchan, 4])
+
+        args = [tf.constant(a) for a in (antenna1, antenna2)]
+        vis_args = [tf.constant(a) for a in (flag, weight,
+            base_vis, model_vis, observed_vis)]
+        empty = tf.zeros([0, 0, 0, 4], dtype=CT)
+
+        def _pin_ops(device):
+            """ Pin full and elided operations to device """
+            with tf.device(device):
+                return (self.rime.post_process_visibilities(*(args +
+                            [tf.constant(identity)] + vis_args)),
+                        self.rime.post_process_visibilities(*(args +
+                            [empty] + vis_args), have_die=False))
+
+        ops = [_pin_ops(d) for d in ['/cpu:0'] + self.gpu_devs]
+
+        with tf.Session() as S:
+            for full, elided in S.run(ops):
+                for f, e in zip(full, elided):
+                    self.assertTrue(np.allclose(f, e))
+
+    def test_no_residual(self):
+        """ Test that residuals are empty when not requested """
+        FT, CT = np.float64, np.complex128
+        ntime, nbl, na, nchan = 10, 21, 7, 16
+
+        rf = lambda *a, **kw: np.random.random(*a, **kw).astype(FT)
+        rc = lambda *a, **kw: rf(*a, **kw) + 1j*rf(*a, **kw).astype(CT)
+
+        args = [tf.constant(a) for a in (
+            np.random.randint(low=0, high=na,
+                size=[ntime, nbl]).astype(np.int32),
+            np.random.randint(low=0, high=na,
+                size=[ntime, nbl]).astype(np.int32),
+            rc(size=[ntime, na, nchan, 4]),
+            np.random.randint(low=0, high=2,
+                size=[ntime, nbl, nchan, 4]).astype(np.uint8),
+            rf(size=[ntime, nbl, nchan, 4]),
+            rc(size=[ntime, nbl, nchan, 4]),
+            rc(size=[ntime, nbl, nchan, 4]),
+            rc(size=[ntime, nbl, nchan, 4]))]
+
+        def _pin_ops(device):
+            """ Pin operations with and without residuals to device """
+            with tf.device(device):
+                return (self.rime.post_process_visibilities(*args),
+                        self.rime.post_process_visibilities(*args,
+                            have_residual=False))
+
+        ops = [_pin_ops(d) for d in ['/cpu:0'] + self.gpu_devs]
+
+        with tf.Session() as S:
+            for full, no_res in S.run(ops):
+                self.assertTrue(np.allclose(full[0], no_res[0]))
+                self.assertTrue(np.allclose(full[1], no_res[1]))
+                self.assertEqual(no_res[2].shape, (0, 0, 0, 0))
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import threading
+
+class ShardScheduler(object):
+    """
+    Selects the shard on which a tile of the problem is computed.
+
+    Keeps track of the number of tiles, and the amount of work
+    (measured in tile size) waiting on each shard. Subclasses
+    implement :meth:`_select` to choose a shard from this state.
+    """
+    def __init__(self, shards):
+        """
+        Parameters
+        ----------
+        shards : list of int
+            Shard identifiers, in the order in which they
+            should be preferred when no other information
+            distinguishes them.
+        """
+        self._lock = threading.Lock()
+        self._shards = list(shards)
+        self._inputs_waiting = { s: 0 for s in self._shards }
+        self._work_waiting = { s: 0 for s in self._shards }
+
+    def dispatch(self, tile_size):
+        """
+        Select a shard for a tile of size ``tile_size`` and
+        record that the tile is waiting on it.
+
+        Returns
+        -------
+        int
+            The selected shard
+        """
+        with self._lock:
+            shard = self._select(tile_size)
+            self._inputs_waiting[shard] += 1
+            self._work_waiting[shard] += tile_size
+            return shard
+
+    def completed(self, shard, tile_size, elapsed):
+        """
+        Record that a tile of size ``tile_size`` completed
+        on ``shard`` in ``elapsed`` seconds. ``elapsed`` should
+        only cover the computation of the tile, excluding
+        any wait on its inputs, so that rates measure the
+        throughput of the shard rather than feed latency.
+        """
+        with self._lock:
+            self._inputs_waiting[shard] -= 1
+            self._work_waiting[shard] -= tile_size
+            self._update(shard, tile_size, elapsed)
+
+    def cancelled(self, shard, tile_size):
+        """
+        Record that a tile of size ``tile_size`` dispatched
+        to ``shard`` will not complete. Scheduling
+        statistics are not updated.
+        """
+        with self._lock:
+            self._inputs_waiting[shard] -= 1
+            self._work_waiting[shard] -= tile_size
+
+    def inputs_waiting(self):
+        """ Returns a copy of the number of tiles waiting on each shard """
+        with self._lock:
+            return self._inputs_waiting.copy()
+
+    def _select(self, tile_size):
+        """ Select a shard. Called with the lock held """
+        raise NotImplementedError()
+
+    def _update(self, shard, tile_size, elapsed):
+        """ Update scheduling statistics. Called with the lock held """
+        pass
+
+class RoundRobinShardScheduler(ShardScheduler):
+    """ Cycles through shards in order, ignoring their load """
+    def __init__(self, shards):
+        super(RoundRobinShardScheduler, self).__init__(shards)
+        self._which_shard = itertools.cycle(self._shards)
+
+    def _select(self, tile_size):
+        return next(self._which_shard)
+
+class LeastQueuedShardScheduler(ShardScheduler):
+    """
+    Selects the shard with the fewest tiles waiting on it.
+    Ties are broken in round-robin fashion.
+    """
+    def __init__(self, shards):
+        super(LeastQueuedShardScheduler, self).__init__(shards)
+        self._next = 0
+
+    def _rotated(self):
+        """ Shards, starting from the one after the previous selection """
+        n = self._next
+        return self._shards[n:] + self._shards[:n]
+
+    def _select(self, tile_size):
+        shard = min(self._rotated(), key=self._inputs_waiting.__getitem__)
+        self._next = (self._shards.index(shard) + 1) % len(self._shards)
+        return shard
+
+class CostWeightedShardScheduler(LeastQueuedShardScheduler):
+    """
+    Selects the shard predicted to finish the tile first.
+
+    An exponentially weighted moving average of the seconds
+    taken per unit of tile size is maintained for each shard.
+    The predicted completion time of a tile on a shard is the
+    work already waiting on the shard, plus the tile itself,
+    multiplied by the shard's rate.
+    Shards without measurements are assigned the mean rate
+    of measured shards.
+    """
+    def __init__(self, shards, smoothing=0.25):
+        super(CostWeightedShardScheduler, self).__init__(shards)
+        self._smoothing = smoothing
+        self._rates = { s: None for s in self._shards }
+
+    def _select(self, tile_size):
+        measured = [r for r in self._rates.values() if r is not None]
+
+        # Nothing measured yet, fall back to the queue length
+        if len(measured) == 0:
+            return super(CostWeightedShardScheduler, self)._select(tile_size)
+
+        default_rate = sum(measured) / len(measured)
+
+        def _predicted(shard):
+            rate = self._rates[shard]
+            rate = default_rate if rate is None else rate
+            return (self._work_waiting[shard] + tile_size)*rate
+
+        shard = min(self._rotated(), key=_predicted)
+        self._next = (self._shards.index(shard) + 1) % len(self._shards)
+        return shard
+
+    def _update(self, shard, tile_size, elapsed):
+        if tile_size <= 0:
+            return
+
+        rate = float(elapsed) / tile_size
+        previous = self._rates[shard]
+
+        self._rates[shard] = (rate if previous is None else
+            self._smoothing*rate + (1.0 - self._smoothing)*previous)
+
+SHARD_SCHEDULERS = {
+    'round_robin': RoundRobinShardScheduler,
+    'least_queued': LeastQueuedShardScheduler,
+    'cost_weighted': CostWeightedShardScheduler,
+}
+
+def create_shard_scheduler(name, shards):
+    """
+    Create a shard scheduler
+
+    Parameters
+    ----------
+    name : str
+        Scheduling policy. One of 'round_robin',
+        'least_queued' or 'cost_weighted'.
+    shards : list of int
+        Shard identifiers in order of preference
+
+    Returns
+    -------
+    :class:`ShardScheduler`
+    """
+    try:
+        return SHARD_SCHEDULERS[name](shards)
+    except KeyError:
+        raise ValueError("Invalid shard scheduler '{n}'. "
+            "Valid schedulers are '{v}'".format(
+                n=name, v=list(SHARD_SCHEDULERS.keys())))
@@ -24,6 +24,8 @@ import montblanc
 
 from montblanc.impl.rime.tensorflow.sinks.sink_provider import SinkProvider
 import montblanc.impl.rime.tensorflow.ms.ms_manager as MS
+from montblanc.impl.rime.tensorflow.ms.coalescing_writer import (
+    CoalescingWriter, TableWrite)
 
 class MSSinkProvider(SinkProvider):
     """
@@ -31,7 +33,8 @@ class MSSinkProvider(SinkProvider):
     montblanc
     """
 
-    def __init__(self, manager, vis_column=None):
+    def __init__(self, manager, vis_column=None, residual_column=None,
+            write_queue_size=8, physical_order=False):
         """
         Constructs an MSSinkProvider object
 
@@ -42,18 +45,76 @@ class MSSinkProvider(SinkProvider):
             the Measurement Set.
         vis_column: str
             Column to which model visibilities will be read
+        residual_column: str
+            Column to which residual visibilities will be written.
+            If None, residual visibilities are not written.
+        write_queue_size: int
+            Number of tiles queued for writing on a background
+            thread. Adjacent tiles waiting in the queue are
+            written together. If 0, tiles are written on the
+            thread supplying the sink.
+        physical_order: bool
+            Write the rows of each batch of tiles in the order
+            in which they are stored in the Measurement Set,
+            rather than in time and baseline order.
         """
 
         self._manager = manager
         self._name = "Measurement Set '{ms}'".format(ms=manager.msname)
         self._vis_column = ('CORRECTED_DATA' if vis_column is None else vis_column)
+        self._residual_column = residual_column
+        self._write_queue_size = write_queue_size
+
+        # Rows of the solution are mapped to main table rows,
+        # skipping any missing from the Measurement Set. The
+        # main table is shared with the manager's readers
+        self._writer = CoalescingWriter(manager.main_table,
+            max(write_queue_size, 1),
+            row_numbers=manager.main_row_numbers,
+            physical_order=physical_order,
+            table_lock=manager.main_table_lock)
 
     def name(self):
         return self._name
 
+    def start(self, start_context):
+        """ Start writing tiles on a background thread """
+        if self._write_queue_size > 0:
+            self._writer.start()
+
+    def stop(self, stop_context):
+        """ Write all queued tiles and stop the background thread """
+        self._writer.stop()
+
+        stats = self._writer.stats()
+        montblanc.log.info("Wrote '{w}' tiles to {n} in '{m}' writes."
+            .format(w=stats['writes'], n=self._name,
+                m=stats['merged_writes']))
+
+    def sinks(self):
+        sinks = super(MSSinkProvider, self).sinks()
+
+        # Don't request residuals from the solver
+        # if there's no column to write them to
+        if self._residual_column is None:
+            sinks = { n: s for n, s in sinks.items() if n != 'residual_vis' }
+
+        return sinks
+
+    def sink_inputs(self):
+        """ Sinks don't read any inputs """
+        return { n: () for n in self.sinks() }
+
     def model_vis(self, context):
         """ model visibility data sink """
-        column = self._vis_column
+        self._put_vis(self._vis_column, context)
+
+    def residual_vis(self, context):
+        """ residual visibility data sink """
+        self._put_vis(self._residual_column, context)
+
+    def _put_vis(self, column, context):
+        """ Write visibilities in context to column """
         msshape = None
 
         # Do we have a column descriptor for the supplied column?
@@ -79,11 +140,20 @@ class MSSinkProvider(SinkProvider):
 
             msshape = [-1] + guessed_shape
 
-        lrow, urow = MS.row_extents(context)
+        rows, channels = MS.main_row_selection(context)
+
+        if channels is None:
+            blc, trc = None, None
+        else:
+            # Write the channels of the tile within each row
+            lc, uc = channels
+            npol = context.dim_global_size('npol')
+            msshape = [-1, uc - lc] + msshape[2:]
+            blc, trc = (lc, 0), (uc-1, npol-1)
 
-        self._manager.ordered_main_table.putcol(column,
-            context.data.reshape(msshape),
-            startrow=lrow, nrow=urow-lrow)
+        self._writer.put(TableWrite(column, rows['startrow'],
+            rows['nrow'], rows['rowincr'], blc, trc,
+            context.data.reshape(msshape)))
 
     def __str__(self):
         return self.__class__.__name__
@@ -27,6 +27,10 @@ class NullSinkProvider(SinkProvider):
     def name(self):
         return "Null"
 
+    def sink_inputs(self):
+        """ Sinks don't read any inputs """
+        return { n: () for n in self.sinks() }
+
     def model_vis(self, context):
         array_schema = context.array(context.name)
         slices = context.slice_index(*array_schema.shape)
@@ -41,5 +45,12 @@ class NullSinkProvider(SinkProvider):
         montblanc.log.info("Received '{n}[{sl}]"
             .format(n=context.name, sl=slice_str))
 
+    def residual_vis(self, context):
+        array_schema = context.array(context.name)
+        slices = context.slice_index(*array_schema.shape)
+        slice_str = ','.join('%s:%s' % (s.start, s.stop) for s in slices)
+        montblanc.log.info("Received '{n}[{sl}]"
+            .format(n=context.name, sl=slice_str))
+
     def __str__(self):
         return self.__class__.__name__
\ No newline at end of file
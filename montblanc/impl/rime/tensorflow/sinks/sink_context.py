@@ -144,6 +144,9 @@ class SinkContext(object):
                 ant2 = context.input["antenna2"]
                 model_vis = context.data
 
+        Only the inputs declared by
+        :py:meth:`SinkProvider.sink_inputs` are present, if the
+        sinks of all consumed outputs declare their inputs.
         """
         return self._input_cache
 
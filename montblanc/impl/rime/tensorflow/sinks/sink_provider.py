@@ -50,6 +50,17 @@ class AbstractSinkProvider(object):
         """ Returns a dictionary of sink methods, keyed on sink name """
         raise NotImplementedError()
 
+    def ordered(self):
+        """ Returns True if sink methods require tiles in order """
+        raise NotImplementedError()
+
+    def sink_inputs(self):
+        """
+        Returns a dictionary of the input arrays each
+        sink method reads, keyed on sink name
+        """
+        raise NotImplementedError()
+
 def find_sinks(obj):
     """
     Returns a dictionary of sink methods found on this object,
@@ -119,6 +130,35 @@ class SinkProvider(AbstractSinkProvider):
 
         return self._sinks
 
+    def ordered(self):
+        """
+        Returns True if the sink methods on this provider
+        should receive tiles in the order in which they were
+        dispatched to the solver, one at a time.
+
+        Otherwise, sink methods receive tiles as soon as they
+        are ready and may be called concurrently from multiple
+        consumer threads. Defaults to False.
+        """
+        return False
+
+    def sink_inputs(self):
+        """
+        Returns a dictionary of the names of the input arrays that
+        each sink method reads through :py:obj:`SinkContext.input`,
+        keyed on sink name. For example:
+
+        .. code-block:: python
+
+            def sink_inputs(self):
+                return { 'model_vis': ('antenna1', 'antenna2') }
+
+        The solver only retains these inputs for tiles in flight.
+        Sink methods missing from the dictionary may read any input,
+        and all inputs are retained. Defaults to an empty dictionary.
+        """
+        return {}
+
     def __str__(self):
         return self.name()
 
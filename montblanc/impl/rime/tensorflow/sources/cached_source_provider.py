@@ -20,9 +20,13 @@
 
 import collections
 import functools
+import sys
 import threading
 import types
 
+import six
+from six.moves import collections_abc
+
 import montblanc
 from .source_provider import SourceProvider
 
@@ -41,20 +45,19 @@ def _cache(method):
     def memoizer(self, context):
         # Construct the key for the given index
         idx = context.array_extents(context.name)
-        key = tuple(i for t in idx for i in t)
-
-        with self._lock:
-            # Access the sub-cache for this data source
-            array_cache = self._cache[context.name]
+        key = (context.name,) + tuple(i for t in idx for i in t)
 
-            # Cache miss, call the data source
-            if key not in array_cache:
-                array_cache[key] = method(context)
-
-            return array_cache[key]
+        return self._get(key, method, context)
 
     return memoizer
 
+class _Load(object):
+    """ A data source call in progress, awaited by duplicate misses """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.exc_info = None
+
 def _proxy(method):
     """
     Decorator returning a method that proxies a data source.
@@ -68,9 +71,15 @@ def _proxy(method):
 class CachedSourceProvider(SourceProvider):
     """
     Caches calls to data_sources on the listed providers
+
+    Data sources are called without holding any lock, so that
+    misses on different keys are evaluated concurrently.
+    Concurrent misses on the same key wait for a single call
+    of the data source. Least recently used entries are
+    evicted once the cache exceeds a byte budget.
     """
     def __init__(self, providers, cache_data_sources=None,
-                clear_start=False, clear_stop=False):
+                clear_start=False, clear_stop=False, max_bytes=None):
         """
         Parameters
         ----------
@@ -83,12 +92,22 @@ class CachedSourceProvider(SourceProvider):
             clear cache on start
         clear_stop: bool
             clear cache on stop
+        max_bytes: int
+            Maximum number of bytes held by the cache.
+            (Defaults to None in which case the cache is unbounded)
         """
-        if not isinstance(providers, collections.Sequence):
+        if not isinstance(providers, collections_abc.Sequence):
             providers = [providers]
 
-        self._cache = collections.defaultdict(dict)
+        self._cache = collections.OrderedDict()
+        self._loads = {}
         self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._evictions = 0
         self._clear_start = clear_start
         self._clear_stop = clear_stop
         self._providers = providers
@@ -150,15 +169,126 @@ class CachedSourceProvider(SourceProvider):
         return [d for p in self._providers
                   for d in p.updated_dimensions()]
 
+    def dependencies(self):
+        """ Merge the dependencies of the providers """
+        return { n: d for p in self._providers
+                      for n, d in p.dependencies().items() }
+
+    def versions(self):
+        """ Merge the version tokens of the providers """
+        return { n: v for p in self._providers
+                      for n, v in p.versions().items() }
+
+    def fingerprint(self):
+        """ Combine the fingerprints of the providers, if all are known """
+        fingerprints = [p.fingerprint() for p in self._providers]
+
+        if any(f is None for f in fingerprints):
+            return None
+
+        return ';'.join(fingerprints)
+
+    def thread_safe(self):
+        """ Thread safe if all the providers are """
+        return all(p.thread_safe() for p in self._providers)
+
     def name(self):
         sub_prov_names = ', '.join([p.name() for p in self._providers])
         return 'Cache({})'.format(sub_prov_names)
 
+    def _get(self, key, method, context):
+        """
+        Return the cached value for ``key``, calling
+        ``method(context)`` on a miss
+        """
+        with self._lock:
+            try:
+                value = self._cache.pop(key)
+            except KeyError:
+                pass
+            else:
+                # Most recently used entries are last
+                self._cache[key] = value
+                self._hits += 1
+                return value
+
+            # Another thread is calling the data source for this key
+            load = self._loads.get(key, None)
+
+            if load is None:
+                load = self._loads[key] = _Load()
+                self._misses += 1
+                loading = True
+            else:
+                self._waits += 1
+                loading = False
+
+        if not loading:
+            load.event.wait()
+
+            if load.exc_info is not None:
+                six.reraise(*load.exc_info)
+
+            return load.value
+
+        try:
+            load.value = method(context)
+        except:
+            load.exc_info = sys.exc_info()
+            raise
+        else:
+            self._insert(key, load.value)
+        finally:
+            with self._lock:
+                del self._loads[key]
+
+            load.event.set()
+
+        return load.value
+
+    def _insert(self, key, value):
+        """ Insert a value, evicting least recently used entries """
+        nbytes = getattr(value, 'nbytes', 0)
+
+        with self._lock:
+            # Don't cache values exceeding the budget
+            if self._max_bytes is not None and nbytes > self._max_bytes:
+                return
+
+            self._cache[key] = value
+            self._nbytes += nbytes
+
+            while (self._max_bytes is not None and
+                    self._nbytes > self._max_bytes):
+                k, v = self._cache.popitem(last=False)
+                self._nbytes -= getattr(v, 'nbytes', 0)
+                self._evictions += 1
+
     def clear_cache(self):
         with self._lock:
             self._cache.clear()
+            self._nbytes = 0
 
     def cache_size(self):
+        """ Number of bytes held by the cache """
+        with self._lock:
+            return self._nbytes
+
+    def cache_stats(self):
+        """
+        Returns a dictionary of cache statistics:
+
+        - hits: Calls served from the cache
+        - misses: Calls that called a data source
+        - waits: Calls that waited on another call of a data source
+        - evictions: Entries evicted to satisfy the byte budget
+        - entries: Number of cached entries
+        - nbytes: Number of bytes held by the cache
+        """
         with self._lock:
-            return sum(a.nbytes for k, v in list(self._cache.items())
-                                for a in list(v.values()))
\ No newline at end of file
+            return { 'hits': self._hits,
+                'misses': self._misses,
+                'waits': self._waits,
+                'evictions': self._evictions,
+                'entries': len(self._cache),
+                'nbytes': self._nbytes }
\ No newline at end of file
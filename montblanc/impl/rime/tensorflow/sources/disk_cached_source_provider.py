@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import types
+
+import numpy as np
+from six.moves import collections_abc
+
+import montblanc
+from .source_provider import SourceProvider
+
+MANIFEST = 'manifest.json'
+
+# Subdirectory of cache_dir owned by the provider
+ENTRY_DIR = 'montblanc-disk-cache'
+
+# Names of the files the provider creates
+ENTRY_FILE_RE = re.compile(r'^[0-9a-f]{32}\.npy$|\.tmp$')
+
+# Unlisted files younger than this may belong to another process
+STALE_SECONDS = 3600
+
+def _disk_cache(method, provider):
+    """
+    Decorator caching data source return values on disk.
+    Entries are keyed on the name of the provider supplying
+    the data source, the array name, the array extents and
+    the requested shape and dtype.
+    """
+
+    @functools.wraps(method)
+    def memoizer(self, context):
+        extents = [list(map(int, t)) for t
+            in context.array_extents(context.name)]
+        shape = [int(s) for s in context.shape]
+        dtype = np.dtype(context.dtype).str
+        fingerprint = self._fingerprint(provider, context.name)
+
+        return self._get(provider.name(), context.name,
+            [extents, shape, dtype], fingerprint, method, context)
+
+    return memoizer
+
+def _proxy(method):
+    """
+    Decorator returning a method that proxies a data source.
+    """
+    @functools.wraps(method)
+    def memoizer(self, context):
+        return method(context)
+
+    return memoizer
+
+class DiskCachedSourceProvider(SourceProvider):
+    """
+    Caches calls to data_sources on the listed providers
+    in a directory of numpy files, so that data is reused
+    between runs. Cached data is returned as read-only
+    memory maps. Files are held in a 'montblanc-disk-cache'
+    subdirectory of the cache directory.
+
+    Entries are invalidated when the fingerprint of the
+    provider supplying them, or the version token of their
+    data source, changes. Data sources of providers supplying
+    neither are not cached. A manifest records the entries,
+    and least recently used entries are evicted once the
+    cache exceeds a byte limit.
+    """
+    def __init__(self, providers, cache_dir, cache_data_sources=None,
+                max_bytes=None):
+        """
+        Parameters
+        ----------
+        providers: SourceProvider or Sequence of SourceProviders
+            providers containing data sources to cache
+        cache_dir: str
+            directory in which the cache subdirectory is created
+        cache_data_sources: list of str
+            list of data sources to cache (Defaults to None
+            in which case all data sources are cached)
+        max_bytes: int
+            Maximum number of bytes held by the cache.
+            (Defaults to None in which case the cache is unbounded)
+        """
+        if not isinstance(providers, collections_abc.Sequence):
+            providers = [providers]
+
+        self._providers = providers
+        self._cache_dir = os.path.join(cache_dir, ENTRY_DIR)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+        self._manifest = self._read_manifest()
+
+        # Construct a list of provider data sources
+        prov_data_sources = { n: (prov, ds) for prov in providers
+                            for n, ds in list(prov.sources().items()) }
+
+        if cache_data_sources is None:
+            cache_data_sources = set(prov_data_sources.keys())
+        else:
+            cache_data_sources = set(cache_data_sources)
+            ds_diff = list(cache_data_sources.difference(prov_data_sources))
+
+            if len(ds_diff) > 0:
+                montblanc.log.warning("'{}' was requested to cache the "
+                                     "following data source(s) '{}' "
+                                    "but they were not present on the "
+                                    "supplied providers '{}'".format(
+                                        self.name(), ds_diff,
+                                        [p.name() for p in providers]))
+
+        # Construct data sources on this source provider
+        for n, (prov, ds) in list(prov_data_sources.items()):
+            if n in cache_data_sources:
+                setattr(self, n, types.MethodType(_disk_cache(ds, prov), self))
+            else:
+                setattr(self, n, types.MethodType(_proxy(ds), self))
+
+    def _read_manifest(self):
+        """
+        Read the manifest, removing stale cache files without
+        entries, such as those written by an interrupted run.
+        Only files named like those the provider creates are
+        removed, and recent files are left for other processes
+        sharing the directory.
+        """
+        filename = os.path.join(self._cache_dir, MANIFEST)
+        manifest = {}
+
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    manifest = json.load(f)
+            except ValueError:
+                montblanc.log.warning("Discarding malformed cache "
+                    "manifest '{}'".format(filename))
+
+        files = set(e['file'] for e in manifest.values())
+
+        stale = time.time() - STALE_SECONDS
+
+        for f in os.listdir(self._cache_dir):
+            if f in files or not ENTRY_FILE_RE.search(f):
+                continue
+
+            path = os.path.join(self._cache_dir, f)
+
+            try:
+                if os.path.getmtime(path) < stale:
+                    os.remove(path)
+            except OSError:
+                pass
+
+        # Drop entries whose files have gone missing
+        return { k: e for k, e in manifest.items() if os.path.exists(
+            os.path.join(self._cache_dir, e['file'])) }
+
+    def _write_manifest(self):
+        """ Atomically write the manifest """
+        filename = os.path.join(self._cache_dir, MANIFEST)
+        tmp_filename = filename + '.tmp'
+
+        with self._lock:
+            manifest = json.dumps(self._manifest, indent=1, sort_keys=True)
+
+        with open(tmp_filename, 'w') as f:
+            f.write(manifest)
+
+        os.rename(tmp_filename, filename)
+
+    def _fingerprint(self, provider, name):
+        """
+        Fingerprint of the data supplied by the ``name``
+        data source on ``provider``, or None
+        """
+        fingerprint = provider.fingerprint()
+        version = provider.versions().get(name, None)
+
+        if fingerprint is None and version is None:
+            return None
+
+        return repr((fingerprint, version))
+
+    def _get(self, provider_name, name, layout,
+                    fingerprint, method, context):
+        """
+        Return cached data for the given key, calling
+        ``method(context)`` on a miss. ``layout`` holds the
+        array extents, shape and dtype of the request.
+        """
+        # Data of unknown provenance can't be invalidated
+        if fingerprint is None:
+            return method(context)
+
+        key = hashlib.md5(json.dumps([provider_name, name, layout],
+            sort_keys=True).encode('utf-8')).hexdigest()
+        filename = os.path.join(self._cache_dir, key + '.npy')
+
+        with self._lock:
+            entry = self._manifest.get(key, None)
+
+            if entry is not None and entry['fingerprint'] == fingerprint:
+                entry['atime'] = time.time()
+                self._hits += 1
+                hit = True
+            else:
+                self._misses += 1
+                hit = False
+
+        if hit:
+            try:
+                return np.load(filename, mmap_mode='r')
+            except (IOError, ValueError):
+                montblanc.log.warning("Discarding unreadable "
+                    "cache entry '{}'".format(filename))
+
+        data = method(context)
+        array = np.asarray(data)
+
+        # Data exceeding the cache size is not cached
+        if self._max_bytes is not None and array.nbytes > self._max_bytes:
+            return data
+
+        # Write to a temporary file and rename it, so that
+        # readers never observe a partially written file
+        tmp_filename = '{f}.{t}.tmp'.format(f=filename,
+            t=threading.current_thread().ident)
+
+        with open(tmp_filename, 'wb') as f:
+            np.save(f, array)
+
+        os.rename(tmp_filename, filename)
+
+        with self._lock:
+            self._manifest[key] = { 'provider': provider_name,
+                'array': name, 'extents': layout[0],
+                'shape': layout[1], 'dtype': layout[2],
+                'fingerprint': fingerprint, 'file': key + '.npy',
+                'nbytes': int(array.nbytes), 'atime': time.time() }
+
+            self._evict(exclude=key)
+
+        return data
+
+    def _evict(self, exclude=None):
+        """
+        Evict least recently used entries until the cache
+        is within its byte limit. Called with the lock held.
+        """
+        if self._max_bytes is None:
+            return
+
+        nbytes = sum(e['nbytes'] for e in self._manifest.values())
+        lru = sorted((e['atime'], k) for k, e in self._manifest.items()
+            if k != exclude)
+
+        for atime, key in lru:
+            if nbytes <= self._max_bytes:
+                break
+
+            entry = self._manifest.pop(key)
+            nbytes -= entry['nbytes']
+            self._evictions += 1
+
+            # Memory maps of the file remain
+            # valid on POSIX systems after removal
+            try:
+                os.remove(os.path.join(self._cache_dir, entry['file']))
+            except OSError:
+                pass
+
+    def init(self, init_context):
+        """ Perform any initialisation required """
+        for p in self._providers:
+            p.init(init_context)
+
+    def start(self, start_context):
+        """ Perform any logic on solution start """
+        for p in self._providers:
+            p.start(start_context)
+
+    def stop(self, stop_context):
+        """ Perform any logic on solution stop """
+        for p in self._providers:
+            p.stop(stop_context)
+
+        self._write_manifest()
+
+    def close(self):
+        """ Write the manifest """
+        self._write_manifest()
+
+    def updated_dimensions(self):
+        """ Update the dimensions """
+        return [d for p in self._providers
+                  for d in p.updated_dimensions()]
+
+    def dependencies(self):
+        """ Merge the dependencies of the providers """
+        return { n: d for p in self._providers
+                      for n, d in p.dependencies().items() }
+
+    def versions(self):
+        """ Merge the version tokens of the providers """
+        return { n: v for p in self._providers
+                      for n, v in p.versions().items() }
+
+    def fingerprint(self):
+        """ Combine the fingerprints of the providers, if all are known """
+        fingerprints = [p.fingerprint() for p in self._providers]
+
+        if any(f is None for f in fingerprints):
+            return None
+
+        return ';'.join(fingerprints)
+
+    def thread_safe(self):
+        """ Thread safe if all the providers are """
+        return all(p.thread_safe() for p in self._providers)
+
+    def name(self):
+        sub_prov_names = ', '.join([p.name() for p in self._providers])
+        return 'DiskCache({})'.format(sub_prov_names)
+
+    def clear_cache(self):
+        """ Remove all entries from the cache """
+        with self._lock:
+            for entry in self._manifest.values():
+                try:
+                    os.remove(os.path.join(self._cache_dir, entry['file']))
+                except OSError:
+                    pass
+
+            self._manifest.clear()
+
+        self._write_manifest()
+
+    def cache_size(self):
+        """ Number of bytes held by the cache """
+        with self._lock:
+            return sum(e['nbytes'] for e in self._manifest.values())
+
+    def cache_stats(self):
+        """
+        Returns a dictionary of cache statistics:
+
+        - hits: Calls served from the cache
+        - misses: Calls that called a data source
+        - evictions: Entries evicted to satisfy the byte limit
+        - entries: Number of cached entries
+        - nbytes: Number of bytes held by the cache
+        """
+        with self._lock:
+            return { 'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(self._manifest),
+                'nbytes': sum(e['nbytes'] for e in self._manifest.values()) }
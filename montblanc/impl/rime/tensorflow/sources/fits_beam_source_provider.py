@@ -356,6 +356,12 @@ class FitsBeamSourceProvider(SourceProvider):
         self._dim_updates = [(n, axes.naxis[i]) for n, i
             in zip(self._beam_dims, dim_indices)]
 
+        # Identify the beam by its files and their modification times
+        self._version = (feed_type, self._fits_dims,
+            self._l_sign, self._m_sign,
+            tuple((fn, os.path.getmtime(fn) if os.path.exists(fn) else None)
+                for files in filenames.values() for fn in files))
+
         self._initialised = True
 
     def name(self):
@@ -395,6 +401,11 @@ class FitsBeamSourceProvider(SourceProvider):
         """ Indicate dimension sizes """
         return self._dim_updates
 
+    def versions(self):
+        """ Beam data is unchanged while the FITS files are unmodified """
+        return { n: self._version for n in
+            ('ebeam', 'beam_extents', 'beam_freq_map') }
+
     @property
     def filename_schema(self):
         """ Filename schema """
@@ -21,6 +21,8 @@
 
 import collections
 import functools
+import hashlib
+import os
 import types
 
 import numpy as np
@@ -29,7 +31,6 @@ import montblanc.util as mbu
 import montblanc.impl.rime.tensorflow.ms.ms_manager as MS
 
 from montblanc.impl.rime.tensorflow.sources.source_provider import SourceProvider
-from montblanc.impl.rime.tensorflow.sources import SourceContext
 
 class MSSourceProvider(SourceProvider):
     """
@@ -54,6 +55,14 @@ class MSSourceProvider(SourceProvider):
 
         self._vis_column = 'DATA' if vis_column is None else vis_column
 
+        # Main table columns read together for each tile
+        self._main_columns = (self._vis_column, MS.FLAG, MS.WEIGHT)
+
+        # All main table columns read, which identify the data
+        self._read_columns = (self._main_columns +
+            MS.UVW_BLOCK_COLUMNS + MS.INDEX_COLUMNS)
+        self._fingerprint = None
+
         # Cache columns on the object
         # Handle these columns slightly differently
         # They're used to compute the parallactic angle
@@ -63,7 +72,7 @@ class MSSourceProvider(SourceProvider):
         self._antenna_positions = manager.antenna_table.getcol(MS.POSITION)
 
         # Cache timesteps
-        self._times = manager.ordered_time_table.getcol(MS.TIME)
+        self._times = manager.times
 
         # Cache the phase direction for the field
         # [0][0] because (a) we select only 1 row
@@ -74,10 +83,55 @@ class MSSourceProvider(SourceProvider):
     def name(self):
         return self._name
 
+    def start(self, start_context):
+        """
+        Fingerprint the data and read the rows of upcoming
+        tiles ahead of the data sources
+        """
+        self._fingerprint = self._compute_fingerprint()
+        self._manager.start_prefetch(start_context, self._main_columns)
+
+    def stop(self, stop_context):
+        """ Stop reading ahead and report prefetch buffer usage """
+        self._manager.stop_prefetch()
+
     def updated_dimensions(self):
         # Defer to manager's method
         return self._manager.updated_dimensions()
 
+    def _compute_fingerprint(self):
+        """
+        The Measurement Set path, the modification times and sizes
+        of the storage files holding the main table columns read
+        and of the subtables, and the field and columns read
+        """
+        msname = os.path.abspath(self._manager.msname)
+        state = [self._manager.column_storage_state(self._read_columns)]
+        state.extend(MS.table_storage_state(msname, t)
+            for t in MS.SUBTABLE_KEYS)
+        digest = hashlib.md5(repr(state).encode('utf-8')).hexdigest()
+
+        return '{ms}:{d}:{f}:{c}'.format(ms=msname, d=digest,
+            f=self._manager.field_id, c=self._vis_column)
+
+    def fingerprint(self):
+        """
+        Fingerprint of the data read, computed on solution start
+        so that a sink writing to the Measurement Set during the
+        solution does not change it
+        """
+        if self._fingerprint is None:
+            self._fingerprint = self._compute_fingerprint()
+
+        return self._fingerprint
+
+    def thread_safe(self):
+        """
+        pyrap tables are not thread safe, but the manager
+        only accesses each table while holding its lock
+        """
+        return True
+
     def phase_centre(self, context):
         return self._phase_dir.astype(context.dtype)
 
@@ -92,68 +146,55 @@ class MSSourceProvider(SourceProvider):
 
     def frequency(self, context):
         """ Frequency data source """
-        channels = self._manager.spectral_window_table.getcol(MS.CHAN_FREQ)
-        return channels.reshape(context.shape).astype(context.dtype)
+        lc, uc = context.dim_extents('nchan')
+        spw = self._manager.spectral_window_table
+
+        with self._manager.table_lock(MS.SPECTRAL_WINDOW_TABLE):
+            channels = spw.getcol(MS.CHAN_FREQ)
+
+        return channels.ravel()[lc:uc].reshape(context.shape).astype(context.dtype)
 
     def ref_frequency(self, context):
         """ Reference frequency data source """
-        num_chans = self._manager.spectral_window_table.getcol(MS.NUM_CHAN)
-        ref_freqs = self._manager.spectral_window_table.getcol(MS.REF_FREQUENCY)
+        spw = self._manager.spectral_window_table
+
+        with self._manager.table_lock(MS.SPECTRAL_WINDOW_TABLE):
+            num_chans = spw.getcol(MS.NUM_CHAN)
+            ref_freqs = spw.getcol(MS.REF_FREQUENCY)
 
         data = np.hstack((np.repeat(rf, bs) for bs, rf in zip(num_chans, ref_freqs)))
         return data.reshape(context.shape).astype(context.dtype)
 
     def uvw(self, context):
         """ Per-antenna UVW coordinate data source """
-
-        # Hacky access of private member
-        cube = context._cube
-
-        # Create antenna1 source context
-        a1_actual = cube.array("antenna1", reify=True)
-        a1_ctx = SourceContext("antenna1", cube, context.cfg,
-            context.iter_args, cube.array("antenna1"),
-            a1_actual.shape, a1_actual.dtype)
-
-        # Create antenna2 source context
-        a2_actual = cube.array("antenna2", reify=True)
-        a2_ctx = SourceContext("antenna2", cube, context.cfg,
-            context.iter_args, cube.array("antenna2"),
-            a2_actual.shape, a2_actual.dtype)
-
-        # Get antenna1 and antenna2 data
-        ant1 = self.antenna1(a1_ctx).ravel()
-        ant2 = self.antenna2(a2_ctx).ravel()
+        ant1 = self._manager.uvw_column(context, MS.ANTENNA1).ravel()
+        ant2 = self._manager.uvw_column(context, MS.ANTENNA2).ravel()
 
         # Obtain per baseline UVW data
-        lrow, urow = MS.uvw_row_extents(context)
-        uvw = self._manager.ordered_uvw_table.getcol(MS.UVW,
-                                                startrow=lrow,
-                                                nrow=urow-lrow)
+        uvw = self._manager.uvw_column(context, MS.UVW)
 
-        # Perform the per-antenna UVW decomposition
+        # Decompose the baselines present in the Measurement Set
         ntime, nbl = context.dim_extent_size('ntime', 'nbl')
         na = context.dim_global_size('na')
-        chunks = np.repeat(nbl, ntime).astype(ant1.dtype)
+        present = self._manager.present_baselines(context)
+        chunks = present.reshape(ntime, nbl).sum(axis=1).astype(ant1.dtype)
+
+        auvw = mbu.antenna_uvw(uvw[present], ant1[present], ant2[present],
+            chunks, nr_of_antenna=na)
 
-        auvw = mbu.antenna_uvw(uvw, ant1, ant2, chunks, nr_of_antenna=na)
+        # Antennas absent from a timestep have no coordinates
+        auvw[np.isnan(auvw)] = 0
 
         return auvw.reshape(context.shape).astype(context.dtype)
 
     def antenna1(self, context):
         """ antenna1 data source """
-        lrow, urow = MS.uvw_row_extents(context)
-        antenna1 = self._manager.ordered_uvw_table.getcol(
-            MS.ANTENNA1, startrow=lrow, nrow=urow-lrow)
-
+        antenna1 = self._manager.uvw_column(context, MS.ANTENNA1)
         return antenna1.reshape(context.shape).astype(context.dtype)
 
     def antenna2(self, context):
         """ antenna2 data source """
-        lrow, urow = MS.uvw_row_extents(context)
-        antenna2 = self._manager.ordered_uvw_table.getcol(
-            MS.ANTENNA2, startrow=lrow, nrow=urow-lrow)
-
+        antenna2 = self._manager.uvw_column(context, MS.ANTENNA2)
         return antenna2.reshape(context.shape).astype(context.dtype)
 
     def parallactic_angles(self, context):
@@ -167,33 +208,29 @@ class MSSourceProvider(SourceProvider):
                                             .astype(context.dtype))
 
 
+    def _get_main_column(self, column, context):
+        """ Read the rows and channels of column described by context """
+        return self._manager.main_column(context, column, self._main_columns)
+
     def observed_vis(self, context):
         """ Observed visibility data source """
-        lrow, urow = MS.row_extents(context)
-
-        data = self._manager.ordered_main_table.getcol(
-            self._vis_column, startrow=lrow, nrow=urow-lrow)
-
+        data = self._get_main_column(self._vis_column, context)
         return data.reshape(context.shape).astype(context.dtype)
 
     def flag(self, context):
         """ Flag data source """
-        lrow, urow = MS.row_extents(context)
-
-        flag = self._manager.ordered_main_table.getcol(
-            MS.FLAG, startrow=lrow, nrow=urow-lrow)
-
+        flag = self._get_main_column(MS.FLAG, context)
         return flag.reshape(context.shape).astype(context.dtype)
 
     def weight(self, context):
         """ Weight data source """
-        lrow, urow = MS.row_extents(context)
-
-        weight = self._manager.ordered_main_table.getcol(
-            MS.WEIGHT, startrow=lrow, nrow=urow-lrow)
+        weight = self._get_main_column(MS.WEIGHT, context)
 
-        # WEIGHT is applied across all channels
-        weight = np.repeat(weight, self._manager.channels_per_band, 0)
+        # WEIGHT is applied across all channels of each row
+        _, channels = MS.main_row_selection(context)
+        nchan = (self._manager.channels_per_band if channels is None
+            else channels[1] - channels[0])
+        weight = np.repeat(weight, nchan, 0)
         return weight.reshape(context.shape).astype(context.dtype)
 
     def __enter__(self):
@@ -54,6 +54,34 @@ class AbstractSourceProvider(object):
         """ Return an iterable/mapping of hypercube arrays to update """
         raise NotImplementedError()
 
+    def dependencies(self):
+        """
+        Return a mapping of data source names to the names of
+        data sources they depend on
+        """
+        raise NotImplementedError()
+
+    def versions(self):
+        """
+        Return a mapping of data source names to
+        tokens identifying the version of their data
+        """
+        raise NotImplementedError()
+
+    def fingerprint(self):
+        """
+        Return a string identifying the data
+        supplied by this provider, or None
+        """
+        raise NotImplementedError()
+
+    def thread_safe(self):
+        """
+        Return True if data sources on this provider
+        may be called concurrently
+        """
+        raise NotImplementedError()
+
 DEFAULT_ARGSPEC = ['self', 'context']
 
 def find_sources(obj, argspec=None):
@@ -147,6 +175,73 @@ class SourceProvider(AbstractSourceProvider):
         """ Return an iterable/mapping of hypercube arrays to update """
         return ()
 
+    def dependencies(self):
+        """
+        Return a mapping of data source names to the names of
+        data sources they depend on. For example:
+
+        .. code-block:: python
+
+            def dependencies(self):
+                return { 'uvw': ('antenna1', 'antenna2') }
+
+        indicates that the ``uvw`` data source calls the
+        ``antenna1`` and ``antenna2`` data sources.
+        Data sources for a tile are otherwise evaluated concurrently,
+        but those with dependencies are only evaluated once
+        their dependencies have been evaluated.
+        """
+        return {}
+
+    def versions(self):
+        """
+        Return a mapping of data source names to hashable
+        tokens identifying the version of the data they supply.
+        For example:
+
+        .. code-block:: python
+
+            def versions(self):
+                return { 'ebeam': os.path.getmtime(self._filename) }
+
+        Arrays that are fed once per solution are only
+        re-assigned when their version token changes between
+        solutions, and their data sources are not called otherwise.
+        Version tokens default to the provider's :meth:`fingerprint`.
+        Arrays with neither are re-assigned on every solution.
+        """
+        return {}
+
+    def fingerprint(self):
+        """
+        Return a string identifying the data supplied by all
+        data sources on this provider, which changes whenever
+        the data changes. For example, the path and modification
+        time of the underlying file:
+
+        .. code-block:: python
+
+            def fingerprint(self):
+                return '{f}:{t}'.format(f=self._filename,
+                    t=os.path.getmtime(self._filename))
+
+        Persistent caches use this to invalidate data cached
+        in previous runs. Defaults to None, indicating that
+        the data cannot be identified.
+        """
+        return None
+
+    def thread_safe(self):
+        """
+        Return True if data sources on this provider may be
+        called concurrently from multiple threads. Data sources
+        for a tile are evaluated concurrently, but data sources
+        on providers returning False, such as those reading
+        from libraries that are not thread safe, are called
+        one at a time. Defaults to True.
+        """
+        return True
+
     def __str__(self):
         return self.name()
 
@@ -24,6 +24,11 @@ class StagingAreaWrapper(object):
 
         self._put_op = sa.put({n: p for n, p in zip(fed_arrays, placeholders)})
         self._get_op = sa.get()
+        self._size_op = sa.size()
+
+    @property
+    def name(self):
+        return self._name
 
     @property
     def staging_area(self):
@@ -61,6 +66,15 @@ class StagingAreaWrapper(object):
     def get_op(self):
         return self._get_op
 
+    @property
+    def pop_op(self):
+        """ Removes an entry without fetching its contents """
+        return next(iter(self._get_op.values())).op
+
+    @property
+    def size_op(self):
+        return self._size_op
+
 
 def create_staging_area_wrapper(name, fed_arrays, data_source, *args, **kwargs):
     return StagingAreaWrapper(name, fed_arrays, data_source, *args, **kwargs)
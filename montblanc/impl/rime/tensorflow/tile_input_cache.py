@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+
+import numpy as np
+
+class TileInputCache(object):
+    """
+    Holds the inputs of tiles in flight, so that data sinks can
+    access them through :py:obj:`SinkContext.input` once the
+    tile's outputs are available.
+
+    Entries are keyed on the exact bytes of the tile descriptor.
+    Only arrays that data sinks read are retained and the bytes
+    of each entry are accounted. :meth:`put` never blocks.
+    Entries are bounded by the bytes that tiles acquire from
+    the :class:`.AdmissionController` when they are dispatched,
+    which include their retained inputs. Blocking here could
+    deadlock the pipeline, as entries of later tiles are only
+    discarded once earlier tiles, which may still need to
+    be fed, have been delivered to ordered sinks.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._nbytes = 0
+        self._peak_nbytes = 0
+        self._retain = None
+
+    @property
+    def retain(self):
+        """
+        Names of the input arrays retained by :meth:`put`,
+        or None if all arrays are retained
+        """
+        with self._lock:
+            return self._retain
+
+    @property
+    def nbytes(self):
+        """ Number of bytes currently held by the cache """
+        with self._lock:
+            return self._nbytes
+
+    @property
+    def peak_nbytes(self):
+        """ Peak number of bytes held by the cache since :meth:`reset` """
+        with self._lock:
+            return self._peak_nbytes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, inputs):
+        """
+        Retain the inputs of the tile identified by ``key``
+
+        Parameters
+        ----------
+        key : bytes
+            Tile descriptor bytes
+        inputs : dict
+            Input arrays of the tile, keyed on name
+        """
+        with self._lock:
+            retain = self._retain
+
+        if retain is not None:
+            inputs = { n: a for n, a in inputs.items() if n in retain }
+
+        nbytes = int(sum(a.nbytes for a in inputs.values()
+            if isinstance(a, np.ndarray)))
+
+        with self._lock:
+            self.discard(key)
+            self._entries[key] = (inputs, nbytes)
+            self._nbytes += nbytes
+            self._peak_nbytes = max(self._peak_nbytes, self._nbytes)
+
+    def __getitem__(self, key):
+        """ Returns the inputs of the tile identified by ``key`` """
+        with self._lock:
+            return self._entries[key][0]
+
+    def discard(self, key):
+        """ Forget the inputs of the tile identified by ``key`` """
+        with self._lock:
+            inputs, nbytes = self._entries.pop(key, (None, 0))
+            self._nbytes -= nbytes
+
+    def reset(self, retain=None):
+        """
+        Forget all entries.
+
+        Parameters
+        ----------
+        retain : iterable of str, optional
+            Names of the input arrays to retain from
+            subsequent puts. If None, all arrays are retained.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self._peak_nbytes = 0
+            self._retain = None if retain is None else frozenset(retain)
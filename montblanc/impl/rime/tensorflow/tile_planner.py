@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+import montblanc
+import montblanc.util as mbu
+
+class LinearCostModel(object):
+    """
+    Models the seconds taken by an operation as
+    :code:`overhead + rate*work`, where work is
+    proportional to the number of elements processed.
+    """
+    def __init__(self, overhead=0.0, rate=0.0):
+        self.overhead = float(overhead)
+        self.rate = float(rate)
+
+    @classmethod
+    def fit(cls, samples):
+        """
+        Fit a model to a list of (work, seconds) samples
+        with least squares, clamping coefficients at zero.
+        """
+        work, seconds = (np.asarray(v, dtype=np.float64)
+            for v in zip(*samples))
+
+        if len(work) < 2 or np.all(work == work[0]):
+            return cls(0.0, np.mean(seconds / np.maximum(work, 1)))
+
+        rate, overhead = np.polyfit(work, seconds, 1)
+
+        # Negative overheads are noise, refit through the origin
+        if overhead < 0.0:
+            overhead, rate = 0.0, np.sum(work*seconds) / np.sum(work*work)
+
+        return cls(overhead, max(rate, 0.0))
+
+    def predict(self, work):
+        """ Predicted seconds to process ``work`` """
+        return self.overhead + self.rate*work
+
+    def to_list(self):
+        return [self.overhead, self.rate]
+
+    def __repr__(self):
+        return "LinearCostModel(overhead={o:.3g}, rate={r:.3g})".format(
+            o=self.overhead, r=self.rate)
+
+# Work performed by each benchmarked operation on a
+# batch of ``nsrc`` sources, given tile dimension sizes
+OP_WORK = {
+    'phase': lambda s: s['nsrc']*s['ntime']*s['na']*s['nchan'],
+    'create_antenna_jones': lambda s: s['nsrc']*s['ntime']*s['na']*s['nchan'],
+    'sum_coherencies': lambda s: s['nsrc']*s['ntime']*s['nbl']*s['nchan'],
+    'gauss_shape': lambda s: s['nsrc']*s['ntime']*s['nbl']*s['nchan'],
+    'sersic_shape': lambda s: s['nsrc']*s['ntime']*s['nbl']*s['nchan'],
+    'post_process_visibilities': lambda s: s['ntime']*s['nbl']*s['nchan'],
+    'tile': lambda s: 1,
+}
+
+# Operations invoked for each batch of sources
+BATCH_OPS = ('phase', 'create_antenna_jones', 'sum_coherencies')
+# Additional operations invoked for each batch of a source type
+SOURCE_TYPE_OPS = {
+    'npsrc': (),
+    'ngsrc': ('gauss_shape',),
+    'nssrc': ('sersic_shape',),
+}
+# Operations invoked once per tile
+TILE_OPS = ('post_process_visibilities', 'tile')
+
+# Benchmark sizes, in increasing order of work
+BENCHMARK_SIZES = [
+    { 'nsrc': 8, 'ntime': 4, 'na': 8, 'nchan': 16 },
+    { 'nsrc': 32, 'ntime': 8, 'na': 16, 'nchan': 32 },
+    { 'nsrc': 64, 'ntime': 16, 'na': 32, 'nchan': 64 },
+]
+
+def _op_inputs(op, sizes, FT, CT):
+    """ Returns random numpy inputs for ``op`` of the given sizes """
+    nsrc, ntime, na, nchan = (sizes[d] for d in ('nsrc', 'ntime', 'na', 'nchan'))
+    nbl = sizes['nbl']
+
+    rf = lambda *s: np.random.random(size=s).astype(FT)
+    rc = lambda *s: (rf(*s) + 1j*rf(*s)).astype(CT)
+
+    ant1, ant2 = (np.int32(a) for a in np.triu_indices(na, 1))
+    ant1 = np.tile(ant1, ntime).reshape(ntime, nbl)
+    ant2 = np.tile(ant2, ntime).reshape(ntime, nbl)
+
+    frequency = np.linspace(1e9, 2e9, nchan, dtype=FT)
+
+    if op == 'phase':
+        return [rf(nsrc, 2)*0.1, rf(ntime, na, 3), frequency]
+    elif op == 'create_antenna_jones':
+        return [rc(nsrc, ntime, nchan, 4), rc(nsrc, ntime, na, nchan),
+            rc(ntime, na, 4), rc(nsrc, ntime, na, nchan, 4)]
+    elif op == 'sum_coherencies':
+        return [ant1, ant2, rf(nsrc, ntime, nbl, nchan),
+            rc(nsrc, ntime, na, nchan, 4),
+            np.ones((nsrc, ntime, nchan), dtype=np.int8),
+            rc(ntime, nbl, nchan, 4)]
+    elif op == 'gauss_shape':
+        return [rf(ntime, na, 3), ant1, ant2, frequency,
+            rf(3, nsrc)*np.array([0.1, 0.1, 1.0], dtype=FT)[:, None]]
+    elif op == 'sersic_shape':
+        return [rf(ntime, na, 3), ant1, ant2, frequency,
+            rf(3, nsrc)*np.array([1.0, 1.0, np.pi/648000], dtype=FT)[:, None]]
+    elif op == 'post_process_visibilities':
+        return [ant1, ant2, rc(ntime, na, nchan, 4),
+            np.zeros((ntime, nbl, nchan, 4), dtype=np.uint8),
+            rf(ntime, nbl, nchan, 4), rc(ntime, nbl, nchan, 4),
+            rc(ntime, nbl, nchan, 4), rc(ntime, nbl, nchan, 4)]
+    elif op == 'tile':
+        return [rf(1)]
+
+    raise ValueError("No benchmark inputs for '{}'".format(op))
+
+def _op_expression(rime, op, inputs, CT):
+    """ Returns a tensorflow expression applying ``op`` to inputs """
+    import tensorflow as tf
+
+    if op == 'phase':
+        return rime.phase(*inputs, CT=CT)
+    elif op == 'create_antenna_jones':
+        return rime.create_antenna_jones(*inputs,
+            FT=inputs[2].dtype.base_dtype.real_dtype)
+    elif op == 'sum_coherencies':
+        return rime.sum_coherencies(*inputs)
+    elif op == 'gauss_shape':
+        return rime.gauss_shape(*inputs)
+    elif op == 'sersic_shape':
+        return rime.sersic_shape(*inputs)
+    elif op == 'post_process_visibilities':
+        return rime.post_process_visibilities(*inputs)
+    elif op == 'tile':
+        return tf.identity(inputs[0])
+
+    raise ValueError("No benchmark expression for '{}'".format(op))
+
+def benchmark_ops(rime, device, dtype, repeats=5, session_target=''):
+    """
+    Time the rime operations at each of :data:`BENCHMARK_SIZES`.
+
+    Parameters
+    ----------
+    rime : module
+        The rime operation library
+    device : str
+        Device on which to run the operations
+    dtype : str
+        'float' or 'double'
+    repeats : int
+        Number of timed runs for each operation and size.
+        The median is taken.
+    session_target : str
+        Tensorflow server target
+
+    Returns
+    -------
+    dict
+        :class:`LinearCostModel` for each operation, keyed on name
+    """
+    import tensorflow as tf
+
+    FT, CT = ((np.float32, np.complex64) if dtype == 'float'
+        else (np.float64, np.complex128))
+    tf_CT = tf.complex64 if dtype == 'float' else tf.complex128
+
+    samples = { op: [] for op in OP_WORK }
+
+    for sizes in BENCHMARK_SIZES:
+        sizes = dict(sizes, nbl=sizes['na']*(sizes['na']-1)//2)
+
+        with tf.Graph().as_default() as graph:
+            with tf.device(device):
+                exprs = { op: _op_expression(rime, op,
+                        [tf.Variable(a, name="%s_%d" % (op, i)) for i, a
+                            in enumerate(_op_inputs(op, sizes, FT, CT))],
+                        tf_CT)
+                    for op in OP_WORK }
+
+            init_op = tf.global_variables_initializer()
+
+        config = tf.ConfigProto(allow_soft_placement=True)
+
+        with tf.Session(session_target, graph=graph, config=config) as S:
+            S.run(init_op)
+
+            for op, expr in exprs.items():
+                # Warm up
+                S.run(expr)
+                timings = []
+
+                for r in range(repeats):
+                    start = time.time()
+                    S.run(expr)
+                    timings.append(time.time() - start)
+
+                samples[op].append((OP_WORK[op](sizes), np.median(timings)))
+
+    return { op: LinearCostModel.fit(s) for op, s in samples.items() }
+
+def load_profile(filename, key):
+    """
+    Load cost models stored under ``key`` in a JSON profile,
+    returning None if the file or key does not exist.
+    """
+    if not filename or not os.path.exists(filename):
+        return None
+
+    try:
+        with open(filename, 'r') as f:
+            profile = json.load(f)
+    except ValueError:
+        montblanc.log.warn("Ignoring malformed tile "
+            "planner profile '{}'".format(filename))
+        return None
+
+    try:
+        models = { op: LinearCostModel(*c) for op, c in profile[key].items() }
+    except (KeyError, TypeError):
+        return None
+
+    # Profiles predating an operation's benchmark are stale
+    return models if set(OP_WORK).issubset(models) else None
+
+def save_profile(filename, key, models):
+    """ Store cost models under ``key`` in a JSON profile """
+    if not filename:
+        return
+
+    profile = {}
+
+    if os.path.exists(filename):
+        try:
+            with open(filename, 'r') as f:
+                profile = json.load(f)
+        except ValueError:
+            profile = {}
+
+    profile[key] = { op: m.to_list() for op, m in models.items() }
+
+    dirname = os.path.dirname(filename)
+
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    with open(filename, 'w') as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+
+def batch_seconds(cost_models, src_type, sizes):
+    """
+    Predicted seconds to compute a batch of
+    ``sizes['nsrc']`` sources of type ``src_type``
+    """
+    return sum(cost_models[op].predict(OP_WORK[op](sizes))
+        for op in BATCH_OPS + SOURCE_TYPE_OPS[src_type])
+
+def balanced_batch_sizes(cost_models, sizes, nsrcs, max_batch,
+        batch_limits=None):
+    """
+    Source batch sizes for each source type, balancing the
+    work performed by each iteration of the source loops.
+
+    The cheapest source type present is batched in ``max_batch``
+    sources. Each other source type receives the largest batch
+    predicted to take no longer to compute. Batches of each
+    type are further limited by ``batch_limits``, derived from
+    the memory required by each source of the type.
+
+    Parameters
+    ----------
+    cost_models : dict
+        :class:`LinearCostModel` for each operation,
+        keyed on operation name
+    sizes : dict
+        Tile sizes of the 'ntime', 'nbl', 'na' and 'nchan' dimensions
+    nsrcs : dict
+        Number of sources of each type, keyed on
+        source dimension, e.g. 'npsrc'
+    max_batch : int
+        Maximum source batch size
+    batch_limits : dict, optional
+        Maximum batch size of each source type, keyed on
+        source dimension, such as those returned by
+        :meth:`MemoryModel.source_batch_limits`
+
+    Returns
+    -------
+    dict
+        Batch size of each source type, keyed on source dimension.
+        Batch sizes do not exceed the number of sources of a type.
+    """
+    max_batch = max(max_batch, 1)
+    present = [t for t, n in nsrcs.items() if n > 0]
+
+    if len(present) == 0:
+        return { t: 0 for t in nsrcs }
+
+    if batch_limits is None:
+        batch_limits = {}
+
+    target = min(batch_seconds(cost_models, t, dict(sizes, nsrc=max_batch))
+        for t in present)
+
+    batch_sizes = {}
+
+    for src_type, nsrc in nsrcs.items():
+        overhead = batch_seconds(cost_models, src_type, dict(sizes, nsrc=0))
+        rate = batch_seconds(cost_models, src_type,
+            dict(sizes, nsrc=1)) - overhead
+
+        if rate > 0.0:
+            # Tolerate rounding for the cheapest type
+            batch = int(np.floor((target - overhead) / rate + 1e-6))
+        else:
+            batch = max_batch
+
+        # Memory may limit the batch further
+        limit = max(batch_limits.get(src_type, max_batch), 1)
+        batch_sizes[src_type] = min(max(batch, 1), max_batch, limit, nsrc)
+
+    return batch_sizes
+
+def _candidates(lower, upper):
+    """ Powers of two between lower and upper, and upper itself """
+    lower = max(1, lower)
+    values = set([upper])
+    v = 1
+
+    while v < upper:
+        if v >= lower:
+            values.add(v)
+
+        v *= 2
+
+    return sorted(values, reverse=True)
+
+class TilePlanner(object):
+    """
+    Chooses the tile shape of (ntime, nbl, source batch size)
+    predicted to achieve the highest visibility throughput,
+    while satisfying the memory model.
+    """
+    def __init__(self, cost_models, memory_model):
+        """
+        Parameters
+        ----------
+        cost_models : dict
+            :class:`LinearCostModel` for each operation in
+            :data:`OP_WORK`, keyed on operation name
+        memory_model : :class:`MemoryModel`
+            Pipeline memory model
+        """
+        self._cost_models = cost_models
+        self._memory_model = memory_model
+
+    @property
+    def memory_model(self):
+        """ Pipeline memory model satisfied by planned tiles """
+        return self._memory_model
+
+    @memory_model.setter
+    def memory_model(self, value):
+        self._memory_model = value
+
+    def tile_seconds(self, ntime, nbl, na, nchan, batch_sizes, nsrcs):
+        """
+        Predicted seconds to compute a tile.
+
+        Parameters
+        ----------
+        ntime, nbl, na, nchan : int
+            Tile dimension sizes
+        batch_sizes : dict
+            Batch size of each source type, keyed on source dimension
+        nsrcs : dict
+            Number of sources of each type, keyed on source dimension
+        """
+        models = self._cost_models
+        sizes = { 'ntime': ntime, 'nbl': nbl, 'na': na, 'nchan': nchan }
+
+        seconds = sum(models[op].predict(OP_WORK[op](sizes))
+            for op in TILE_OPS)
+
+        for src_type, nsrc in nsrcs.items():
+            if nsrc == 0:
+                continue
+
+            full, remainder = divmod(nsrc, batch_sizes[src_type])
+
+            for batches, size in ((full, batch_sizes[src_type]),
+                                                (1, remainder)):
+                if batches == 0 or size == 0:
+                    continue
+
+                seconds += batches*batch_seconds(models, src_type,
+                    dict(sizes, nsrc=size))
+
+        return seconds
+
+    def plan(self, cube, slvr_cfg, iter_dims):
+        """
+        Search tile shapes for the highest predicted throughput
+        that fits within the memory budgets, updating the extents
+        of ``cube`` with the selected shape.
+
+        Returns
+        -------
+        tuple
+            (reductions, throughput) where reductions is a dictionary
+            of dimension extents applied to ``cube`` and throughput
+            is the predicted visibilities per second, or
+            (None, None) if no tile shape fits.
+        """
+        mem_budget = slvr_cfg.get('mem_budget', 2*1024**3)
+        host_mem_budget = slvr_cfg.get('host_mem_budget')
+
+        src_dims = mbu.source_nr_vars()
+        ntime, nbl, na, nchan = cube.dim_global_size(
+            'ntime', 'nbl', 'na', 'nchan')
+        nsrcs = dict(zip(src_dims, cube.dim_global_size(*src_dims)))
+        nchan_tile = (cube.dim_extent_size('nchan')
+            if 'nchan' in iter_dims else nchan)
+
+        max_batch = max(max(nsrcs.values()), 1)
+        max_batch_sizes = _candidates(1, min(max_batch,
+            max(slvr_cfg.get('source_batch_size', 500), 1)))
+
+        best = None
+        # Best throughput of shapes only exceeding the host budget
+        host_bound = None
+        trial = cube.copy()
+        batch_limits = {}
+
+        for t, bl, bs in itertools.product(_candidates(1, ntime),
+                _candidates(1, nbl), max_batch_sizes):
+
+            # Antenna arrays are fed in full for every tile,
+            # so price them with the global na, as MemoryModel does
+            sizes = { 'ntime': t, 'nbl': bl, 'na': na,
+                'nchan': nchan_tile }
+
+            # Limit source batches to the memory left by the tile
+            if (t, bl) not in batch_limits:
+                trial.update_dimensions([{ 'name': d, 'lower_extent': 0,
+                    'upper_extent': s } for d, s in (('ntime', t), ('nbl', bl))])
+                batch_limits[(t, bl)] = self._memory_model.source_batch_limits(
+                    trial, mem_budget)
+
+            batch_sizes = balanced_batch_sizes(self._cost_models,
+                sizes, nsrcs, bs, batch_limits[(t, bl)])
+
+            updates = { 'ntime': t, 'nbl': bl,
+                'nsrc': max(batch_sizes.values()) }
+            updates.update(batch_sizes)
+
+            trial.update_dimensions([{ 'name': d, 'lower_extent': 0,
+                'upper_extent': s } for d, s in updates.items()])
+
+            if not self._memory_model.fits(trial, mem_budget, None):
+                continue
+
+            seconds = self.tile_seconds(t, bl, sizes['na'],
+                nchan_tile, batch_sizes, nsrcs)
+            throughput = t*bl*nchan_tile / max(seconds, 1e-12)
+
+            if not self._memory_model.fits(trial, mem_budget, host_mem_budget):
+                host_bound = max(host_bound or 0, throughput)
+            elif best is None or throughput > best[1]:
+                best = (updates, throughput)
+
+        if best is None:
+            return None, None
+
+        updates, throughput = best
+
+        cube.update_dimensions([{ 'name': d, 'lower_extent': 0,
+            'upper_extent': s } for d, s in updates.items()])
+
+        montblanc.log.info("Tile planner selected ntime={t}, nbl={bl}, "
+            "nchan={c} and source batch sizes of {bs}, with a predicted "
+            "throughput of {v:.3g} visibilities per second per shard.".format(
+                t=updates['ntime'], bl=updates['nbl'], c=nchan_tile,
+                bs={ d: updates[d] for d in src_dims }, v=throughput))
+
+        if host_bound is not None and host_bound > throughput:
+            montblanc.log.info("The host memory budget of {mb} limited "
+                "the predicted throughput, which could reach {v:.3g} "
+                "visibilities per second per shard without it.".format(
+                    mb=mbu.fmt_bytes(host_mem_budget), v=host_bound))
+
+        return updates, throughput
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+
+from montblanc.impl.rime.tensorflow.admission_control import (
+    AdmissionController)
+
+class TestAdmissionController(unittest.TestCase):
+    """
+    Tests the byte-based admission of tiles into the solver pipeline
+    """
+
+    def test_admission(self):
+        """ Tiles block once the ceiling is reached """
+        ac = AdmissionController(100)
+
+        self.assertTrue(ac.acquire('a', 60))
+        self.assertEqual(ac.inflight_bytes, 60)
+
+        admitted = []
+
+        def _acquire():
+            admitted.append(ac.acquire('b', 60))
+
+        t = threading.Thread(target=_acquire)
+        t.start()
+        time.sleep(0.1)
+
+        # 'b' can't be admitted until 'a' is released
+        self.assertEqual(admitted, [])
+        ac.release('a')
+        t.join()
+
+        self.assertEqual(admitted, [True])
+        self.assertEqual(ac.inflight_bytes, 60)
+        self.assertEqual(ac.peak_bytes, 60)
+
+    def test_oversized_tile(self):
+        """ A tile larger than the ceiling is admitted if nothing is in flight """
+        ac = AdmissionController(100)
+        self.assertTrue(ac.acquire('a', 1000))
+        self.assertEqual(len(ac), 1)
+        ac.release('a')
+        self.assertEqual(ac.inflight_bytes, 0)
+
+    def test_forced(self):
+        """ Forced tiles are admitted beyond the ceiling """
+        ac = AdmissionController(100)
+        ac.acquire('a', 100)
+
+        self.assertTrue(ac.acquire('b', 60, force=True))
+        self.assertEqual(ac.inflight_bytes, 160)
+
+    def test_unbounded(self):
+        """ Tiles are always admitted without a ceiling """
+        ac = AdmissionController(None)
+        self.assertTrue(ac.acquire('a', 1000))
+        self.assertTrue(ac.acquire('b', 1000))
+        self.assertEqual(ac.inflight_bytes, 2000)
+
+        # A ceiling can be imposed later
+        ac.ceiling = 1500
+        t = threading.Thread(target=ac.acquire, args=('c', 10))
+        t.start()
+        t.join(0.2)
+        self.assertTrue(t.is_alive())
+        ac.release('a')
+        t.join()
+        self.assertEqual(ac.inflight_bytes, 1010)
+
+    def test_abort(self):
+        """ Aborting wakes blocked tiles and refuses admission """
+        ac = AdmissionController(100)
+        ac.acquire('a', 100)
+
+        admitted = []
+        t = threading.Thread(target=lambda: admitted.append(
+            ac.acquire('b', 10)))
+        t.start()
+        ac.abort()
+        t.join()
+
+        self.assertEqual(admitted, [False])
+
+        ac.reset()
+        self.assertTrue(ac.acquire('c', 10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from montblanc.impl.rime.tensorflow.sources import (SourceProvider,
+    CachedSourceProvider)
+
+class Context(object):
+    """ Describes a chunk of 'a' between lower and upper """
+    def __init__(self, lower, upper):
+        self.name = 'a'
+        self._extents = [(lower, upper)]
+
+    def array_extents(self, name):
+        return self._extents
+
+class SlowSourceProvider(SourceProvider):
+    """ Provides 'a', counting and slowing calls """
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def name(self):
+        return "Slow"
+
+    def a(self, context):
+        with self._lock:
+            self.calls += 1
+
+        time.sleep(0.1)
+        lower, upper = context.array_extents(context.name)[0]
+        return np.arange(lower, upper, dtype=np.float64)
+
+class TestCachedSourceProvider(unittest.TestCase):
+    """
+    Tests caching of data sources
+    """
+
+    def test_single_flight(self):
+        """ Concurrent misses on a key call the data source once """
+        prov = SlowSourceProvider()
+        cache = CachedSourceProvider(prov)
+
+        results = []
+
+        def _call(lower):
+            results.append(cache.a(Context(lower, lower + 10)))
+
+        start = time.time()
+        threads = [threading.Thread(target=_call, args=(l,))
+            for l in (0, 0, 0, 10, 20)]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        # Different keys were loaded concurrently
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual(prov.calls, 3)
+
+        stats = cache.cache_stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['waits'], 2)
+        self.assertEqual(stats['entries'], 3)
+
+    def test_eviction(self):
+        """ Least recently used entries are evicted """
+        prov = SlowSourceProvider()
+        # Room for two entries of 10 doubles
+        cache = CachedSourceProvider(prov, max_bytes=160)
+
+        cache.a(Context(0, 10))
+        cache.a(Context(10, 20))
+        cache.a(Context(0, 10))
+        cache.a(Context(20, 30))
+
+        stats = cache.cache_stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(cache.cache_size(), 160)
+
+        # (10, 20) was evicted, (0, 10) was not
+        cache.a(Context(0, 10))
+        self.assertEqual(prov.calls, 3)
+        cache.a(Context(10, 20))
+        self.assertEqual(prov.calls, 4)
+
+    def test_thread_safe(self):
+        """ The cache is only thread safe if all its providers are """
+        class UnsafeSourceProvider(SlowSourceProvider):
+            def name(self):
+                return "Unsafe"
+
+            def thread_safe(self):
+                return False
+
+        safe, unsafe = SlowSourceProvider(), UnsafeSourceProvider()
+        self.assertTrue(CachedSourceProvider(safe).thread_safe())
+        self.assertFalse(CachedSourceProvider([safe, unsafe]).thread_safe())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import unittest
+
+import numpy as np
+
+from montblanc.impl.rime.tensorflow.ms.coalescing_writer import (
+    CoalescingWriter, TableWrite, coalesce)
+
+class FakeTable(object):
+    """ Records putcol calls on a table of rows """
+    def __init__(self, nrow, rows=None, parent=None):
+        self.data = np.zeros(nrow) if parent is None else None
+        self.rows = np.arange(nrow) if rows is None else rows
+        self.parent = parent
+        self.puts = []
+
+    def name(self):
+        return 'fake'
+
+    def putcol(self, column, data, startrow=0, nrow=-1, rowincr=1):
+        rows = self.rows if nrow == -1 else self.rows[
+            startrow:startrow + nrow*rowincr:rowincr]
+        target = self if self.parent is None else self.parent
+        target.puts.append(rows.copy())
+        target.data[rows] = data
+
+    def selectrows(self, rows):
+        return FakeTable(len(rows), rows, parent=self)
+
+    def close(self):
+        pass
+
+def _write(startrow, nrow, column='DATA', rowincr=1):
+    data = np.arange(startrow, startrow + nrow*rowincr, rowincr)
+    return TableWrite(column, startrow, nrow, rowincr, None, None,
+        data.astype(np.float64))
+
+class TestCoalescingWriter(unittest.TestCase):
+    """
+    Tests merging and asynchronous issue of table writes
+    """
+
+    def test_coalesce(self):
+        """ Writes of adjacent rows of a column are merged """
+        writes = [_write(4, 4), _write(0, 4), _write(10, 2),
+            _write(8, 2, column='FLAG'), _write(1, 2, rowincr=2),
+            _write(5, 2, rowincr=2)]
+
+        merged = coalesce(writes)
+        self.assertEqual([(w.column, w.startrow, w.nrow, w.rowincr)
+            for w in merged], [('DATA', 0, 8, 1), ('DATA', 10, 2, 1),
+                ('DATA', 1, 4, 2), ('FLAG', 8, 2, 1)])
+        self.assertTrue(np.all(merged[0].data == np.arange(8)))
+        self.assertTrue(np.all(merged[2].data == np.arange(1, 9, 2)))
+
+    def test_async_write(self):
+        """ Queued writes are issued and merged by stop() """
+        table = FakeTable(16)
+        writer = CoalescingWriter(table, queue_size=8)
+
+        writer.start()
+
+        for startrow in range(0, 16, 4):
+            writer.put(_write(startrow, 4))
+
+        writer.stop()
+
+        self.assertTrue(np.all(table.data == np.arange(16)))
+        stats = writer.stats()
+        self.assertEqual(stats['writes'], 4)
+        self.assertTrue(1 <= stats['merged_writes'] <= 4)
+
+    def test_physical_order(self):
+        """ Mapped rows are issued in ascending table order """
+        table = FakeTable(8)
+        row_numbers = np.array([3, 2, 1, 0, 7, 6, 5, 4])
+        writer = CoalescingWriter(table, row_numbers=row_numbers,
+            physical_order=True)
+
+        writer.put(_write(0, 8))
+
+        self.assertEqual(table.puts[0].tolist(), list(range(8)))
+        self.assertEqual(table.data.tolist(), [3, 2, 1, 0, 7, 6, 5, 4])
+
+    def test_missing_rows(self):
+        """ Rows missing from the table are not written """
+        table = FakeTable(4)
+        row_numbers = np.array([1, -1, 0, -1, 2, 3])
+        writer = CoalescingWriter(table, row_numbers=row_numbers)
+
+        writer.put(_write(0, 6))
+
+        self.assertEqual(table.puts[0].tolist(), [1, 0, 2, 3])
+        self.assertEqual(table.data.tolist(), [2, 0, 4, 5])
+
+    def test_table_lock(self):
+        """ The table is only written while holding its lock """
+        lock = threading.Lock()
+        locked = []
+
+        class LockedTable(FakeTable):
+            def selectrows(self, rows):
+                locked.append(lock.locked())
+                return LockedTable(len(rows), rows, parent=self)
+
+            def putcol(self, *args, **kwargs):
+                locked.append(lock.locked())
+                super(LockedTable, self).putcol(*args, **kwargs)
+
+        table = LockedTable(8)
+        writer = CoalescingWriter(table, row_numbers=np.arange(8),
+            table_lock=lock)
+        writer.start()
+        writer.put(_write(0, 4))
+        writer.put(_write(4, 4))
+        writer.stop()
+
+        self.assertTrue(len(locked) > 0 and all(locked))
+        self.assertTrue(np.all(table.data == np.arange(8)))
+
+    def test_write_exception(self):
+        """ Exceptions on the writer thread are raised by stop() """
+        class FailingTable(FakeTable):
+            def putcol(self, *args, **kwargs):
+                raise IOError("Write failed")
+
+        writer = CoalescingWriter(FailingTable(4))
+        writer.start()
+        writer.put(_write(0, 4))
+
+        with self.assertRaises(IOError):
+            writer.stop()
+
+if __name__ == '__main__':
+    unittest.main()
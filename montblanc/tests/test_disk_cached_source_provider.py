@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from montblanc.impl.rime.tensorflow.sources import (SourceProvider,
+    DiskCachedSourceProvider)
+
+class Context(object):
+    """ Describes a chunk of 'a' between lower and upper """
+    def __init__(self, lower, upper, dtype=np.float64):
+        self.name = 'a'
+        self.shape = (upper - lower,)
+        self.dtype = dtype
+        self._extents = [(lower, upper)]
+
+    def array_extents(self, name):
+        return self._extents
+
+class CountingSourceProvider(SourceProvider):
+    """ Provides 'a', counting calls """
+    def __init__(self, fingerprint):
+        self.calls = 0
+        self._fingerprint = fingerprint
+
+    def name(self):
+        return "Counting"
+
+    def fingerprint(self):
+        return self._fingerprint
+
+    def a(self, context):
+        self.calls += 1
+        lower, upper = context.array_extents(context.name)[0]
+        return np.arange(lower, upper, dtype=context.dtype)
+
+class TestDiskCachedSourceProvider(unittest.TestCase):
+    """
+    Tests caching of data sources on disk
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_persistence(self):
+        """ Data is reused by later providers until the fingerprint changes """
+        prov = CountingSourceProvider('v1')
+        cache = DiskCachedSourceProvider(prov, self.cache_dir)
+        cache.a(Context(0, 10))
+        cache.close()
+
+        # A new run is served from disk
+        prov = CountingSourceProvider('v1')
+        cache = DiskCachedSourceProvider(prov, self.cache_dir)
+        data = cache.a(Context(0, 10))
+        self.assertEqual(prov.calls, 0)
+        self.assertTrue(np.all(data == np.arange(10)))
+        self.assertEqual(cache.cache_stats()['hits'], 1)
+
+        # Changing the fingerprint invalidates the entry
+        prov = CountingSourceProvider('v2')
+        cache = DiskCachedSourceProvider(prov, self.cache_dir)
+        cache.a(Context(0, 10))
+        self.assertEqual(prov.calls, 1)
+
+    def test_dtype(self):
+        """ Requests for a different dtype are not served stale data """
+        prov = CountingSourceProvider('v1')
+        cache = DiskCachedSourceProvider(prov, self.cache_dir)
+        cache.a(Context(0, 10, np.float64))
+        data = cache.a(Context(0, 10, np.float32))
+        self.assertEqual(prov.calls, 2)
+        self.assertEqual(data.dtype, np.float32)
+
+        cache.a(Context(0, 10, np.float32))
+        self.assertEqual(prov.calls, 2)
+
+    def test_unknown_fingerprint(self):
+        """ Data without a fingerprint is not cached """
+        prov = CountingSourceProvider(None)
+        cache = DiskCachedSourceProvider(prov, self.cache_dir)
+        cache.a(Context(0, 10))
+        cache.a(Context(0, 10))
+        self.assertEqual(prov.calls, 2)
+        self.assertEqual(cache.cache_size(), 0)
+
+    def test_eviction(self):
+        """ Least recently used entries are evicted """
+        prov = CountingSourceProvider('v1')
+        cache = DiskCachedSourceProvider(prov, self.cache_dir,
+            max_bytes=160)
+
+        cache.a(Context(0, 10))
+        cache.a(Context(10, 20))
+        cache.a(Context(0, 10))
+        cache.a(Context(20, 30))
+
+        self.assertEqual(cache.cache_stats()['evictions'], 1)
+        self.assertEqual(cache.cache_size(), 160)
+
+        # (10, 20) was evicted
+        cache.a(Context(0, 10))
+        self.assertEqual(prov.calls, 3)
+        cache.a(Context(10, 20))
+        self.assertEqual(prov.calls, 4)
+
+    def test_foreign_files(self):
+        """ Only stale files created by the provider are removed """
+        entry_dir = os.path.join(self.cache_dir, 'montblanc-disk-cache')
+        os.makedirs(entry_dir)
+
+        user_file = os.path.join(self.cache_dir, 'data.npy')
+        foreign_file = os.path.join(entry_dir, 'data.npy')
+        stale_file = os.path.join(entry_dir, '0' * 32 + '.npy')
+        fresh_file = os.path.join(entry_dir, '1' * 32 + '.npy')
+
+        for f in (user_file, foreign_file, stale_file, fresh_file):
+            np.save(f, np.arange(10))
+
+        old = time.time() - 2*3600
+        os.utime(stale_file, (old, old))
+
+        DiskCachedSourceProvider(CountingSourceProvider('v1'), self.cache_dir)
+
+        self.assertTrue(os.path.exists(user_file))
+        self.assertTrue(os.path.exists(foreign_file))
+        self.assertTrue(os.path.exists(fresh_file))
+        self.assertFalse(os.path.exists(stale_file))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+from hypercube import HyperCube
+
+from montblanc.impl.rime.tensorflow.memory_model import MemoryModel
+
+class TestMemoryModel(unittest.TestCase):
+    """
+    Tests the solver pipeline memory model
+    """
+
+    def setUp(self):
+        cube = HyperCube()
+        cube.register_dimension('ntime', 10)
+        cube.register_dimension('nbl', 4)
+        cube.register_dimension('nchan', 8)
+        cube.register_dimension('npsrc', 6)
+        cube.register_dimension('nsrc', 6)
+
+        cube.register_array('frequency', ('nchan',), np.float64)
+        cube.register_array('vis', ('ntime', 'nbl', 'nchan'), np.complex128)
+        cube.register_array('lm', ('npsrc', 2), np.float64)
+        cube.register_array('shape', ('nsrc', 'ntime', 'nbl', 'nchan'),
+            np.float64)
+        cube.register_array('chi', (1,), np.float64)
+
+        # Tiles of 5 timesteps and batches of 3 sources
+        cube.update_dimensions([
+            { 'name': 'ntime', 'lower_extent': 0, 'upper_extent': 5 },
+            { 'name': 'npsrc', 'lower_extent': 0, 'upper_extent': 3 },
+            { 'name': 'nsrc', 'lower_extent': 0, 'upper_extent': 3 }])
+
+        self.cube = cube
+        self.model = MemoryModel(feed_once=['frequency'],
+            feed_many=['descriptor', 'vis'],
+            sources={'npsrc': ['lm']},
+            outputs=['vis', 'chi'],
+            temporaries=['shape'],
+            nr_of_shards=4, shards_per_device=2, staging_depth=3)
+
+    def test_device_breakdown(self):
+        """ Device memory accounts for concurrent shards and temporaries """
+        vis = 5*4*8*16
+        batch_lm = 3*2*8
+
+        breakdown = self.model.device_breakdown(self.cube)
+        self.assertEqual(list(breakdown.keys()),
+            ['feed_once', 'inputs', 'temporaries', 'outputs'])
+        self.assertEqual(breakdown['feed_once'], 8*8)
+        self.assertEqual(breakdown['inputs'], 2*(vis + batch_lm))
+        self.assertEqual(breakdown['temporaries'], 2*3*5*4*8*8)
+        self.assertEqual(breakdown['outputs'], 2*(vis + 8))
+
+    def test_host_breakdown(self):
+        """ Host memory accounts for staging depth and retained inputs """
+        vis = 5*4*8*16
+        tile_lm = 6*2*8
+        tiles = 4*3
+
+        breakdown = self.model.host_breakdown(self.cube)
+        self.assertEqual(breakdown['staging'], tiles*(vis + tile_lm))
+        self.assertEqual(breakdown['retained_inputs'], tiles*vis)
+        self.assertEqual(breakdown['outputs'], tiles*(vis + 8))
+
+        self.assertEqual(self.model.tile_host_bytes(self.cube),
+            2*vis + tile_lm + vis + 8)
+        self.assertEqual(self.model.tile_host_bytes(self.cube,
+            outputs=['chi']), 2*vis + tile_lm + 8)
+
+        # Only inputs retained for sinks are held beyond staging
+        self.assertEqual(self.model.tile_host_bytes(self.cube,
+            outputs=['chi'], retain=[]), vis + tile_lm + 8)
+
+        # Original cube extents are untouched
+        self.assertEqual(self.cube.dim_extent_size('npsrc'), 3)
+
+    def test_retaining(self):
+        """ Only inputs declared by sinks are retained on the host """
+        vis = 5*4*8*16
+        tile_lm = 6*2*8
+        tiles = 4*3
+
+        model = self.model.retaining([])
+        self.assertEqual(model.retain, frozenset())
+        self.assertEqual(model.host_breakdown(self.cube)['retained_inputs'], 0)
+        self.assertEqual(model.tile_host_bytes(self.cube),
+            vis + tile_lm + vis + 8)
+
+        # Retaining the visibilities
+        model = self.model.retaining(['vis'])
+        self.assertEqual(model.host_breakdown(self.cube)['retained_inputs'],
+            tiles*vis)
+
+        # The original model is unchanged
+        self.assertIsNone(self.model.retain)
+        self.assertEqual(self.model.host_breakdown(
+            self.cube)['retained_inputs'], tiles*vis)
+
+    def test_device_defaults(self):
+        """ Arrays generated on the device occupy no host memory """
+        vis = 5*4*8*16
+        batch_lm = 3*2*8
+        tile_lm = 6*2*8
+
+        model = MemoryModel(feed_once=['frequency'],
+            feed_many=['descriptor'],
+            sources={'npsrc': ['lm']},
+            outputs=['vis', 'chi'],
+            temporaries=['shape'],
+            nr_of_shards=4, shards_per_device=2, staging_depth=3,
+            device_defaults=['vis'])
+
+        device = model.device_breakdown(self.cube)
+        self.assertEqual(device['inputs'], 2*(vis + batch_lm))
+
+        self.assertEqual(model.tile_host_bytes(self.cube, outputs=['chi']),
+            tile_lm + 8)
+
+    def test_source_batch_limits(self):
+        """ Source batches are limited by the memory left by the tile """
+        vis = 5*4*8*16
+        # lm and shape temporaries of each point source on 2 shards
+        per_source = 2*(2*8 + 5*4*8*8)
+        base = 8*8 + 2*vis + 2*(vis + 8)
+
+        limits = self.model.source_batch_limits(self.cube,
+            base + 3*per_source + 100)
+        self.assertEqual(limits, { 'npsrc': 3 })
+
+        # At least one source is always permitted
+        limits = self.model.source_batch_limits(self.cube, base)
+        self.assertEqual(limits, { 'npsrc': 1 })
+
+        # Original cube extents are untouched
+        self.assertEqual(self.cube.dim_extent_size('npsrc'), 3)
+
+    def test_fits(self):
+        """ Tiles fit if both device and host budgets are satisfied """
+        device, host = self.model.footprint(self.cube)
+        self.assertTrue(self.model.fits(self.cube, device, host))
+        self.assertFalse(self.model.fits(self.cube, device - 1, host))
+        self.assertFalse(self.model.fits(self.cube, device, host - 1))
+
+        # No host budget
+        self.assertTrue(self.model.fits(self.cube, device, None))
+        self.assertFalse(self.model.fits(self.cube, device - 1, None))
+
+if __name__ == '__main__':
+    unittest.main()
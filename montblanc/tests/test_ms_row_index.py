@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from montblanc.impl.rime.tensorflow.ms.ms_manager import (gather_rows,
+    ColumnRead, table_storage_state)
+from montblanc.impl.rime.tensorflow.ms.row_index import MSRowIndex
+
+class FakeTable(object):
+    """ Table of row numbers supporting row selection """
+    def __init__(self, rows):
+        self.rows = rows
+
+    def selectrows(self, rownrs):
+        return FakeTable(self.rows[rownrs])
+
+    def getcolnp(self, column, nparray):
+        nparray[:] = self.rows
+
+    def close(self):
+        pass
+
+class TestMSRowIndex(unittest.TestCase):
+    """
+    Tests the Measurement Set row index
+    """
+
+    def setUp(self):
+        # 2 timesteps, 3 baselines and 2 bands in shuffled row order
+        ntime, nbl, nbands = 2, 3, 2
+        time, bl, band = (a.ravel() for a in np.meshgrid(
+            np.arange(ntime) + 10.0, np.arange(nbl),
+            np.arange(nbands), indexing='ij'))
+        ant1, ant2 = np.array([0, 0, 1])[bl], np.array([1, 2, 2])[bl]
+
+        self.perm = np.random.RandomState(42).permutation(time.shape[0])
+        self.expected = np.arange(time.shape[0])
+        self.columns = (time[self.perm], ant1[self.perm],
+            ant2[self.perm], band[self.perm])
+
+    def test_ordering(self):
+        """ Rows are ordered by time, baseline and band """
+        rows = np.arange(self.perm.shape[0])
+        index = MSRowIndex.from_columns(*(self.columns + (rows, 2)))
+
+        # Physical rows holding each (time, baseline, band)
+        self.assertTrue(np.all(self.perm[index.main_rows] == self.expected))
+        self.assertTrue(np.all(self.perm[index.uvw_rows] == self.expected[::2]))
+        self.assertEqual(index.ntime, 2)
+        self.assertEqual(index.nbl, 3)
+        self.assertEqual(index.times.tolist(), [10.0, 11.0])
+        self.assertEqual(index.baselines.tolist(), [[0, 1], [0, 2], [1, 2]])
+
+    def test_persistence(self):
+        """ Saved indices are loaded only if their key matches """
+        rows = np.arange(self.perm.shape[0])
+        index = MSRowIndex.from_columns(*(self.columns + (rows, 2)))
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(tmpdir, 'index.npz')
+            key = ['1', '12345.0', '12']
+            index.save(path, key)
+
+            loaded = MSRowIndex.load(path, key)
+            self.assertTrue(np.all(loaded.main_rows == index.main_rows))
+            self.assertTrue(np.all(loaded.uvw_rows == index.uvw_rows))
+            self.assertTrue(np.all(loaded.baselines == index.baselines))
+
+            self.assertIsNone(MSRowIndex.load(path, ['1', '12346.0', '12']))
+            self.assertIsNone(MSRowIndex.load(path + '.missing', key))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_irregular(self):
+        """ Missing rows are marked in the dense grid """
+        rows = np.arange(self.perm.shape[0])
+
+        # Remove baseline (0, 2) of the second timestep
+        # and the second band of the first row
+        keep = np.ones(rows.shape[0], dtype=np.bool_)
+        keep[np.flatnonzero(np.isin(self.perm, [1, 8, 9]))] = False
+        columns = tuple(c[keep] for c in self.columns)
+
+        index = MSRowIndex.from_columns(*(columns + (rows[keep], 2)))
+        missing = index.main_rows < 0
+
+        self.assertEqual(np.flatnonzero(missing).tolist(), [1, 8, 9])
+        self.assertEqual(np.flatnonzero(index.uvw_rows < 0).tolist(), [4])
+        self.assertEqual(index.nrows, 9)
+        self.assertTrue(np.all(self.perm[index.main_rows[~missing]]
+            == self.expected[~missing]))
+
+    def test_gather_rows(self):
+        """ Rows are read in ascending order into filled buffers """
+        selected = []
+
+        class RecordingTable(FakeTable):
+            def selectrows(self, rownrs):
+                selected.append(rownrs)
+                return super(RecordingTable, self).selectrows(rownrs)
+
+        rownrs = np.array([5, 1, -1, 3, 0])
+        read = ColumnRead((), np.int64, -2, None, None)
+        data = gather_rows(RecordingTable(np.arange(8)), rownrs,
+            { 'ROW': read })
+
+        self.assertEqual(selected[0].tolist(), [0, 1, 3, 5])
+        self.assertEqual(data['ROW'].tolist(), [5, 1, -2, 3, 0])
+
+    def test_gather_rows_lock(self):
+        """ Tables are only accessed while holding their lock """
+        lock = threading.Lock()
+        locked = []
+
+        class LockedTable(FakeTable):
+            def selectrows(self, rownrs):
+                locked.append(lock.locked())
+                return LockedTable(self.rows[rownrs])
+
+            def getcolnp(self, column, nparray):
+                locked.append(lock.locked())
+                super(LockedTable, self).getcolnp(column, nparray)
+
+            def close(self):
+                locked.append(lock.locked())
+
+        read = ColumnRead((), np.int64, 0, None, None)
+        gather_rows(LockedTable(np.arange(8)), np.array([2, 1]),
+            { 'ROW': read }, lock)
+
+        self.assertEqual(locked, [True, True, True])
+        self.assertFalse(lock.locked())
+
+    def test_table_storage_state(self):
+        """ Writes to storage files and subtables change the state """
+        msname = tempfile.mkdtemp()
+
+        try:
+            os.makedirs(os.path.join(msname, 'ANTENNA'))
+
+            for f in ('table.dat', 'table.f0', 'table.lock',
+                    os.path.join('ANTENNA', 'table.f0')):
+                with open(os.path.join(msname, f), 'w') as fh:
+                    fh.write('0')
+
+            state = table_storage_state(msname)
+            ant_state = table_storage_state(msname, 'ANTENNA')
+            self.assertEqual([s[0] for s in state], ['table.dat', 'table.f0'])
+
+            # Opening the table only touches the lock file
+            with open(os.path.join(msname, 'table.lock'), 'w') as fh:
+                fh.write('01')
+
+            self.assertEqual(table_storage_state(msname), state)
+
+            for f in ('table.f0', os.path.join('ANTENNA', 'table.f0')):
+                with open(os.path.join(msname, f), 'w') as fh:
+                    fh.write('01')
+
+            self.assertNotEqual(table_storage_state(msname), state)
+            self.assertNotEqual(table_storage_state(msname, 'ANTENNA'),
+                ant_state)
+            self.assertEqual(table_storage_state(msname, 'FIELD'), [])
+
+            # Only the files of the listed storage managers
+            for f in ('table.f1', 'table.f1_TSM0', 'table.f10'):
+                with open(os.path.join(msname, f), 'w') as fh:
+                    fh.write('0')
+
+            self.assertEqual([s[0] for s in table_storage_state(msname,
+                seqnrs=set([1]))], ['table.f1', 'table.f1_TSM0'])
+
+            # Writes to other storage managers leave the state unchanged
+            state = table_storage_state(msname, seqnrs=set([0]))
+
+            for f in ('table.dat', 'table.f1_TSM0'):
+                with open(os.path.join(msname, f), 'w') as fh:
+                    fh.write('012')
+
+            self.assertEqual(table_storage_state(msname,
+                seqnrs=set([0])), state)
+        finally:
+            shutil.rmtree(msname)
+
+if __name__ == '__main__':
+    unittest.main()
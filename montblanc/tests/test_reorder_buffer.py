@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+import threading
+import unittest
+
+from montblanc.impl.rime.tensorflow.reorder_buffer import ReorderBuffer
+
+class TestReorderBuffer(unittest.TestCase):
+    """
+    Tests the ordered delivery of tiles
+    """
+
+    def test_reorder(self):
+        """ Tiles submitted out of order are delivered in order """
+        rb = ReorderBuffer()
+        delivered = []
+
+        for key in 'abcd':
+            rb.register(key)
+
+        rb.submit('c', lambda: delivered.append('c'))
+        rb.submit('b', lambda: delivered.append('b'))
+        self.assertEqual(delivered, [])
+        self.assertEqual(len(rb), 2)
+
+        rb.submit('a', lambda: delivered.append('a'))
+        self.assertEqual(delivered, ['a', 'b', 'c'])
+
+        rb.submit('d', lambda: delivered.append('d'))
+        self.assertEqual(delivered, ['a', 'b', 'c', 'd'])
+        self.assertEqual(len(rb), 0)
+
+    def test_threaded_reorder(self):
+        """ Tiles submitted from many threads are delivered in order """
+        rb = ReorderBuffer()
+        delivered = []
+        keys = list(range(100))
+
+        for key in keys:
+            rb.register(key)
+
+        random.shuffle(keys)
+
+        def _submit(key):
+            rb.submit(key, lambda: delivered.append(key))
+
+        threads = [threading.Thread(target=_submit, args=(k,)) for k in keys]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        self.assertEqual(delivered, list(range(100)))
+
+    def test_split(self):
+        """ Split tiles are delivered in place of their parent """
+        rb = ReorderBuffer()
+        delivered = []
+
+        for key in 'abc':
+            rb.register(key)
+
+        rb.submit('c', lambda: delivered.append('c'))
+        rb.split('b', ['b0', 'b1'])
+        rb.submit('a', lambda: delivered.append('a'))
+        rb.submit('b1', lambda: delivered.append('b1'))
+        self.assertEqual(delivered, ['a'])
+
+        rb.submit('b0', lambda: delivered.append('b0'))
+        self.assertEqual(delivered, ['a', 'b0', 'b1', 'c'])
+        self.assertEqual(len(rb), 0)
+
+    def test_reset(self):
+        """ Reset discards pending tiles and restarts the sequence """
+        rb = ReorderBuffer()
+        delivered = []
+
+        rb.register('a')
+        rb.register('b')
+        rb.submit('b', lambda: delivered.append('b'))
+        rb.reset()
+
+        self.assertEqual(rb.register('c'), 0)
+        rb.submit('c', lambda: delivered.append('c'))
+        self.assertEqual(delivered, ['c'])
+
+if __name__ == '__main__':
+    unittest.main()
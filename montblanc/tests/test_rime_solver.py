@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import threading
+import unittest
+
+import six
+from hypercube import HyperCube
+
+from montblanc.impl.rime.tensorflow.cube_dim_transcoder import (
+    CubeDimensionTranscoder)
+from montblanc.impl.rime.tensorflow.RimeSolver import (RimeSolver,
+    DataSource, _TileQueue, _channel_tile_sizes, _dependency_levels,
+    _output_names,
+    _output_variants, _split_extent)
+
+class FakeSolver(object):
+    """ Holds the attributes read by RimeSolver tile methods """
+    def __init__(self, cube, iter_dims):
+        self.hypercube = cube
+        self._transcoder = CubeDimensionTranscoder(iter_dims)
+
+class FakeProvider(object):
+    """ Supplies the named data sources """
+    def __init__(self, *names):
+        self._names = names
+
+    def sources(self):
+        return { n: None for n in self._names }
+
+class FakeSpecSolver(object):
+    """ Holds the attributes read by RimeSolver._graph_spec """
+    def __init__(self, data_source='default', device_defaults=()):
+        self.hypercube = HyperCube()
+        self.hypercube.register_dimension('npsrc', 10)
+        self.hypercube.register_dimension('ngsrc', 0)
+        self.hypercube.register_dimension('nssrc', 5)
+        self._slvr_cfg = { 'data_source': data_source }
+        self._defaults_provider = FakeProvider('ebeam',
+            'direction_independent_effects', 'pointing_errors',
+            'observed_vis', 'flag')
+        self._tf_feed_data = FakeFeedData(device_defaults)
+
+    def config(self):
+        return self._slvr_cfg
+
+class FakeFeedData(object):
+    def __init__(self, device_defaults):
+        self.device_defaults = { n: None for n in device_defaults }
+
+class TestRimeSolverHelpers(unittest.TestCase):
+    """
+    Tests the helper functions of the RimeSolver
+    """
+
+    def test_split_extent(self):
+        """ Tiles are halved in time and split on band aligned channels """
+        self.assertEqual(_split_extent({ 'ntime': 5, 'nchan': 8 }, 16, 2),
+            ('ntime', 3))
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nbl': 7 }, 16, 2),
+            ('nbl', 4))
+        self.assertIsNone(_split_extent({ 'ntime': 1, 'nbl': 1 }, 16, 2))
+
+    def test_split_extent_bands(self):
+        """ Channel splits never straddle band boundaries """
+        # 2 bands of 6 channels
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nchan': 12 }, 12, 2),
+            ('nchan', 6))
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nchan': 6 }, 12, 2),
+            ('nchan', 3))
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nchan': 3 }, 12, 2),
+            ('nchan', 1))
+
+        # 3 bands of 5 channels split into whole bands
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nchan': 15 }, 15, 3),
+            ('nchan', 5))
+
+        # 5 channels only divide into single channels
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nchan': 5 }, 15, 3),
+            ('nchan', 1))
+
+        # Without a smaller band aligned size, fall through to baselines
+        self.assertEqual(_split_extent({ 'ntime': 1, 'nchan': 1,
+            'nbl': 4 }, 15, 3), ('nbl', 2))
+
+    def _sub_extents(self, cube, iter_dims, strides):
+        """ Extents of the sub-tiles of the tile described by cube """
+        slvr = FakeSolver(cube, iter_dims)
+        descriptor = slvr._transcoder.encode(cube.dimensions(copy=False))
+
+        return [[(d['lower_extent'], d['upper_extent'])
+                for d in slvr._transcoder.decode(sd)]
+            for sd in six.get_unbound_function(RimeSolver._sub_descriptors)(
+                slvr, descriptor, strides)]
+
+    def test_sub_descriptors(self):
+        """ Sub-tiles cover the tile, with a ragged final sub-tile """
+        cube = HyperCube()
+        cube.register_dimension('ntime', 20)
+        cube.register_dimension('nchan', 12)
+        cube.update_dimension('ntime', lower_extent=10, upper_extent=15)
+
+        extents = self._sub_extents(cube, ['ntime', 'nchan'], { 'ntime': 2 })
+        self.assertEqual(extents, [
+            [(10, 12), (0, 12)],
+            [(12, 14), (0, 12)],
+            [(14, 15), (0, 12)]])
+
+    def test_sub_descriptors_bands(self):
+        """ Band aligned channel splits yield whole bands """
+        # 2 bands of 6 channels
+        cube = HyperCube()
+        cube.register_dimension('ntime', 4)
+        cube.register_dimension('nchan', 12)
+        cube.register_dimension('nbands', 2)
+        cube.update_dimension('ntime', lower_extent=0, upper_extent=1)
+
+        dims = { 'ntime': 1, 'nchan': 12 }
+        dim, stride = _split_extent(dims, 12, 2)
+        extents = self._sub_extents(cube, ['ntime', 'nchan'], { dim: stride })
+
+        self.assertEqual([e[1] for e in extents], [(0, 6), (6, 12)])
+
+    def test_dependency_levels(self):
+        """ Data sources follow the data sources they depend on """
+        ds = lambda *depends: DataSource(None, None, 'Test', depends)
+        data_sources = { 'a': ds(), 'b': ds('a'), 'c': ds('a', 'b'),
+            'd': ds(), 'e': ds('e', 'x') }
+
+        levels = _dependency_levels(data_sources, ['c', 'b', 'a', 'd', 'e'])
+        self.assertEqual(levels, [['a', 'd', 'e'], ['b'], ['c']])
+
+        # Dependencies on absent data sources are ignored
+        self.assertEqual(_dependency_levels(data_sources, ['c', 'b']),
+            [['b'], ['c']])
+        self.assertEqual(_dependency_levels(data_sources, []), [])
+
+    def test_dependency_cycles(self):
+        """ Cyclic dependencies are reported """
+        ds = lambda *depends: DataSource(None, None, 'Test', depends)
+        data_sources = { 'a': ds('c'), 'b': ds('a'), 'c': ds('b'), 'd': ds() }
+
+        with self.assertRaises(ValueError):
+            _dependency_levels(data_sources, ['a', 'b', 'c', 'd'])
+
+    def test_tile_queue(self):
+        """ Tiles are iterated in order until the queue is finished """
+        queue = _TileQueue(4)
+        queue.put(('a', 1))
+        queue.put(('b', 2))
+        queue.finish()
+
+        self.assertEqual(list(queue), [('a', 1), ('b', 2)])
+
+    def test_tile_queue_exception(self):
+        """ Exceptions passed on finishing are raised by the iterator """
+        queue = _TileQueue(4)
+        queue.put(('a', 1))
+
+        try:
+            raise ValueError("Consumer failed")
+        except ValueError:
+            queue.finish(sys.exc_info())
+
+        tiles = iter(queue)
+        self.assertEqual(next(tiles), ('a', 1))
+
+        with self.assertRaises(ValueError):
+            next(tiles)
+
+    def test_tile_queue_cancel(self):
+        """ Cancelling the queue releases blocked producers """
+        queue = _TileQueue(1)
+        queue.put(('a', 1))
+
+        # The queue is full, so the producer blocks
+        producer = threading.Thread(target=queue.finish)
+        producer.start()
+        producer.join(0.3)
+        self.assertTrue(producer.is_alive())
+
+        queue.cancel()
+        producer.join(1.0)
+        self.assertFalse(producer.is_alive())
+
+        # Further tiles are discarded
+        queue.put(('b', 2))
+        self.assertEqual(next(iter(queue)), ('a', 1))
+
+    def test_output_variants(self):
+        """ A variant exists for each combination of optional outputs """
+        self.assertEqual(sorted(_output_variants()), sorted([
+            ('chi_squared',),
+            ('model_vis', 'chi_squared'),
+            ('chi_squared', 'residual_vis'),
+            ('model_vis', 'chi_squared', 'residual_vis')]))
+
+    def test_output_names(self):
+        """ Output names name a variant, in output order """
+        variants = _output_variants()
+
+        for consumed in ([], ['residual_vis'],
+                    ['residual_vis', 'model_vis', 'chi_squared'],
+                    ['model_vis', 'observed_vis']):
+            self.assertIn(_output_names(consumed), variants)
+
+        self.assertEqual(_output_names([]), ('chi_squared',))
+        self.assertEqual(_output_names(['residual_vis', 'model_vis']),
+            ('model_vis', 'chi_squared', 'residual_vis'))
+        self.assertEqual(_output_names(['model_vis', 'observed_vis']),
+            ('model_vis', 'chi_squared'))
+
+    def test_channel_tile_sizes(self):
+        """ Channel tile sizes decrease and divide the band channels """
+        self.assertEqual(_channel_tile_sizes(16, 1), [8, 4, 2, 1])
+        self.assertEqual(_channel_tile_sizes(12, 2), [6, 3, 1])
+        self.assertEqual(_channel_tile_sizes(15, 3), [5, 1])
+        self.assertEqual(_channel_tile_sizes(7, 7), [1])
+        self.assertEqual(_channel_tile_sizes(1, 1), [])
+
+        for nchan, nbands in ((64, 4), (60, 3), (35, 5), (9, 1)):
+            sizes = _channel_tile_sizes(nchan, nbands)
+            self.assertEqual(sizes, sorted(sizes, reverse=True))
+            self.assertTrue(all((nchan // nbands) % s == 0 for s in sizes))
+
+    def _graph_spec(self, slvr, providers, retain=None,
+            outputs=('chi_squared',)):
+        return six.get_unbound_function(RimeSolver._graph_spec)(slvr,
+            [slvr._defaults_provider] + providers, retain, outputs)
+
+    def test_graph_spec_elided(self):
+        """ Terms only supplied by the defaults provider are elided """
+        slvr = FakeSpecSolver()
+
+        spec = self._graph_spec(slvr, [FakeProvider('lm')])
+        self.assertEqual(spec.elided,
+            frozenset(['ebeam', 'direction_independent_effects']))
+        self.assertEqual(spec.src_types, ('npsrc', 'nssrc'))
+        self.assertEqual(spec.outputs, ('chi_squared',))
+        self.assertEqual(spec.defaults, frozenset())
+
+        spec = self._graph_spec(slvr, [FakeProvider('ebeam')],
+            outputs=('model_vis', 'chi_squared'))
+        self.assertEqual(spec.elided,
+            frozenset(['direction_independent_effects']))
+        self.assertEqual(spec.outputs, ('model_vis', 'chi_squared'))
+
+    def test_graph_spec_defaults(self):
+        """ Unsupplied inputs are generated unless retained """
+        slvr = FakeSpecSolver(device_defaults=('observed_vis', 'flag',
+            'pointing_errors'))
+
+        # pointing_errors is supplied, but only read by the elided ebeam
+        spec = self._graph_spec(slvr, [FakeProvider('flag',
+            'pointing_errors')], retain=())
+        self.assertEqual(spec.defaults,
+            frozenset(['observed_vis', 'pointing_errors']))
+
+        # Retained inputs are fed from the host
+        spec = self._graph_spec(slvr, [FakeProvider('flag',
+            'pointing_errors')], retain=('observed_vis',))
+        self.assertEqual(spec.defaults, frozenset(['pointing_errors']))
+
+        # Supplying ebeam reads pointing_errors
+        spec = self._graph_spec(slvr, [FakeProvider('ebeam',
+            'pointing_errors')], retain=())
+        self.assertEqual(spec.defaults, frozenset(['observed_vis', 'flag']))
+
+    def test_graph_spec_data_source(self):
+        """ Nothing is elided unless default data sources are used """
+        slvr = FakeSpecSolver(data_source='test',
+            device_defaults=('observed_vis',))
+
+        spec = self._graph_spec(slvr, [], retain=())
+        self.assertEqual(spec.elided, frozenset())
+        self.assertEqual(spec.defaults, frozenset())
+        self.assertEqual(spec.src_types, ('npsrc', 'nssrc'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import unittest
+
+import numpy as np
+
+from montblanc.impl.rime.tensorflow.ms.row_block_reader import (
+    RowBlockReader, RowBlockPrefetcher)
+
+class TestRowBlockReader(unittest.TestCase):
+    """
+    Tests reading several columns of a tile together
+    """
+
+    def setUp(self):
+        self.nreads = 0
+
+    def _read(self):
+        self.nreads += 1
+        return { 'ANTENNA1': np.arange(4), 'UVW': np.ones((4, 3)) }
+
+    def test_single_read(self):
+        """ Columns of a block are read once and discarded once read """
+        reader = RowBlockReader()
+        readers = { 'ANTENNA1': 2 }
+
+        for column in ('ANTENNA1', 'UVW', 'ANTENNA1'):
+            reader.column(0, column, self._read, readers)
+
+        self.assertEqual(self.nreads, 1)
+        self.assertEqual(reader.stats()['blocks'], 0)
+
+        # Reading a discarded column reads the block again
+        reader.column(0, 'UVW', self._read, readers)
+        self.assertEqual(self.nreads, 2)
+        self.assertEqual(reader.stats()['reads'], 2)
+
+    def test_capacity(self):
+        """ The oldest blocks are evicted """
+        reader = RowBlockReader(capacity=2)
+
+        for key in range(3):
+            reader.column(key, 'UVW', self._read, {})
+
+        stats = reader.stats()
+        self.assertEqual(stats['blocks'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_concurrent_read(self):
+        """ Concurrent requests for a block wait on a single read """
+        reader = RowBlockReader()
+        started, release = threading.Event(), threading.Event()
+        results = {}
+
+        def _slow_read():
+            started.set()
+            release.wait()
+            return self._read()
+
+        def _column(column):
+            results[column] = reader.column(0, column, _slow_read, {})
+
+        first = threading.Thread(target=_column, args=('ANTENNA1',))
+        first.start()
+        started.wait()
+
+        second = threading.Thread(target=_column, args=('UVW',))
+        second.start()
+
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(self.nreads, 1)
+        self.assertEqual(reader.stats()['reads'], 1)
+        self.assertTrue(np.all(results['UVW'] == 1))
+
+    def test_failed_read(self):
+        """ Failed reads are raised and not retained """
+        reader = RowBlockReader()
+
+        def _fail():
+            raise IOError("Read failed")
+
+        with self.assertRaises(IOError):
+            reader.column(0, 'UVW', _fail, {})
+
+        reader.column(0, 'UVW', self._read, {})
+        self.assertEqual(self.nreads, 1)
+
+    def test_prefetch(self):
+        """ Prefetched blocks are served to data sources """
+        reader = RowBlockReader()
+        self.assertTrue(reader.prefetch(0, self._read, {}))
+        self.assertFalse(reader.prefetch(0, self._read, {}))
+
+        reader.column(0, 'UVW', self._read, {})
+        reader.column(0, 'ANTENNA1', self._read, {})
+
+        stats = reader.stats()
+        self.assertEqual(self.nreads, 1)
+        self.assertEqual(stats['prefetch_hits'], 2)
+        self.assertEqual(stats['reads'], 0)
+        self.assertEqual(stats['blocks'], 0)
+
+        # Blocks already read on demand are not prefetched
+        reader.column(1, 'UVW', self._read, {})
+        self.assertFalse(reader.prefetch(1, self._read, {}))
+        self.assertEqual(self.nreads, 2)
+
+    def test_prefetcher_depth(self):
+        """ The prefetcher remains at most depth tiles ahead """
+        reader = RowBlockReader()
+        prefetcher = RowBlockPrefetcher(reader, depth=2)
+        tiles = [[(t, self._read, {})] for t in range(5)]
+
+        prefetcher.start(iter(tiles))
+
+        def _prefetched():
+            return reader.stats()['prefetched']
+
+        def _wait_for(n):
+            for i in range(100):
+                if _prefetched() == n:
+                    return
+                threading.Event().wait(0.01)
+
+        _wait_for(2)
+        self.assertEqual(_prefetched(), 2)
+
+        # Consuming a tile admits the next
+        reader.column(0, 'UVW', self._read, {})
+        reader.column(0, 'ANTENNA1', self._read, {})
+        _wait_for(3)
+        self.assertEqual(_prefetched(), 3)
+
+        prefetcher.stop()
+        self.assertEqual(reader.stats()['reads'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from montblanc.impl.rime.tensorflow.shard_scheduler import (
+    create_shard_scheduler,
+    RoundRobinShardScheduler,
+    LeastQueuedShardScheduler,
+    CostWeightedShardScheduler)
+
+class TestShardScheduler(unittest.TestCase):
+    """
+    Tests the shard scheduling policies
+    """
+
+    def test_round_robin(self):
+        """ Round robin cycles through shards, regardless of load """
+        sched = RoundRobinShardScheduler([0, 2, 1, 3])
+        shards = [sched.dispatch(10) for i in range(8)]
+        self.assertEqual(shards, [0, 2, 1, 3, 0, 2, 1, 3])
+        self.assertEqual(sched.inputs_waiting(), {0: 2, 1: 2, 2: 2, 3: 2})
+
+    def test_least_queued(self):
+        """ Least queued picks the shard with the fewest waiting tiles """
+        sched = LeastQueuedShardScheduler([0, 1, 2])
+        self.assertEqual([sched.dispatch(1) for i in range(3)], [0, 1, 2])
+
+        # Shards 0 and 2 complete, shard 1 is still busy
+        sched.completed(0, 1, 1.0)
+        sched.completed(2, 1, 1.0)
+
+        shards = [sched.dispatch(1) for i in range(2)]
+        self.assertEqual(sorted(shards), [0, 2])
+
+    def test_cost_weighted(self):
+        """ Cost weighted prefers faster shards """
+        sched = CostWeightedShardScheduler([0, 1])
+
+        # No measurements, behaves like least queued
+        self.assertEqual(sched.dispatch(100), 0)
+        self.assertEqual(sched.dispatch(100), 1)
+
+        # Shard 0 is ten times faster than shard 1
+        sched.completed(0, 100, 1.0)
+        sched.completed(1, 100, 10.0)
+
+        # Shard 0 should receive tiles until its
+        # queued work exceeds that of shard 1
+        shards = [sched.dispatch(100) for i in range(5)]
+        self.assertEqual(shards, [0]*5)
+
+        # A queue of 6 tiles on shard 0 (0.01 s/unit) should
+        # still beat a single tile on shard 1 (0.1 s/unit)
+        self.assertEqual(sched.dispatch(100), 0)
+
+    def test_create(self):
+        """ Test scheduler creation by name """
+        sched = create_shard_scheduler('cost_weighted', [0, 1])
+        self.assertIsInstance(sched, CostWeightedShardScheduler)
+
+        with self.assertRaises(ValueError):
+            create_shard_scheduler('random', [0, 1])
+
+if __name__ == '__main__':
+    unittest.main()
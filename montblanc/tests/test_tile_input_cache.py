@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import unittest
+
+import numpy as np
+
+from montblanc.impl.rime.tensorflow.admission_control import (
+    AdmissionController)
+from montblanc.impl.rime.tensorflow.reorder_buffer import ReorderBuffer
+from montblanc.impl.rime.tensorflow.tile_input_cache import TileInputCache
+
+class TestTileInputCache(unittest.TestCase):
+    """
+    Tests the cache of tile inputs
+    """
+
+    def test_accounting(self):
+        """ Entries are accounted and only retained arrays kept """
+        cache = TileInputCache()
+        cache.reset(retain=['antenna1'])
+
+        cache.put(b'a', { 'antenna1': np.zeros(10, np.int32),
+            'observed_vis': np.zeros(100, np.complex128) })
+
+        self.assertEqual(list(cache[b'a'].keys()), ['antenna1'])
+        self.assertEqual(cache.nbytes, 40)
+
+        cache.discard(b'a')
+        self.assertEqual(cache.nbytes, 0)
+        self.assertEqual(cache.peak_nbytes, 40)
+        self.assertNotIn(b'a', cache)
+
+    def test_put_never_blocks(self):
+        """ Puts are admitted regardless of the bytes held """
+        cache = TileInputCache()
+        cache.reset()
+
+        for key in (b'a', b'b', b'c'):
+            cache.put(key, { 'x': np.zeros(200, np.uint8) })
+
+        self.assertEqual(cache.nbytes, 600)
+
+    def test_ordered_split_pipeline(self):
+        """
+        Ordered delivery completes when the host budget is smaller
+        than two tiles and a tile is split after later tiles
+        were fed
+        """
+        admission = AdmissionController(150)
+        cache = TileInputCache()
+        reorder = ReorderBuffer()
+        delivered = []
+
+        cache.reset(retain=['x'])
+
+        def _dispatch(key, nbytes, split=False):
+            self.assertTrue(admission.acquire(key, nbytes, force=split))
+
+            if not split:
+                reorder.register(key)
+
+        def _feed(key, nbytes):
+            cache.put(key, { 'x': np.zeros(nbytes, np.uint8) })
+
+        def _complete(key):
+            def _deliver():
+                delivered.append(key)
+                cache.discard(key)
+                admission.release(key)
+
+            reorder.submit(key, _deliver)
+
+        def _pipeline():
+            _dispatch(b'a', 100)
+            _feed(b'a', 100)
+
+            # a exhausts memory and is split. Its sub-tiles
+            # are fed after b, which is waiting on them
+            reorder.split(b'a', [b'a0', b'a1'])
+            cache.discard(b'a')
+            admission.release(b'a')
+
+            _dispatch(b'b', 100)
+            _feed(b'b', 100)
+            _complete(b'b')
+
+            for key in (b'a0', b'a1'):
+                _dispatch(key, 60, split=True)
+                _feed(key, 60)
+
+            _complete(b'a1')
+            _complete(b'a0')
+
+        pipeline = threading.Thread(target=_pipeline)
+        pipeline.daemon = True
+        pipeline.start()
+        pipeline.join(5)
+
+        self.assertFalse(pipeline.is_alive())
+        self.assertEqual(delivered, [b'a0', b'a1', b'b'])
+        self.assertEqual(cache.nbytes, 0)
+        self.assertEqual(admission.inflight_bytes, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 Simon Perkins
+#
+# This file is part of montblanc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+from hypercube import HyperCube
+
+from montblanc.impl.rime.tensorflow.memory_model import MemoryModel
+from montblanc.impl.rime.tensorflow.tile_planner import (
+    LinearCostModel, TilePlanner, OP_WORK, balanced_batch_sizes)
+
+class TestTilePlanner(unittest.TestCase):
+    """
+    Tests the throughput-optimal tile planner
+    """
+
+    def setUp(self):
+        cube = HyperCube()
+        cube.register_dimension('ntime', 64)
+        cube.register_dimension('na', 8)
+        cube.register_dimension('nbl', 28)
+        cube.register_dimension('nchan', 16)
+        cube.register_dimension('npsrc', 100)
+        cube.register_dimension('ngsrc', 0)
+        cube.register_dimension('nssrc', 0)
+        cube.register_dimension('nsrc', 100)
+
+        cube.register_array('vis', ('ntime', 'nbl', 'nchan', 4),
+            np.complex128)
+        cube.register_array('lm', ('npsrc', 2), np.float64)
+        cube.register_array('shape', ('nsrc', 'ntime', 'nbl', 'nchan'),
+            np.float64)
+
+        self.cube = cube
+        self.memory_model = MemoryModel(feed_once=[],
+            feed_many=['vis'],
+            sources={'npsrc': ['lm']},
+            outputs=['vis'],
+            temporaries=['shape'],
+            nr_of_shards=1, shards_per_device=1, staging_depth=2)
+
+    def test_fit(self):
+        """ Cost models recover overhead and rate """
+        samples = [(w, 1e-3 + 2e-9*w) for w in (1e3, 1e5, 1e7)]
+        model = LinearCostModel.fit(samples)
+        self.assertAlmostEqual(model.overhead, 1e-3)
+        self.assertAlmostEqual(model.rate*1e9, 2.0)
+
+        # Negative overheads are clamped
+        model = LinearCostModel.fit([(1, 0.0), (2, 2.0), (3, 4.0)])
+        self.assertEqual(model.overhead, 0.0)
+        self.assertGreater(model.rate, 0.0)
+
+    def test_plan(self):
+        """ Planner prefers the largest tile fitting the budgets """
+        # Per-tile and per-batch overheads favour large tiles and batches
+        models = { op: LinearCostModel(1e-3, 1e-9) for op in OP_WORK }
+        models['tile'] = LinearCostModel(1.0, 0.0)
+        planner = TilePlanner(models, self.memory_model)
+
+        cfg = { 'mem_budget': 2**40, 'host_mem_budget': 2**40,
+            'source_batch_size': 500 }
+        dims, throughput = planner.plan(self.cube, cfg, ['ntime', 'nbl'])
+
+        self.assertEqual(dims['ntime'], 64)
+        self.assertEqual(dims['nbl'], 28)
+        self.assertEqual(dims['npsrc'], 100)
+        self.assertGreater(throughput, 0.0)
+
+        # Constrain the budget so that the full problem does not fit
+        cube = self.cube.copy()
+        budget = self.memory_model.footprint(cube)[0] // 4
+        cfg.update(mem_budget=budget)
+        dims, _ = planner.plan(cube, cfg, ['ntime', 'nbl'])
+
+        self.assertIsNotNone(dims)
+        self.assertTrue(self.memory_model.fits(cube,
+            budget, cfg['host_mem_budget']))
+        self.assertEqual(cube.dim_extent_size('ntime'), dims['ntime'])
+
+    def test_antenna_sizes(self):
+        """ Antenna work is priced with the global na """
+        cube = HyperCube()
+        cube.register_dimension('ntime', 4)
+        cube.register_dimension('na', 64)
+        cube.register_dimension('nbl', 3)
+        cube.register_dimension('nchan', 16)
+        cube.register_dimension('npsrc', 10)
+        cube.register_dimension('ngsrc', 0)
+        cube.register_dimension('nssrc', 0)
+        cube.register_dimension('nsrc', 10)
+        cube.register_array('vis', ('ntime', 'nbl', 'nchan', 4),
+            np.complex128)
+        cube.register_array('lm', ('npsrc', 2), np.float64)
+
+        models = { op: LinearCostModel(0.0, 0.0) for op in OP_WORK }
+        models['phase'] = LinearCostModel(0.0, 1e-9)
+        planner = TilePlanner(models, self.memory_model)
+
+        cfg = { 'mem_budget': 2**40, 'host_mem_budget': 2**40,
+            'source_batch_size': 500 }
+        dims, throughput = planner.plan(cube, cfg, ['ntime', 'nbl'])
+
+        # 10 sources x 4 timesteps x 64 antenna x 16 channels of phase
+        seconds = 1e-9*10*dims['ntime']*64*16
+        self.assertAlmostEqual(throughput,
+            dims['ntime']*dims['nbl']*16 / seconds)
+
+    def test_balanced_batch_sizes(self):
+        """ Expensive source types receive smaller batches """
+        models = { op: LinearCostModel(0.0, 0.0) for op in OP_WORK }
+        models['sum_coherencies'] = LinearCostModel(1e-3, 1e-9)
+        models['sersic_shape'] = LinearCostModel(0.0, 3e-9)
+        sizes = { 'ntime': 10, 'nbl': 10, 'na': 5, 'nchan': 10 }
+
+        # Point batch: 1e-3 + 100*1e-6 s, sersic source: 4e-6 s
+        batch_sizes = balanced_batch_sizes(models, sizes,
+            { 'npsrc': 1000, 'ngsrc': 0, 'nssrc': 1000 }, 100)
+        self.assertEqual(batch_sizes, { 'npsrc': 100, 'ngsrc': 0,
+            'nssrc': 25 })
+
+        # Batches don't exceed the number of sources
+        batch_sizes = balanced_batch_sizes(models, sizes,
+            { 'npsrc': 10, 'ngsrc': 0, 'nssrc': 10 }, 100)
+        self.assertEqual(batch_sizes, { 'npsrc': 10, 'ngsrc': 0,
+            'nssrc': 10 })
+
+    def test_memory_limited_batch_sizes(self):
+        """ Memory limits batches of cheap source types """
+        models = { op: LinearCostModel(0.0, 0.0) for op in OP_WORK }
+        models['sum_coherencies'] = LinearCostModel(1e-3, 1e-9)
+        sizes = { 'ntime': 10, 'nbl': 10, 'na': 5, 'nchan': 10 }
+        nsrcs = { 'npsrc': 1000, 'ngsrc': 0, 'nssrc': 1000 }
+
+        # Costs alone give both types the same batch
+        batch_sizes = balanced_batch_sizes(models, sizes, nsrcs, 100)
+        self.assertEqual(batch_sizes, { 'npsrc': 100, 'ngsrc': 0,
+            'nssrc': 100 })
+
+        # Sersic sources are cheap, but memory only fits 10
+        batch_sizes = balanced_batch_sizes(models, sizes, nsrcs, 100,
+            { 'npsrc': 500, 'nssrc': 10 })
+        self.assertEqual(batch_sizes, { 'npsrc': 100, 'ngsrc': 0,
+            'nssrc': 10 })
+
+    def test_no_fit(self):
+        """ Planner reports when no tile shape fits """
+        models = { op: LinearCostModel(0.0, 1e-9) for op in OP_WORK }
+        planner = TilePlanner(models, self.memory_model)
+
+        cfg = { 'mem_budget': 1, 'host_mem_budget': 1,
+            'source_batch_size': 500 }
+        self.assertEqual(planner.plan(self.cube, cfg, ['ntime', 'nbl']),
+            (None, None))
+
+if __name__ == '__main__':
+    unittest.main()